@@ -0,0 +1,367 @@
+import logging
+import socket
+import threading
+from functools import partial
+
+from consul import std
+from consul.base import ConsulException
+from requests import adapters
+from requests.exceptions import RequestException, Timeout
+from requests.packages.urllib3 import connection, connectionpool, exceptions
+
+from announcer.exceptions import AnnouncerAgentUnavailable, AnnouncerImproperlyConfigured
+
+logger = logging.getLogger(__name__)
+
+
+# urllib3 defaults (TCP_NODELAY) + TCP keep-alive probes for idle pooled connections
+DEFAULT_SOCKET_OPTIONS = connection.HTTPConnection.default_socket_options + [
+    (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+]
+
+
+class ConnectionStats(object):
+    """
+    Thread-safe counters of new connections and completed requests.
+    """
+    lock = None
+    new = 0
+    requests = 0
+
+    def __init__(self):
+        self.lock = threading.Lock()
+
+    def count(self, counter):
+        """
+        Increment a counter.
+
+        :param str counter: "new" or "requests".
+        """
+        with self.lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def as_dict(self):
+        """
+        :return: ``{'new': ..., 'reused': ...}``
+        :rtype: dict
+        """
+        with self.lock:
+            return {'new': self.new, 'reused': max(self.requests - self.new, 0)}
+
+
+class CountingConnectionMixin(object):
+    """
+    urllib3 connection that counts (re)connects in ``stats``.
+    """
+    stats = None
+
+    def connect(self):
+        super(CountingConnectionMixin, self).connect()
+        self.stats.count('new')
+
+
+class HTTPConnection(CountingConnectionMixin, connection.HTTPConnection):
+    pass
+
+
+class HTTPSConnection(CountingConnectionMixin, connection.HTTPSConnection):
+    pass
+
+
+class UnixHTTPConnection(HTTPConnection):
+    """
+    urllib3 HTTP connection over a unix domain socket (``unix_socket`` path).
+    """
+    unix_socket = None
+
+    def _new_conn(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if isinstance(self.timeout, (int, float)):
+            sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.unix_socket)
+        except (OSError, socket.error) as e:
+            sock.close()
+            raise exceptions.NewConnectionError(
+                self, "Failed to connect to \"{}\": {}".format(self.unix_socket, e)
+            )
+        return sock
+
+
+class CountingPoolMixin(object):
+    """
+    urllib3 connection pool that passes ``stats`` to its connections.
+    """
+    stats = None
+
+    def __init__(self, *args, **kwargs):
+        self.stats = kwargs.pop('stats')
+        super(CountingPoolMixin, self).__init__(*args, **kwargs)
+
+    def _new_conn(self):
+        conn = super(CountingPoolMixin, self)._new_conn()
+        conn.stats = self.stats
+        return conn
+
+
+class HTTPConnectionPool(CountingPoolMixin, connectionpool.HTTPConnectionPool):
+    ConnectionCls = HTTPConnection
+
+
+class HTTPSConnectionPool(CountingPoolMixin, connectionpool.HTTPSConnectionPool):
+    ConnectionCls = HTTPSConnection
+
+
+class UnixHTTPConnectionPool(HTTPConnectionPool):
+    """
+    urllib3 connection pool that connects to ``unix_socket`` path instead of host & port.
+    """
+    ConnectionCls = UnixHTTPConnection
+    unix_socket = None
+
+    def __init__(self, *args, **kwargs):
+        self.unix_socket = kwargs.pop('unix_socket')
+        super(UnixHTTPConnectionPool, self).__init__(*args, **kwargs)
+
+    def _new_conn(self):
+        conn = super(UnixHTTPConnectionPool, self)._new_conn()
+        conn.unix_socket = self.unix_socket
+        return conn
+
+
+class HTTPAdapter(adapters.HTTPAdapter):
+    """
+    ``requests`` transport adapter that sets custom options on every new socket
+    and counts new connections.
+    """
+    socket_options = None
+    stats = None
+    unix_socket = None
+
+    def __init__(self, socket_options, stats, unix_socket=None, **kwargs):
+        """
+        Initialize transport adapter.
+
+        :param list socket_options: Socket options as ``(level, option, value)``.
+        :param ConnectionStats stats: Connection counters.
+        :param unix_socket: Unix domain socket path. If set - HTTP requests are sent through it.
+        :type unix_socket: str or None
+        :param kwargs: Other ``requests.adapters.HTTPAdapter`` arguments.
+        """
+        self.socket_options = socket_options
+        self.stats = stats
+        self.unix_socket = unix_socket
+        super(HTTPAdapter, self).__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs['socket_options'] = self.socket_options
+        super(HTTPAdapter, self).init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': partial(HTTPConnectionPool, stats=self.stats),
+            'https': partial(HTTPSConnectionPool, stats=self.stats)
+        }
+        if self.unix_socket:
+            self.poolmanager.pool_classes_by_scheme['http'] = partial(
+                UnixHTTPConnectionPool, stats=self.stats, unix_socket=self.unix_socket
+            )
+
+
+class HTTPClient(std.HTTPClient):
+    """
+    python-consul HTTP client with a timeout for every request to Consul agent
+    and a configurable pool of persistent (keep-alive) connections.
+    """
+    adapter = None
+    stats = None
+    timeout = None
+
+    def __init__(self, host='127.0.0.1', port=8500, scheme='http', verify=True, timeout=None,
+                 pool_size=10, keep_alive=True, socket_options=None, unix_socket=None):
+        """
+        Initialize HTTP client.
+
+        :param str host: Agent hostname.
+        :param int port: Agent HTTP port.
+        :param str scheme: "http" or "https".
+        :param bool verify: Verify SSL certificate for HTTPS requests.
+        :param timeout: Request timeout in seconds. If None - wait forever.
+        :type timeout: float or None
+        :param int pool_size: Max number of connections kept in the pool.
+        :param bool keep_alive: Reuse connections. If False - every request uses a new one.
+        :param socket_options: Options to set on every new socket, as ``(level, option, value)``.
+                               If None - ``DEFAULT_SOCKET_OPTIONS`` are used.
+        :type socket_options: list or None
+        :param unix_socket: Agent unix domain socket path. If set - ``host`` & ``port`` are
+                            only used in request URLs.
+        :type unix_socket: str or None
+        """
+        super(HTTPClient, self).__init__(host, port, scheme, verify)
+        self.timeout = timeout
+        self.stats = ConnectionStats()
+        self.adapter = HTTPAdapter(
+            DEFAULT_SOCKET_OPTIONS if socket_options is None else socket_options,
+            self.stats,
+            unix_socket,
+            pool_connections=1,
+            pool_maxsize=pool_size
+        )
+        self.session.mount(self.base_uri, self.adapter)
+        if not keep_alive:
+            self.session.headers['Connection'] = 'close'
+
+    def connection_stats(self):
+        """
+        Count new & reused connections to Consul agent.
+
+        :return: ``{'new': ..., 'reused': ...}``
+        :rtype: dict
+        """
+        return self.stats.as_dict()
+
+    def request(self, method, callback, path, params=None, data=None):
+        """
+        Make a request to Consul agent and process the response with ``callback``.
+
+        :param str method: HTTP method.
+        :param callback: python-consul response callback (see ``consul.base.CB``).
+        :param str path: API endpoint path.
+        :param params: Query parameters.
+        :type params: dict or None
+        :param data: Request body.
+        :type data: str or None
+        """
+        response = self.session.request(
+            method,
+            self.uri(path, params),
+            data=data,
+            verify=self.verify,
+            timeout=self.timeout
+        )
+        self.stats.count('requests')
+        return callback(self.response(response))
+
+    def get(self, callback, path, params=None):
+        return self.request('GET', callback, path, params)
+
+    def put(self, callback, path, params=None, data=''):
+        return self.request('PUT', callback, path, params, data)
+
+    def delete(self, callback, path, params=None):
+        return self.request('DELETE', callback, path, params)
+
+    def post(self, callback, path, params=None, data=''):
+        return self.request('POST', callback, path, params, data)
+
+
+class Consul(std.Consul):
+    """
+    python-consul client that uses ``announcer.agent.HTTPClient``.
+    """
+    http_options = None
+
+    def __init__(self, host='127.0.0.1', port=8500, token=None, http_options=None, **kwargs):
+        """
+        Initialize Consul client.
+
+        :param str host: Agent hostname.
+        :param int port: Agent HTTP port.
+        :param token: Consul ACL token.
+        :type token: str or None
+        :param http_options: ``announcer.agent.HTTPClient`` options: timeout, pool size, etc.
+        :type http_options: dict or None
+        :param kwargs: Other ``consul.Consul`` arguments.
+        """
+        self.http_options = http_options or {}
+        super(Consul, self).__init__(host, port, token, **kwargs)
+
+    def connect(self, host, port, scheme, verify=True):
+        return HTTPClient(host, port, scheme, verify, **self.http_options)
+
+
+def parse_agent_address(agent_address):
+    """
+    Parse Consul agent address.
+
+    :param str agent_address: "hostname:port" (port is optional) or "unix:/path/to/socket"
+                              (also "unix:///path/to/socket").
+    :return: Agent hostname, port & unix domain socket path (or None).
+    :rtype: tuple
+    :raises: AnnouncerImproperlyConfigured
+    """
+    if agent_address.startswith('unix:'):
+        path = agent_address[len('unix:'):]
+        if path.startswith('//'):
+            path = path[2:]
+        if not path:
+            raise AnnouncerImproperlyConfigured(
+                "Unix socket path is not specified in \"{}\" agent address".format(agent_address)
+            )
+        return 'localhost', 8500, path
+
+    host, _, port = agent_address.partition(':')
+    return host, port or 8500, None
+
+
+def map_requests(executor, func, items):
+    """
+    Call ``func`` for every item concurrently (using ``executor``).
+
+    Consul agent request timeouts & errors (agent is unreachable or has responded with an error)
+    are logged and the result is ``False`` for such items. Other exceptions are re-raised.
+
+    :param concurrent.futures.Executor executor:
+    :param func: Function that makes a request to Consul agent.
+    :param list items: ``func`` arguments.
+    :return: Results in the same order as ``items``.
+    :rtype: list
+    """
+    if len(items) > 1:
+        calls = [executor.submit(func, item).result for item in items]
+    else:
+        calls = [partial(func, item) for item in items]
+    return collect_results(items, calls)
+
+
+def map_ttl_checks(executor, probe_executor, func, check_ids, probe_ids):
+    """
+    Call ``func`` for every TTL check concurrently (see ``map_requests``). Checks executed
+    by probes are called in ``probe_executor``: slow probes don't hold the workers
+    of the other heartbeats.
+
+    :param concurrent.futures.Executor executor:
+    :param probe_executor: Executor for probes (only used if there are any).
+    :type probe_executor: concurrent.futures.Executor or None
+    :param func: Function that marks a TTL check.
+    :param list check_ids:
+    :param probe_ids: IDs of TTL checks executed by probes.
+    :return: Results in the same order as ``check_ids``.
+    :rtype: list
+    """
+    probes = [check_id for check_id in check_ids if check_id in probe_ids]
+    if not probes:
+        return map_requests(executor, func, check_ids)
+    calls = [probe_executor.submit(func, check_id).result for check_id in probes]
+    others = [check_id for check_id in check_ids if check_id not in probe_ids]
+    results = dict(zip(others, map_requests(executor, func, others)))
+    results.update(zip(probes, collect_results(probes, calls)))
+    return [results[check_id] for check_id in check_ids]
+
+
+def collect_results(items, calls):
+    """
+    :param list items: Request arguments (for logging).
+    :param list calls: Functions (without arguments) that return the request results.
+    :return: Results in the same order as ``items`` (False for failed requests).
+    :rtype: list
+    """
+    results = []
+    for item, call in zip(items, calls):
+        try:
+            results.append(call())
+        except Timeout:
+            logger.warning("Consul agent request for \"{}\" timed out".format(item))
+            results.append(False)
+        except (RequestException, ConsulException, AnnouncerAgentUnavailable) as e:
+            logger.warning("Consul agent request for \"{}\" failed: {}".format(item, e))
+            results.append(False)
+    return results
@@ -0,0 +1,836 @@
+"""
+asyncio-based engine (Python 3.5+).
+
+The whole lifecycle (heartbeats, process monitoring, signals forwarding and requests to
+Consul agent) runs in a single event loop, without threads.
+"""
+import asyncio
+import logging
+import signal
+from functools import partial
+
+from consul import base
+from consul.base import CB, ConsulException
+from requests.structures import CaseInsensitiveDict
+from six.moves import urllib
+
+from announcer.agent import DEFAULT_SOCKET_OPTIONS, parse_agent_address
+from announcer.exceptions import AnnouncerAgentUnavailable
+from announcer.service import Service
+from announcer.utils import monotonic
+from announcer.watch import AgentWatch
+
+logger = logging.getLogger(__name__)
+
+
+class HTTPClient(object):
+    """
+    Minimal asyncio HTTP/1.1 client for Consul agent with a pool of keep-alive connections.
+    """
+    host = None
+    port = None
+    timeout = None
+    pool_size = None
+    keep_alive = None
+    socket_options = None
+    unix_socket = None
+    idle = None
+    limit = None
+    semaphore = None
+    stats = None
+
+    def __init__(self, host='127.0.0.1', port=8500, scheme='http', verify=True, timeout=None,
+                 pool_size=10, keep_alive=True, socket_options=None, unix_socket=None, limit=10):
+        """
+        Initialize HTTP client.
+
+        :param str host: Agent hostname.
+        :param int port: Agent HTTP port.
+        :param str scheme: Only "http" is supported.
+        :param bool verify: Ignored (no HTTPS support).
+        :param timeout: Request timeout in seconds. If None - wait forever.
+        :type timeout: float or None
+        :param int pool_size: Max number of idle connections kept in the pool.
+        :param bool keep_alive: Reuse connections. If False - every request uses a new one.
+        :param socket_options: Options to set on every new socket, as ``(level, option, value)``.
+                               If None - ``announcer.agent.DEFAULT_SOCKET_OPTIONS`` are used.
+        :type socket_options: list or None
+        :param unix_socket: Agent unix domain socket path. If set - ``host`` & ``port`` are
+                            only used in ``Host`` header.
+        :type unix_socket: str or None
+        :param int limit: Max number of concurrent requests.
+        """
+        if scheme != 'http':
+            raise ValueError("Only \"http\" scheme is supported by asyncio engine")
+        self.host = host
+        self.port = int(port)
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self.keep_alive = keep_alive
+        self.socket_options = DEFAULT_SOCKET_OPTIONS if socket_options is None else socket_options
+        self.unix_socket = unix_socket
+        self.idle = []
+        self.limit = limit
+        self.stats = {'new': 0, 'reused': 0}
+
+    def connection_stats(self):
+        """
+        Count new & reused connections to Consul agent.
+
+        :return: ``{'new': ..., 'reused': ...}``
+        :rtype: dict
+        """
+        return dict(self.stats)
+
+    def uri(self, path, params=None):
+        # Skip ``None`` values like ``requests`` does
+        params = dict((key, value) for key, value in (params or {}).items() if value is not None)
+        if not params:
+            return path
+        return '{}?{}'.format(path, urllib.parse.urlencode(params))
+
+    async def request(self, method, callback, path, params=None, data=None):
+        """
+        Make a request to Consul agent and process the response with ``callback``.
+
+        :param str method: HTTP method.
+        :param callback: python-consul response callback (see ``consul.base.CB``).
+        :param str path: API endpoint path.
+        :param params: Query parameters.
+        :type params: dict or None
+        :param data: Request body.
+        :type data: str or None
+        :raises: asyncio.TimeoutError
+        """
+        if self.semaphore is None:
+            # Created lazily to be bound to the running event loop
+            self.semaphore = asyncio.Semaphore(self.limit)
+        async with self.semaphore:
+            response = await asyncio.wait_for(
+                self.send(method, self.uri(path, params), data), self.timeout
+            )
+        return callback(response)
+
+    async def send(self, method, uri, data):
+        """
+        Send a request using an idle connection (or a new one) and read the response.
+
+        If an idle connection was closed by the agent - the request is repeated
+        with a new connection.
+
+        :return: Consul agent response.
+        :rtype: consul.base.Response
+        """
+        body = (data or '').encode('utf-8')
+        head = (
+            '{} {} HTTP/1.1\r\n'
+            'Host: {}:{}\r\n'
+            'Content-Length: {}\r\n'
+            '{}'
+            '\r\n'
+        ).format(
+            method, uri, self.host, self.port, len(body),
+            '' if self.keep_alive else 'Connection: close\r\n'
+        ).encode('latin-1')
+
+        while True:
+            reused = bool(self.idle)
+            if reused:
+                reader, writer = self.idle.pop()
+                self.stats['reused'] += 1
+            else:
+                reader, writer = await self.open_connection()
+            try:
+                writer.write(head + body)
+                response, keep_alive = await self.read_response(reader)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                writer.close()
+                if reused:
+                    continue
+                raise
+            except BaseException:
+                writer.close()
+                raise
+            if keep_alive and self.keep_alive and len(self.idle) < self.pool_size:
+                self.idle.append((reader, writer))
+            else:
+                writer.close()
+            return response
+
+    async def open_connection(self):
+        """
+        Open a new connection to Consul agent and set ``self.socket_options``
+        (TCP connections only).
+
+        :return: Stream reader & writer.
+        :rtype: tuple
+        """
+        if self.unix_socket:
+            reader, writer = await asyncio.open_unix_connection(self.unix_socket)
+        else:
+            reader, writer = await asyncio.open_connection(self.host, self.port)
+            sock = writer.get_extra_info('socket')
+            for option in self.socket_options:
+                sock.setsockopt(*option)
+        self.stats['new'] += 1
+        return reader, writer
+
+    async def read_response(self, reader):
+        """
+        Read HTTP response.
+
+        :param asyncio.StreamReader reader:
+        :return: Consul agent response and whether the connection can be reused.
+        :rtype: tuple
+        """
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionResetError("Connection closed by Consul agent")
+        code = int(status_line.split()[1])
+
+        headers = CaseInsensitiveDict()
+        while True:
+            line = await reader.readline()
+            if not line.strip():
+                break
+            name, value = line.decode('latin-1').split(':', 1)
+            headers[name.strip()] = value.strip()
+
+        keep_alive = headers.get('Connection', '').lower() != 'close'
+        if 'chunked' in headers.get('Transfer-Encoding', '').lower():
+            chunks = []
+            while True:
+                size = int((await reader.readline()).split(b';')[0], 16)
+                chunk = await reader.readexactly(size + 2)
+                if not size:
+                    break
+                chunks.append(chunk[:-2])
+            content = b''.join(chunks)
+        elif 'Content-Length' in headers:
+            content = await reader.readexactly(int(headers['Content-Length']))
+        else:
+            content = await reader.read()
+            keep_alive = False
+
+        return base.Response(code, headers, content.decode('utf-8')), keep_alive
+
+    def get(self, callback, path, params=None):
+        return self.request('GET', callback, path, params)
+
+    def put(self, callback, path, params=None, data=''):
+        return self.request('PUT', callback, path, params, data)
+
+    def delete(self, callback, path, params=None):
+        return self.request('DELETE', callback, path, params)
+
+    def post(self, callback, path, params=None, data=''):
+        return self.request('POST', callback, path, params, data)
+
+    def close(self):
+        """
+        Close all idle connections.
+        """
+        while self.idle:
+            reader, writer = self.idle.pop()
+            writer.close()
+
+
+class Consul(base.Consul):
+    """
+    python-consul client that uses ``announcer.aio.HTTPClient``: all the API methods
+    return coroutines.
+    """
+    http_options = None
+
+    def __init__(self, host='127.0.0.1', port=8500, token=None, http_options=None, **kwargs):
+        """
+        Initialize Consul client.
+
+        :param str host: Agent hostname.
+        :param int port: Agent HTTP port.
+        :param token: Consul ACL token.
+        :type token: str or None
+        :param http_options: ``announcer.aio.HTTPClient`` options: timeout, pool size, etc.
+        :type http_options: dict or None
+        :param kwargs: Other ``consul.Consul`` arguments.
+        """
+        self.http_options = http_options or {}
+        super(Consul, self).__init__(host, port, token, **kwargs)
+
+    def connect(self, host, port, scheme, verify=True):
+        return HTTPClient(host, port, scheme, verify, **self.http_options)
+
+
+class AsyncService(Service):
+    """
+    consul-announcer service that runs in asyncio event loop.
+
+    Config parsing & heartbeats scheduling are the same as in ``announcer.service.Service``.
+    """
+    connection_errors = (OSError, asyncio.TimeoutError)
+    agent_errors = (OSError, asyncio.TimeoutError, ConsulException, AnnouncerAgentUnavailable)
+
+    loop = None
+    heartbeats = None
+    watch_task = None
+
+    def run(self):
+        """
+        Run the service in a new event loop (see ``announcer.service.Service.run``).
+        """
+        self.loop = asyncio.new_event_loop()
+        # The child watcher (used by subprocesses) is attached to the current event loop
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.loop.run_until_complete(self.run_async())
+        finally:
+            asyncio.set_event_loop(None)
+            self.loop.close()
+
+    async def run_async(self):
+        """
+        Run the service:
+
+        - register services & checks in Consul
+        - invoke a subprocess
+        - poll it (keep it alive in Consul), restart it according to ``self.restart_policy``
+        - deregister services after subprocess is finished
+        """
+        self.metrics_exporter.start()
+        self.heartbeats = set()
+        # See ``announcer.service.Service.lock``: heartbeats & the watch run in concurrent tasks
+        self.lock = asyncio.Lock()
+        try:
+            await self.register_services()
+            if self.readiness is not None:
+                await self.suspend_until_ready()
+            if self.watch is not None:
+                self.watch_task = self.loop.create_task(self.watch_agent())
+            if self.health is not None:
+                self.health.bind()
+                self.loop.add_reader(self.health.sock.fileno(), self.read_health)
+            await self.invoke_process()
+            await self.poll()
+            while await self.restart_process():
+                await self.poll()
+        finally:
+            if self.watch_task is not None:
+                self.watch_task.cancel()
+            if self.health is not None and self.health.sock is not None:
+                self.loop.remove_reader(self.health.sock.fileno())
+                self.health.stop()
+            await self.deregister_services()
+            self.disconnect()
+            self.metrics_exporter.stop()
+
+    def connect(self, agent_address, token, workers, http_options, watch=False):
+        """
+        Create asyncio Consul agent client.
+
+        :param str agent_address: Agent address in a form: "hostname:port" (port is optional)
+                                  or "unix:/path/to/socket".
+        :param token: Consul ACL token.
+        :type token: str or None
+        :param int workers: Max number of concurrent requests to Consul agent.
+        :param dict http_options: HTTP client options: timeout, pool size, etc.
+        :param bool watch: Create ``self.watch`` with its own client (for blocking queries).
+        """
+        host, port, unix_socket = parse_agent_address(agent_address)
+        http_options = dict(http_options, limit=workers, unix_socket=unix_socket)
+        self.consul = Consul(host, port, token=token, http_options=http_options)
+        if watch:
+            self.watch = AgentWatch(Consul(host, port, token=token, http_options=dict(
+                http_options, timeout=AgentWatch.timeout, pool_size=1, limit=1
+            )))
+
+    def disconnect(self):
+        """
+        Close Consul agent connections.
+        """
+        self.log_connection_stats()
+        self.consul.http.close()
+        if self.watch is not None:
+            self.watch.consul.http.close()
+        if self.probe_session is not None:
+            self.probe_session.close()
+            self.probe_executor.shutdown(wait=False)
+        if self.readiness is not None:
+            self.readiness.close()
+
+    async def map(self, func, items):
+        """
+        Call coroutine function ``func`` for every item concurrently.
+
+        Consul agent request timeouts & errors are logged and the result is ``False``
+        for such items. Other exceptions are re-raised.
+
+        :param func: Coroutine function that makes a request to Consul agent.
+        :param list items: ``func`` arguments.
+        :return: Results in the same order as ``items``.
+        :rtype: list
+        """
+        results = await asyncio.gather(*[func(item) for item in items], return_exceptions=True)
+        for i, (item, result) in enumerate(zip(items, results)):
+            if isinstance(result, asyncio.TimeoutError):
+                logger.warning("Consul agent request for \"{}\" timed out".format(item))
+                results[i] = False
+            elif isinstance(result, self.agent_errors):
+                logger.warning("Consul agent request for \"{}\" failed: {}".format(item, result))
+                results[i] = False
+            elif isinstance(result, BaseException):
+                raise result
+        return results
+
+    async def register_services(self):
+        """
+        Register services in Consul agent (concurrently).
+        """
+        logger.info("Registering Consul services")
+        if self.fingerprints is None:
+            await self.map(self.register_service, list(self.services))
+        else:
+            agent_services = await self.get_agent_services()
+            await self.remove_orphans(agent_services)
+            service_ids = self.outdated_services(agent_services or {})
+            self.fingerprints.journal(service_ids)
+            self.remember_services(service_ids, await self.map(self.register_service, service_ids))
+            await self.release_maintenance(self.get_skipped_services(agent_services, service_ids))
+
+    async def remove_orphans(self, agent_services):
+        """
+        Deregister services left by the previous run of the announcer
+        (see ``announcer.service.Service.remove_orphans``).
+        """
+        if agent_services is None:
+            return
+        registered, missing = self.find_orphans(agent_services)
+        if registered:
+            logger.warning("Deregistering services left by the previous run: {}".format(
+                ', '.join(registered)
+            ))
+            results = await self.map(self.deregister_service, registered)
+            missing += [service_id for service_id, success in zip(registered, results) if success]
+        if missing:
+            self.forget_services(missing)
+
+    async def get_agent_services(self):
+        """
+        Get services registered in Consul agent
+        (see ``announcer.service.Service.get_agent_services``).
+        """
+        try:
+            return await self.call_resilient(partial(
+                self.consul.http.get,
+                CB.json(), '/v1/agent/services', params={'token': self.consul.token}
+            ))
+        except self.agent_errors as e:
+            logger.warning("Can't get services registered in Consul agent: {}".format(e))
+
+    async def get_agent_checks(self):
+        """
+        Get checks registered in Consul agent
+        (see ``announcer.service.Service.get_agent_checks``).
+        """
+        try:
+            return await self.call_resilient(partial(
+                self.consul.http.get,
+                CB.json(), '/v1/agent/checks', params={'token': self.consul.token}
+            ))
+        except self.agent_errors as e:
+            logger.warning("Can't get checks registered in Consul agent: {}".format(e))
+
+    async def release_maintenance(self, service_ids):
+        """
+        Take services skipped as up to date out of maintenance mode left by the previous run
+        (see ``announcer.service.Service.release_maintenance``).
+        """
+        if not service_ids:
+            return
+        agent_checks = await self.get_agent_checks() or {}
+        await self.map(
+            partial(self.maintain_service, enable=False),
+            self.find_maintained(service_ids, agent_checks)
+        )
+
+    async def replay_registrations(self):
+        """
+        Register services that are missing in Consul agent again, restore their maintenance
+        mode (see ``announcer.service.Service.replay_registrations``).
+        """
+        async with self.lock:
+            agent_services = await self.get_agent_services()
+            if agent_services is None:
+                return False
+            service_ids = self.get_missing_services(agent_services)
+            if not service_ids:
+                return False
+            results = await self.map(self.register_service, service_ids)
+            if self.fingerprints is not None:
+                self.remember_services(service_ids, results)
+            registered, maintained = self.split_maintained(service_ids, results)
+            await self.map(self.restore_maintenance, maintained)
+            return bool(registered)
+
+    async def retry_registrations(self):
+        """
+        Register services that failed to register again
+        (see ``announcer.service.Service.retry_registrations``).
+        """
+        async with self.lock:
+            service_ids = self.get_failed_registrations()
+            if not service_ids:
+                return
+            results = await self.map(self.register_service, service_ids)
+            if self.fingerprints is not None:
+                self.remember_services(service_ids, results)
+            registered, maintained = self.split_maintained(service_ids, results)
+            await self.map(self.restore_maintenance, maintained)
+        if registered:
+            # TTL checks are due right away, don't wait for the poll loop to wake up
+            self.schedule_now()
+            await self.pass_ttl_checks(self.scheduler.pop_due())
+
+    async def watch_agent(self):
+        """
+        Watch Consul agent state with blocking queries and register lost services again
+        (see ``announcer.watch.AgentWatch``) until cancelled.
+        """
+        watch = self.watch
+        failed = False
+        while True:
+            try:
+                if watch.node is None:
+                    watch.node = (await watch.consul.agent.self())['Config']['NodeName']
+                index, _ = await watch.consul.catalog.node(
+                    watch.node, index=watch.index, wait='{}s'.format(watch.wait)
+                )
+            except self.agent_errors + (KeyError, ValueError) as e:
+                if not failed:
+                    logger.warning("Can't watch Consul agent state: {}".format(e))
+                failed = True
+                watch.reset()
+                await asyncio.sleep(watch.retry_delay)
+                continue
+            watch.update(index)
+            if failed:
+                logger.info("Consul agent is reachable again, checking its state")
+                failed = False
+            await self.restore_services()
+
+    async def restore_services(self):
+        """
+        Register services that are missing in Consul agent again and mark their TTL checks
+        right away (see ``announcer.service.Service.restore_services``).
+        """
+        if await self.replay_registrations():
+            check_ids = list(self.ttl_checks)
+            self.log_ttl_checks(check_ids, await self.map(self.pass_ttl_check, check_ids))
+
+    async def register_service(self, service_id):
+        """
+        Register service in Consul agent.
+
+        :param str service_id:
+        :return: True if the service was registered.
+        :rtype: bool
+        """
+        logger.debug("Registering service \"{}\": {}".format(
+            service_id, self.services[service_id]
+        ))
+        start = monotonic()
+        success = False
+        try:
+            success = await self.call_agent('register', self.get_register_request(service_id))
+        finally:
+            # Request errors are logged by ``self.map``
+            self.track_registration(service_id, success)
+        self.log_request_result(service_id, 'registered', success, start)
+        return success
+
+    async def invoke_process(self):
+        """
+        Invoke the sub-process to monitor.
+        """
+        logger.info("Starting process: {}".format(' '.join(self.cmd)))
+        self.process = await asyncio.create_subprocess_exec(*self.cmd, env=self.get_process_env())
+        self.started = monotonic()
+        self.metrics.process_started(self.process.pid)
+        self.handle_signals()
+
+    async def restart_process(self):
+        """
+        Restart the exited process (with a delay) according to ``self.restart_policy``
+        (see ``announcer.service.Service.restart_process``).
+        """
+        delay = self.get_restart_delay()
+        if delay is None:
+            return False
+        await self.suspend_services(delay)
+        deadline = monotonic() + delay
+        while monotonic() < deadline:
+            # Sleep in short steps, so a termination signal is noticed
+            await asyncio.sleep(min(deadline - monotonic(), 0.1))
+            if self.stopping:
+                return False
+        await self.invoke_process()
+        await self.resume_services()
+        return True
+
+    def handle_signals(self):
+        """
+        Transparently pass all the incoming signals to the invoked process.
+        """
+        for i in dir(signal):
+            if i.startswith("SIG") and '_' not in i:
+                signum = getattr(signal, i)
+                if signum == signal.SIGCHLD:
+                    # Forwarding SIGCHLD (or its alias SIGCLD) polls the sub-process,
+                    # which races with the event loop child watcher
+                    continue
+                try:
+                    self.loop.add_signal_handler(signum, self.handle_signal, signum)
+                except (RuntimeError, OSError, ValueError):
+                    # Some signals cannot be catched and will raise errors
+                    pass
+
+    def request_reload(self):
+        """
+        Reload config in a background task (signal handlers are called by the event loop).
+        """
+        self.spawn(self.reload())
+
+    def request_drain(self, signal_number):
+        """
+        Drain services in a background task (see ``announcer.service.Service.request_drain``).
+        """
+        super(AsyncService, self).request_drain(signal_number)
+        self.spawn(self.drain_process())
+
+    async def drain_process(self):
+        """
+        Put services in maintenance mode and pass the termination signal to the invoked process
+        after ``self.drain`` seconds.
+        """
+        await self.drain_services()
+        await asyncio.sleep(max(self.drain_deadline - monotonic(), 0))
+        self.pass_drained_signal()
+
+    async def reload(self):
+        """
+        Reload services config without restarting the invoked process
+        (see ``announcer.service.Service.reload``).
+        """
+        changes = self.reload_config()
+        if changes is None:
+            return
+        changed, removed = changes
+        async with self.lock:
+            if removed:
+                await self.map(self.deregister_service, removed)
+                self.forget_services(removed)
+            if changed:
+                if self.fingerprints is not None:
+                    self.fingerprints.journal(changed)
+                results = await self.map(self.register_service, changed)
+                if self.fingerprints is not None:
+                    self.remember_services(changed, results)
+        if changed:
+            # TTL checks are due right away, don't wait for the poll loop to wake up
+            await self.pass_ttl_checks(self.scheduler.pop_due())
+
+    async def poll(self):
+        """
+        Mark due TTL checks as passed until the invoked process is finished.
+
+        Heartbeats are sent in background tasks, so a slow agent doesn't delay
+        the process termination detection.
+        """
+        logger.info("Start polling the process with PID {}".format(self.process.pid))
+        if not self.ttl_checks:
+            logger.debug("No TTL checks registered")
+
+        if self.readiness is not None and not self.readiness.ready:
+            self.spawn(self.wait_readiness())
+        exited = self.loop.create_task(self.process.wait())
+        while True:
+            timeout = None
+            deadline = self.scheduler.next_deadline()
+            if deadline is not None:
+                timeout = max(deadline - self.scheduler.clock(), 0)
+            if self.unregistered:
+                # Failed registrations are retried from the poll loop
+                retry_timeout = max(self.registration_deadline - monotonic(), 0)
+                timeout = retry_timeout if timeout is None else min(timeout, retry_timeout)
+            done, pending = await asyncio.wait([exited], timeout=timeout)
+            if done:
+                break
+            if self.unregistered:
+                self.spawn(self.retry_registrations())
+            due = self.scheduler.pop_due()
+            if due:
+                self.spawn(self.pass_ttl_checks(due))
+
+        logger.info("Process with PID {} exited with code {}".format(
+            self.process.pid, self.process.returncode
+        ))
+        self.metrics.process_exited(self.process.pid)
+        for heartbeat in self.heartbeats:
+            heartbeat.cancel()
+
+    async def wait_readiness(self):
+        """
+        Probe the invoked process until it's ready and take services out of maintenance mode
+        (see ``announcer.service.Service.check_readiness``).
+
+        Probes are executed in the default executor, so they don't block the event loop.
+        """
+        while not self.draining:
+            if await self.loop.run_in_executor(None, self.readiness.check):
+                logger.info("The process is ready in {:.3f} sec".format(
+                    monotonic() - self.started
+                ))
+                await self.activate_services()
+                # TTL checks are due right away, don't wait for the poll loop to wake up
+                await self.pass_ttl_checks(self.scheduler.pop_due())
+                return
+            await asyncio.sleep(self.readiness.interval)
+
+    def spawn(self, coroutine):
+        """
+        Run the coroutine in a background task (cancelled when the process is finished).
+        """
+        task = self.loop.create_task(coroutine)
+        self.heartbeats.add(task)
+        task.add_done_callback(self.heartbeats.discard)
+
+    def read_health(self):
+        """
+        Read health reports of the invoked process (see ``announcer.health.HealthSocket``)
+        and send them to Consul agent in a background task.
+        """
+        check_ids = self.health.read()
+        if check_ids:
+            self.spawn(self.report_health(check_ids))
+
+    async def report_health(self, check_ids):
+        """
+        Send the status of TTL checks reported by the invoked process to Consul agent
+        (see ``announcer.service.Service.report_health``).
+        """
+        check_ids = [check_id for check_id in check_ids if check_id in self.ttl_checks]
+        self.log_ttl_checks(check_ids, await self.map(self.pass_ttl_check, check_ids))
+
+    async def pass_ttl_check(self, check_id):
+        """
+        Mark specified TTL check as passed (see ``announcer.service.Service.pass_ttl_check``).
+
+        Probes are executed by their own workers, so they don't block the event loop.
+
+        :param str check_id:
+        """
+        if self.probes and check_id in self.probes:
+            status, note = await self.loop.run_in_executor(
+                self.probe_executor, self.get_check_status, check_id
+            )
+        else:
+            status, note = self.get_check_status(check_id)
+        return await self.update_ttl_check(check_id, status, note)
+
+    async def pass_ttl_checks(self, check_ids=None):
+        """
+        Mark the registered TTL checks as passed (concurrently).
+
+        :param check_ids: IDs of TTL checks to mark. If None - all the registered TTL checks.
+        :type check_ids: list or None
+        """
+        if self.ttl_checks:
+            check_ids = list(self.ttl_checks if check_ids is None else check_ids)
+            results = await self.map(self.pass_ttl_check, check_ids)
+            self.log_ttl_checks(check_ids, results)
+            failed = [check_id for check_id, success in zip(check_ids, results) if not success]
+            if failed and await self.replay_registrations():
+                # Checks of the registered again services are critical until they are passed
+                self.log_ttl_checks(failed, await self.map(self.pass_ttl_check, failed))
+            if self.pacer is not None:
+                self.pacer.reschedule(self.scheduler, check_ids)
+            self.metrics_exporter.export()
+        else:
+            logger.debug("No TTL checks registered")
+
+    async def call_agent(self, operation, request, check_id=None):
+        """
+        Make a request to Consul agent and record its duration & result
+        (see ``announcer.service.Service.call_agent``). Cancelled requests are not recorded.
+
+        :param request: Function (without arguments) that returns the request coroutine.
+        """
+        start = monotonic()
+        try:
+            success = await self.call_resilient(request)
+        except asyncio.CancelledError:
+            raise
+        except BaseException:
+            self.record_request(operation, monotonic() - start, False, check_id)
+            raise
+        self.record_request(operation, monotonic() - start, success, check_id)
+        return success
+
+    async def call_resilient(self, request):
+        """
+        Make a request to Consul agent, retry it if the agent is unreachable
+        (see ``announcer.resilience.Resilience.call``).
+
+        :param request: Function (without arguments) that returns the request coroutine.
+        :return: Request result.
+        :raises: AnnouncerAgentUnavailable if the circuit is open.
+        """
+        attempt = 0
+        while True:
+            self.resilience.breaker.check()
+            try:
+                result = await request()
+            except self.resilience.errors as e:
+                if not self.resilience.failed(attempt, e):
+                    raise
+                await asyncio.sleep(self.resilience.delay(attempt))
+                attempt += 1
+            except Exception:
+                # The agent has responded (with an error) - it's reachable
+                self.resilience.breaker.record(True)
+                raise
+            else:
+                self.resilience.breaker.record(True)
+                return result
+
+    async def deregister_services(self):
+        """
+        Deregister services in Consul agent (concurrently).
+        """
+        logger.info("Deregistering Consul services")
+        await self.map(self.deregister_service, list(self.services))
+        self.forget_services(list(self.services))
+
+    async def deregister_service(self, service_id):
+        """
+        Deregister service in Consul agent.
+
+        :param str service_id:
+        :return: True if the service was deregistered.
+        :rtype: bool
+        """
+        logger.debug("Deregistering service \"{}\"".format(service_id))
+        start = monotonic()
+        success = await self.call_agent('deregister', self.get_deregister_request(service_id))
+        self.log_request_result(service_id, 'deregistered', success, start)
+        return success
+
+    def __del__(self):
+        """
+        Cleanup on object destruction.
+        """
+        if self.process and self.process.returncode is None:
+            logger.info("Killing the process {} (cleanup)".format(self.process.pid))
+            try:
+                self.process.kill()
+            except (ProcessLookupError, RuntimeError):
+                pass
@@ -0,0 +1,424 @@
+"""
+Load benchmark: run ``announcer.service.Service`` against a local fake Consul agent.
+
+Usage::
+
+    python -m announcer.benchmark --checks 1 100 1000 10000 --latency=0.005 --error-rate=0.01
+    python -m announcer.benchmark --startup
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import random
+import resource
+import signal
+import subprocess
+import sys
+import threading
+
+from six.moves import BaseHTTPServer, socketserver, urllib
+
+from announcer import root_logger
+from announcer.scheduler import HeartbeatScheduler
+from announcer.service import Service
+from announcer.utils import monotonic
+
+logger = logging.getLogger(__name__)
+
+# Packages ``announcer.client`` must not import before the announcer is created (startup budget)
+HEAVY_PACKAGES = ('requests', 'urllib3', 'consul', 'concurrent', 'asyncio', 'six')
+
+
+class FakeAgentHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """
+    Fake Consul agent API: services registration, TTL checks & requests stats (``/_stats``).
+
+    Every API request is delayed by ``server.latency`` and fails with ``server.error_status``
+    with ``server.error_rate`` probability.
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.handle_request()
+
+    def do_PUT(self):
+        self.handle_request()
+
+    def handle_request(self):
+        server = self.server
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        path = self.path.split('?')[0]
+        if path == '/_stats':
+            return self.respond(200, server.stats)
+
+        server.sleep()
+        if random.random() < server.error_rate:
+            server.count('error')
+            return self.respond(server.error_status)
+
+        if path == '/v1/agent/services':
+            server.count('services')
+            return self.respond(200, dict((i, {'ID': i}) for i in list(server.services)))
+        if path == '/v1/agent/service/register':
+            server.count('register')
+            service_conf = json.loads(body.decode('utf-8'))
+            server.services.add(service_conf.get('id', service_conf.get('name')))
+        elif path.startswith('/v1/agent/service/deregister/'):
+            server.count('deregister')
+            server.services.discard(urllib.parse.unquote(path.rsplit('/', 1)[1]))
+        elif path.startswith('/v1/agent/check/pass/'):
+            server.count('pass')
+        else:
+            return self.respond(404)
+        self.respond(200)
+
+    def respond(self, status, data=None):
+        body = b'' if data is None else json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        if self.headers.get('Connection') == 'close':
+            self.send_header('Connection', 'close')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class FakeAgent(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """
+    Fake Consul agent HTTP server (a thread per connection).
+    """
+    daemon_threads = True
+    latency = None
+    error_rate = None
+    error_status = None
+    lock = None
+    services = None
+    stats = None
+
+    def __init__(self, address, latency=0, error_rate=0, error_status=429):
+        """
+        Initialize fake Consul agent.
+
+        :param tuple address: Host & port to listen on.
+        :param float latency: Delay of every API request, in seconds.
+        :param float error_rate: Share of failed API requests (0-1).
+        :param int error_status: HTTP status of failed API requests.
+        """
+        BaseHTTPServer.HTTPServer.__init__(self, address, FakeAgentHandler)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.lock = threading.Lock()
+        self.services = set()
+        self.stats = {}
+
+    def sleep(self):
+        if self.latency:
+            threading.Event().wait(self.latency)
+
+    def count(self, request_type):
+        with self.lock:
+            self.stats[request_type] = self.stats.get(request_type, 0) + 1
+
+
+def serve_fake_agent(ports, **kwargs):
+    """
+    Run fake Consul agent on a random port (in a separate process).
+
+    :param multiprocessing.Queue ports: Queue to put the port to.
+    :param kwargs: ``FakeAgent`` arguments.
+    """
+    # Signal handlers of the services benchmarked before are inherited on fork
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    server = FakeAgent(('127.0.0.1', 0), **kwargs)
+    ports.put(server.server_address[1])
+    server.serve_forever()
+
+
+def get_agent_stats(port):
+    """
+    Get fake Consul agent requests stats.
+
+    :param int port: Fake agent port.
+    :return: Number of requests by type.
+    :rtype: dict
+    """
+    response = urllib.request.urlopen('http://127.0.0.1:{}/_stats'.format(port))
+    return json.loads(response.read().decode('utf-8'))
+
+
+class TickRecorder(HeartbeatScheduler):
+    """
+    Heartbeat scheduler that records the delay of every tick (from its deadline)
+    and the number of checks due in it.
+    """
+    jitter = None
+    bursts = None
+
+    def __init__(self, *args, **kwargs):
+        super(TickRecorder, self).__init__(*args, **kwargs)
+        self.jitter = []
+        self.bursts = []
+
+    def pop_due(self):
+        deadline = self.next_deadline()
+        now = self.clock()
+        due = super(TickRecorder, self).pop_due()
+        if due:
+            self.jitter.append(now - deadline)
+            self.bursts.append(len(due))
+        return due
+
+
+def make_config(checks, checks_per_service=10, ttl='10s'):
+    """
+    Create a synthetic services config.
+
+    :param int checks: Total number of TTL checks.
+    :param int checks_per_service: Max number of TTL checks per service.
+    :param str ttl: TTL of every check.
+    :return: Consul configuration JSON.
+    :rtype: str
+    """
+    services = []
+    for i in range(0, checks, checks_per_service):
+        services.append({
+            'name': 'benchmark-{}'.format(len(services)),
+            'port': 10000 + len(services),
+            'checks': [{'ttl': ttl}] * min(checks_per_service, checks - i)
+        })
+    return json.dumps({'services': services})
+
+
+def get_resource_usage():
+    """
+    :return: CPU time (user + system) in seconds & max RSS in megabytes.
+    :rtype: tuple
+    """
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    # ``ru_maxrss`` is in kilobytes on Linux
+    return usage.ru_utime + usage.ru_stime, usage.ru_maxrss / 1024.0
+
+
+def percentile(values, p):
+    """
+    :param list values:
+    :param float p: Percentile (0-100).
+    :return: Nearest-rank percentile or None if there are no values.
+    :rtype: float or None
+    """
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(int(len(values) * p / 100.0), len(values) - 1)]
+
+
+def run_benchmark(checks, duration=5, ttl='10s', checks_per_service=10, agent_options=None,
+                  **service_options):
+    """
+    Run ``announcer.service.Service`` with synthetic config against a fake Consul agent.
+
+    :param int checks: Total number of TTL checks.
+    :param float duration: How long the wrapped command (``sleep``) runs, in seconds.
+    :param str ttl: TTL of every check.
+    :param int checks_per_service: Max number of TTL checks per service.
+    :param agent_options: ``FakeAgent`` options: latency, error rate, etc.
+    :type agent_options: dict or None
+    :param service_options: Other ``announcer.service.Service`` arguments.
+    :return: Benchmark results.
+    :rtype: dict
+    """
+    ports = multiprocessing.Queue()
+    agent = multiprocessing.Process(
+        target=serve_fake_agent, args=(ports,), kwargs=agent_options or {}
+    )
+    agent.daemon = True
+    agent.start()
+    try:
+        port = ports.get(timeout=10)
+        service = Service(
+            '127.0.0.1:{}'.format(port),
+            make_config(checks, checks_per_service, ttl),
+            ['sleep', str(duration)],
+            interval=None,
+            **service_options
+        )
+        service.scheduler = TickRecorder(spread=service.scheduler.spread)
+        service.schedule_checks(None)
+
+        cpu, rss = get_resource_usage()
+        start = monotonic()
+        service.register_services()
+        registered = monotonic()
+        service.invoke_process()
+        service.poll()
+        polled = monotonic()
+        service.deregister_services()
+        finished = monotonic()
+        service.disconnect()
+        end_cpu, end_rss = get_resource_usage()
+
+        stats = get_agent_stats(port)
+    finally:
+        agent.terminate()
+        agent.join()
+
+    jitter = service.scheduler.jitter
+    return {
+        'checks': checks,
+        'services': len(service.services),
+        'register_sec': registered - start,
+        'deregister_sec': finished - polled,
+        'heartbeats_per_sec': stats.get('pass', 0) / (polled - registered),
+        'ticks': len(jitter),
+        'max_burst': max(service.scheduler.bursts or [0]),
+        'jitter_p50_ms': (percentile(jitter, 50) or 0) * 1000,
+        'jitter_max_ms': (max(jitter) if jitter else 0) * 1000,
+        'cpu_sec': end_cpu - cpu,
+        'max_rss_mb': end_rss,
+        'errors': stats.get('error', 0)
+    }
+
+
+def run_python(code):
+    """
+    Run Python code in a new interpreter (with the same modules search path).
+
+    :param str code:
+    :return: Output.
+    :rtype: str
+    """
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(path for path in sys.path if path))
+    return subprocess.check_output([sys.executable, '-c', code], env=env).decode('utf-8')
+
+
+def measure_startup(runs=5):
+    """
+    Measure the CLI startup in a new interpreter: ``consul-announcer --help`` time
+    (imports & help formatting, the best of ``runs``) and modules imported by
+    ``announcer.client``.
+
+    :param int runs:
+    :return: Startup results.
+    :rtype: dict
+    """
+    help_sec = min(float(run_python(
+        'import os, sys, time; start = time.time(); sys.argv = ["consul-announcer", "--help"]; '
+        'sys.stdout = open(os.devnull, "w"); from announcer.client import main\n'
+        'try: main()\nexcept SystemExit: pass\n'
+        'sys.stdout = sys.__stdout__; print(time.time() - start)'
+    )) for _ in range(runs))
+    modules = json.loads(run_python(
+        'import json, sys; before = set(sys.modules); import announcer.client; '
+        'print(json.dumps(sorted(set(sys.modules) - before)))'
+    ))
+    return {
+        'help_sec': help_sec,
+        'modules': len(modules),
+        'heavy_modules': [name for name in modules if name.split('.')[0] in HEAVY_PACKAGES]
+    }
+
+
+COLUMNS = [
+    ('checks', '{:>8}'),
+    ('services', '{:>8}'),
+    ('register_sec', '{:>12.3f}'),
+    ('deregister_sec', '{:>14.3f}'),
+    ('heartbeats_per_sec', '{:>18.1f}'),
+    ('ticks', '{:>6}'),
+    ('max_burst', '{:>9}'),
+    ('jitter_p50_ms', '{:>13.1f}'),
+    ('jitter_max_ms', '{:>13.1f}'),
+    ('cpu_sec', '{:>8.2f}'),
+    ('max_rss_mb', '{:>10.1f}'),
+    ('errors', '{:>6}')
+]
+
+
+def format_header():
+    """
+    :return: Results table header.
+    :rtype: str
+    """
+    return ' '.join('{{:>{}}}'.format(len(fmt.format(0))).format(name) for name, fmt in COLUMNS)
+
+
+def format_result(result):
+    """
+    :param dict result: ``run_benchmark`` result.
+    :return: Results table row.
+    :rtype: str
+    """
+    return ' '.join(fmt.format(result[name]) for name, fmt in COLUMNS)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        'python -m announcer.benchmark',
+        description="consul-announcer load benchmark against a local fake Consul agent."
+    )
+    parser.add_argument('--checks', nargs='+', type=int, default=[1, 10, 100, 1000, 10000],
+                        help="numbers of TTL checks to benchmark. Default: 1 10 100 1000 10000")
+    parser.add_argument('--checks-per-service', type=int, default=10,
+                        help="max number of TTL checks per service. Default: 10")
+    parser.add_argument('--ttl', default='10s', help="TTL of every check. Default: 10s")
+    parser.add_argument('--duration', type=float, default=5,
+                        help="run time of every benchmark, in seconds. Default: 5")
+    parser.add_argument('--latency', type=float, default=0,
+                        help="fake agent latency, in seconds. Default: 0")
+    parser.add_argument('--error-rate', type=float, default=0,
+                        help="share of failed fake agent requests (0-1). Default: 0")
+    parser.add_argument('--error-status', type=int, default=429,
+                        help="HTTP status of failed fake agent requests. Default: 429")
+    parser.add_argument('--workers', type=int, default=10,
+                        help="max number of concurrent requests to the agent. Default: 10")
+    parser.add_argument('--ttl-factor', type=float, default=10,
+                        help="TTL checks are marked as passed every TTL / ttl-factor. Default: 10")
+    parser.add_argument('--pacing', choices=['fixed', 'adaptive'], default='fixed',
+                        help="TTL checks heartbeats pacing. Default: fixed")
+    parser.add_argument('--spread', action='store_true',
+                        help="spread TTL checks heartbeats with phase offsets & jitter")
+    parser.add_argument('--startup', action='store_true',
+                        help="measure the CLI startup (instead of the load benchmark)")
+    args = parser.parse_args()
+
+    if args.startup:
+        result = measure_startup()
+        print("consul-announcer --help: {:.1f} ms, {} modules imported by announcer.client".format(
+            result['help_sec'] * 1000, result['modules']
+        ))
+        if result['heavy_modules']:
+            print("Heavy modules imported on startup: {}".format(
+                ', '.join(result['heavy_modules'])
+            ))
+            sys.exit(1)
+        return
+
+    root_logger.setLevel(logging.ERROR)
+    print(format_header())
+    sys.stdout.flush()
+    for checks in args.checks:
+        print(format_result(run_benchmark(
+            checks,
+            duration=args.duration,
+            ttl=args.ttl,
+            checks_per_service=args.checks_per_service,
+            agent_options={
+                'latency': args.latency,
+                'error_rate': args.error_rate,
+                'error_status': args.error_status
+            },
+            workers=args.workers,
+            ttl_factor=args.ttl_factor,
+            pacing=args.pacing,
+            spread=args.spread
+        )))
+        sys.stdout.flush()
+
+
+if __name__ == '__main__':
+    main()
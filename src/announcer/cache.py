@@ -0,0 +1,204 @@
+import hashlib
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+
+class FingerprintCache(object):
+    """
+    Fingerprints of the service definitions registered in Consul agent, persisted in a JSON file.
+
+    If a service is still registered in the agent and its definition has the same fingerprint,
+    there is no need to register it again.
+
+    It's also a journal of the services registered by the announcer: they are journaled before
+    the registration (see ``self.journal``) and discarded after the deregistration, so services
+    left in the agent by a killed announcer are known on the next start (see ``self.orphans``).
+    """
+    path = None
+    fingerprints = None
+
+    def __init__(self, path):
+        """
+        Initialize the cache and load the fingerprints saved previously.
+
+        :param str path: JSON file path.
+        """
+        self.path = path
+        self.fingerprints = {}
+        self.load()
+
+    @staticmethod
+    def fingerprint(service_conf):
+        """
+        Calculate service definition fingerprint (doesn't depend on the keys order).
+
+        :param dict service_conf: Service config.
+        :rtype: str
+        """
+        data = json.dumps(service_conf, default=dict, sort_keys=True)
+        return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+    def is_fresh(self, service_id, service_conf):
+        """
+        Check if the service was registered with the same definition.
+
+        :param str service_id:
+        :param dict service_conf: Service config.
+        :rtype: bool
+        """
+        return self.fingerprints.get(service_id) == self.fingerprint(service_conf)
+
+    def update(self, service_id, service_conf):
+        """
+        Remember the definition of the registered service.
+
+        :param str service_id:
+        :param dict service_conf: Service config.
+        """
+        self.fingerprints[service_id] = self.fingerprint(service_conf)
+
+    def journal(self, service_ids):
+        """
+        Journal the services about to be registered (and save the journal), so they are known
+        even if the announcer is killed before their registration is remembered.
+        Services without fingerprints are not fresh.
+
+        :param list service_ids:
+        """
+        for service_id in service_ids:
+            self.fingerprints.setdefault(service_id, None)
+        self.save()
+
+    def orphans(self, service_ids):
+        """
+        :param service_ids: IDs of the services that should be registered.
+        :return: IDs of the other journaled services (e.g. left by the previous run).
+        :rtype: list
+        """
+        return sorted(
+            service_id for service_id in self.fingerprints if service_id not in service_ids
+        )
+
+    def discard(self, service_id):
+        """
+        Forget the service (e.g. after it's deregistered).
+
+        :param str service_id:
+        """
+        self.fingerprints.pop(service_id, None)
+
+    def load(self):
+        """
+        Load the fingerprints from ``self.path``. Missing or broken file means an empty cache.
+        """
+        try:
+            with open(self.path) as f:
+                fingerprints = json.load(f)
+        except (IOError, OSError):
+            return
+        except ValueError:
+            logger.warning("Fingerprint cache \"{}\" is broken, ignoring it".format(self.path))
+            return
+        if isinstance(fingerprints, dict):
+            self.fingerprints = fingerprints
+
+    def save(self):
+        """
+        Save the fingerprints to ``self.path`` (atomically, via a temporary file).
+        """
+        tmp_path = '{}.tmp'.format(self.path)
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(self.fingerprints, f, sort_keys=True)
+            os.rename(tmp_path, self.path)
+        except (IOError, OSError) as e:
+            logger.warning("Can't save fingerprint cache \"{}\": {}".format(self.path, e))
+
+
+class ConfigCache(object):
+    """
+    Compiled services configs persisted in a JSON file, by config hash: services, TTLs of
+    TTL checks (in seconds), probes & register payloads (see ``Service.compile_config``).
+
+    If a config hasn't changed since the previous start, it isn't parsed again and services
+    aren't serialized again. Only the configs used by the current process are kept in the file.
+    """
+    path = None
+    entries = None
+    used = None
+
+    def __init__(self, path):
+        """
+        Initialize the cache and load the compiled configs saved previously.
+
+        :param str path: JSON file path.
+        """
+        self.path = path
+        self.entries = {}
+        self.used = set()
+        self.load()
+
+    @staticmethod
+    def key(config, **options):
+        """
+        :param str config: Config contents.
+        :param options: Options that affect config compilation.
+        :return: Cache key: hash of the config & options.
+        :rtype: str
+        """
+        data = json.dumps([config, options], sort_keys=True)
+        return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """
+        :param str key: See ``self.key``.
+        :return: Compiled config or None if it's not cached.
+        :rtype: dict or None
+        """
+        compiled = self.entries.get(key)
+        if compiled is not None:
+            self.used.add(key)
+        return compiled
+
+    def put(self, key, compiled):
+        """
+        Cache the compiled config and save the cache.
+
+        :param str key: See ``self.key``.
+        :param dict compiled: Compiled config.
+        """
+        self.entries[key] = compiled
+        self.used.add(key)
+        self.save()
+
+    def load(self):
+        """
+        Load the compiled configs from ``self.path``. Missing or broken file means an empty cache.
+        """
+        try:
+            with open(self.path) as f:
+                entries = json.load(f)
+        except (IOError, OSError):
+            return
+        except ValueError:
+            logger.warning("Config cache \"{}\" is broken, ignoring it".format(self.path))
+            return
+        if isinstance(entries, dict):
+            self.entries = entries
+
+    def save(self):
+        """
+        Save the compiled configs used by the current process to ``self.path``
+        (atomically, via a temporary file).
+        """
+        tmp_path = '{}.tmp'.format(self.path)
+        entries = dict((key, self.entries[key]) for key in self.used)
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(entries, f, default=dict)
+            os.rename(tmp_path, self.path)
+        except (IOError, OSError) as e:
+            logger.warning("Can't save config cache \"{}\": {}".format(self.path, e))
@@ -1,13 +1,17 @@
+"""
+Command line interface.
+
+Only standard library modules are imported here: the service (with its HTTP stack) is imported
+by ``create_announcer``, so ``--help``, arguments errors and ``--check`` don't pay for it.
+See ``announcer.benchmark.measure_startup``.
+"""
 import argparse
 import logging
 import os
 import sys
 
-from requests.exceptions import ConnectionError
-
 from announcer import root_logger
 from announcer.exceptions import AnnouncerImproperlyConfigured
-from announcer.service import Service
 
 
 logger = logging.getLogger(__name__)
@@ -22,7 +26,13 @@ class ArgsFormatter(argparse.HelpFormatter):
         return super(ArgsFormatter, self).add_usage(usage, actions, groups, prefix)
 
 
-def main():
+def create_parser(supervisor_mode):
+    """
+    Create command line arguments parser.
+
+    :param bool supervisor_mode: If True - ``--config`` is not required.
+    :rtype: argparse.ArgumentParser
+    """
     parser = argparse.ArgumentParser(
         'consul-announcer',
         description="Service announcer for Consul.",
@@ -32,15 +42,15 @@ def main():
     parser.add_argument(
         '--agent',
         default=os.getenv('CONSUL_ANNOUNCER_AGENT', 'localhost'),
-        help="Consul agent address: hostname[:port]. "
+        help="Consul agent address: hostname[:port] or unix:/path (unix domain socket). "
              "Default: localhost (default port is 8500). "
              "You can also use CONSUL_ANNOUNCER_AGENT env variable.",
-        metavar='hostname[:port]'
+        metavar='hostname[:port]|unix:/path'
     )
 
     parser.add_argument(
         '--config',
-        required='CONSUL_ANNOUNCER_CONFIG' not in os.environ,
+        required='CONSUL_ANNOUNCER_CONFIG' not in os.environ and not supervisor_mode,
         default=os.getenv('CONSUL_ANNOUNCER_CONFIG'),
         help="Consul configuration JSON (required). "
              "If starts with @ - considered as file path. "
@@ -48,6 +58,16 @@ def main():
         metavar='"JSON or @path"'
     )
 
+    parser.add_argument(
+        '--manifest',
+        default=os.getenv('CONSUL_ANNOUNCER_MANIFEST'),
+        help="supervisor mode: run many commands, each one with its own Consul configuration. "
+             "Manifest JSON: {\"processes\": [{\"cmd\": [...], \"config\": ...}, ...]}. "
+             "If starts with @ - considered as file path. "
+             "You can also use CONSUL_ANNOUNCER_MANIFEST env variable.",
+        metavar='"JSON or @path"'
+    )
+
     parser.add_argument(
         '--token',
         default=os.getenv('CONSUL_ANNOUNCER_TOKEN'),
@@ -66,6 +86,213 @@ def main():
         type=float
     )
 
+    parser.add_argument(
+        '--ttl-factor',
+        default=os.getenv('CONSUL_ANNOUNCER_TTL_FACTOR', 10),
+        help="when --interval is not specified, each TTL check is marked as passed "
+             "TTL / ttl-factor seconds after the previous mark. Default: 10. "
+             "You can also use CONSUL_ANNOUNCER_TTL_FACTOR env variable.",
+        metavar='factor',
+        type=float
+    )
+
+    parser.add_argument(
+        '--workers',
+        default=os.getenv('CONSUL_ANNOUNCER_WORKERS', 10),
+        help="max number of concurrent requests to Consul agent. Default: 10. "
+             "You can also use CONSUL_ANNOUNCER_WORKERS env variable.",
+        metavar='number',
+        type=int
+    )
+
+    parser.add_argument(
+        '--timeout',
+        default=os.getenv('CONSUL_ANNOUNCER_TIMEOUT', 10),
+        help="Consul agent request timeout, in seconds. Default: 10. "
+             "You can also use CONSUL_ANNOUNCER_TIMEOUT env variable.",
+        metavar='seconds',
+        type=float
+    )
+
+    parser.add_argument(
+        '--retries',
+        default=os.getenv('CONSUL_ANNOUNCER_RETRIES', 2),
+        help="max number of retries (with jittered exponential backoff) of a request "
+             "when Consul agent is unreachable. Default: 2. "
+             "You can also use CONSUL_ANNOUNCER_RETRIES env variable.",
+        metavar='number',
+        type=int
+    )
+
+    parser.add_argument(
+        '--pool-size',
+        default=os.getenv('CONSUL_ANNOUNCER_POOL_SIZE'),
+        help="max number of persistent connections to Consul agent. Default: --workers. "
+             "You can also use CONSUL_ANNOUNCER_POOL_SIZE env variable.",
+        metavar='number',
+        type=int
+    )
+
+    parser.add_argument(
+        '--no-keep-alive',
+        dest='keep_alive',
+        action='store_false',
+        default=os.getenv('CONSUL_ANNOUNCER_KEEP_ALIVE', '1').lower() not in ('0', 'false', 'no'),
+        help="open a new connection to Consul agent for every request. "
+             "You can also use CONSUL_ANNOUNCER_KEEP_ALIVE=0 env variable."
+    )
+
+    parser.add_argument(
+        '--cache',
+        default=os.getenv('CONSUL_ANNOUNCER_CACHE'),
+        help="fingerprint cache file: services that are still registered in Consul agent "
+             "with the same definition are not registered again. "
+             "You can also use CONSUL_ANNOUNCER_CACHE env variable.",
+        metavar='path'
+    )
+
+    parser.add_argument(
+        '--config-cache',
+        default=os.getenv('CONSUL_ANNOUNCER_CONFIG_CACHE'),
+        help="compiled config cache file: unchanged services config isn't parsed "
+             "and serialized again on the next start. "
+             "You can also use CONSUL_ANNOUNCER_CONFIG_CACHE env variable.",
+        metavar='path'
+    )
+
+    parser.add_argument(
+        '--pacing',
+        default=os.getenv('CONSUL_ANNOUNCER_PACING', 'fixed'),
+        choices=['fixed', 'adaptive'],
+        help="TTL checks heartbeats pacing: \"fixed\" (default) - every --interval "
+             "or TTL / ttl-factor; \"adaptive\" - by Consul agent latency & TTL headroom. "
+             "You can also use CONSUL_ANNOUNCER_PACING env variable."
+    )
+
+    parser.add_argument(
+        '--spread',
+        action='store_true',
+        default=os.getenv('CONSUL_ANNOUNCER_SPREAD', '0').lower() in ('1', 'true', 'yes'),
+        help="spread TTL checks heartbeats over their interval (by a phase offset hashed "
+             "from the check ID, host name & PID, plus jitter), so checks of many instances "
+             "started at once don't hit Consul agent in bursts. "
+             "You can also use CONSUL_ANNOUNCER_SPREAD=1 env variable."
+    )
+
+    parser.add_argument(
+        '--health-socket',
+        default=os.getenv('CONSUL_ANNOUNCER_HEALTH_SOCKET'),
+        help="unix datagram socket the command reports TTL checks status to: "
+             "\"pass|warn|fail <check ID> [note]\" (the path is passed to the command "
+             "in CONSUL_ANNOUNCER_HEALTH_SOCKET env variable). "
+             "You can also use CONSUL_ANNOUNCER_HEALTH_SOCKET env variable.",
+        metavar='path'
+    )
+
+    parser.add_argument(
+        '--probes',
+        action='store_true',
+        default=os.getenv('CONSUL_ANNOUNCER_PROBES', '0').lower() in ('1', 'true', 'yes'),
+        help="execute HTTP & TCP checks in the announcer (instead of Consul agent) and report "
+             "their results to TTL checks. "
+             "You can also use CONSUL_ANNOUNCER_PROBES=1 env variable."
+    )
+
+    parser.add_argument(
+        '--ready',
+        default=os.getenv('CONSUL_ANNOUNCER_READY'),
+        help="readiness probe of the command: services are in maintenance mode until it "
+             "succeeds (after the start & every restart). One of: tcp:host:port (the port "
+             "is connectable), http(s)://... (HTTP 2xx), file:/path (the file exists), "
+             "health (the command sends \"ready\" to --health-socket). "
+             "You can also use CONSUL_ANNOUNCER_READY env variable.",
+        metavar='probe'
+    )
+
+    parser.add_argument(
+        '--load',
+        default=os.getenv('CONSUL_ANNOUNCER_LOAD'),
+        help="load thresholds of the command, sampled from /proc: comma-separated "
+             "cpu=percent (of one core), rss=size (K, M or G) and queue=number "
+             "(listen queue of the services ports), e.g. cpu=90,rss=2G. Passing TTL checks "
+             "are reported as warning while any threshold is reached, so Consul uses "
+             "the warning weight of the services. "
+             "You can also use CONSUL_ANNOUNCER_LOAD env variable.",
+        metavar='thresholds'
+    )
+
+    parser.add_argument(
+        '--reload',
+        action='store_true',
+        default=os.getenv('CONSUL_ANNOUNCER_RELOAD', '0').lower() in ('1', 'true', 'yes'),
+        help="reload services config on SIGHUP (instead of passing it to the command): "
+             "only changed services are registered again. "
+             "You can also use CONSUL_ANNOUNCER_RELOAD=1 env variable."
+    )
+
+    parser.add_argument(
+        '--watch',
+        action='store_true',
+        default=os.getenv('CONSUL_ANNOUNCER_WATCH', '0').lower() in ('1', 'true', 'yes'),
+        help="watch Consul agent state with blocking queries: services lost by the agent "
+             "(e.g. after its restart) are registered again right away. "
+             "You can also use CONSUL_ANNOUNCER_WATCH=1 env variable."
+    )
+
+    parser.add_argument(
+        '--restart',
+        default=os.getenv('CONSUL_ANNOUNCER_RESTART', 'no'),
+        choices=['no', 'on-failure', 'always'],
+        help="restart the command after it exits (with exponential backoff): \"no\" (default), "
+             "\"on-failure\" (non-zero exit code) or \"always\". Services stay registered "
+             "in maintenance mode while the command is restarted. "
+             "You can also use CONSUL_ANNOUNCER_RESTART env variable."
+    )
+
+    parser.add_argument(
+        '--drain',
+        default=os.getenv('CONSUL_ANNOUNCER_DRAIN', 0),
+        help="on SIGTERM, SIGINT or SIGQUIT put services in maintenance mode and pass "
+             "the signal to the command after this delay, so requests in flight are finished. "
+             "Default: 0 (pass the signal right away). "
+             "You can also use CONSUL_ANNOUNCER_DRAIN env variable.",
+        metavar='seconds',
+        type=float
+    )
+
+    parser.add_argument(
+        '--metrics',
+        default=os.getenv('CONSUL_ANNOUNCER_METRICS'),
+        help="serve Prometheus metrics on this address: [host]:port. "
+             "You can also use CONSUL_ANNOUNCER_METRICS env variable.",
+        metavar='[host]:port'
+    )
+
+    parser.add_argument(
+        '--metrics-file',
+        default=os.getenv('CONSUL_ANNOUNCER_METRICS_FILE'),
+        help="write Prometheus metrics to this file (for node_exporter textfile collector). "
+             "You can also use CONSUL_ANNOUNCER_METRICS_FILE env variable.",
+        metavar='path'
+    )
+
+    parser.add_argument(
+        '--engine',
+        default=os.getenv('CONSUL_ANNOUNCER_ENGINE', 'threads'),
+        choices=['threads', 'asyncio'],
+        help="service engine: \"threads\" (default) or \"asyncio\" (Python 3.5+). "
+             "You can also use CONSUL_ANNOUNCER_ENGINE env variable."
+    )
+
+    parser.add_argument(
+        '--check',
+        '--dry-run',
+        dest='check',
+        action='store_true',
+        help="validate services config (--config or --manifest) against Consul schema "
+             "and exit, without contacting Consul agent and invoking the command"
+    )
+
     parser.add_argument(
         '--verbose',
         '-v',
@@ -73,18 +300,140 @@ def main():
         help="verbose output. You can specify -v or -vv"
     )
 
+    return parser
+
+
+def parse_args(parser, supervisor_mode):
+    """
+    Parse command line arguments: ``consul-announcer [arguments] -- command [arguments]``.
+
+    Print help/usage and exit if needed.
+
+    :param argparse.ArgumentParser parser:
+    :param bool supervisor_mode: If True - command is not expected.
+    :return: Parsed arguments and the command (None in supervisor mode).
+    :rtype: tuple
+    """
     if '--' not in sys.argv:
         if "--help" in sys.argv or "-h" in sys.argv or len(sys.argv) == 1:
             parser.print_help()
             sys.exit()
-        else:
+        elif not supervisor_mode and '--check' not in sys.argv and '--dry-run' not in sys.argv:
             parser.print_usage()
             sys.stderr.write("{}: error: command is not specified".format(parser.prog))
             sys.exit(2)
+        args = parser.parse_args(sys.argv[1:])
+        cmd = None
+    else:
+        split_at = sys.argv.index('--')
+        args = parser.parse_args(sys.argv[1:split_at])
+        cmd = sys.argv[split_at + 1:]
+
+    if args.manifest:
+        if cmd is not None:
+            parser.error("command can't be used with --manifest")
+        if args.engine == 'asyncio':
+            parser.error("--manifest is not supported by asyncio engine")
+        if args.ready:
+            parser.error("--ready can't be used with --manifest")
+
+    return args, cmd
+
+
+def create_announcer(args, cmd):
+    """
+    Create a service (or a supervisor in supervisor mode).
+
+    :param argparse.Namespace args: Parsed command line arguments.
+    :param cmd: Command to invoke (None in supervisor mode).
+    :type cmd: list or None
+    :rtype: announcer.service.Service or announcer.supervisor.Supervisor
+    """
+    if args.manifest:
+        from announcer.supervisor import Supervisor
+        return Supervisor(
+            agent_address=args.agent,
+            manifest=args.manifest,
+            token=args.token,
+            interval=args.interval,
+            ttl_factor=args.ttl_factor,
+            workers=args.workers,
+            timeout=args.timeout,
+            pool_size=args.pool_size,
+            keep_alive=args.keep_alive,
+            cache=args.cache,
+            metrics_address=args.metrics,
+            metrics_file=args.metrics_file,
+            pacing=args.pacing,
+            spread=args.spread,
+            retries=args.retries,
+            health_socket=args.health_socket,
+            probes=args.probes,
+            reload=args.reload,
+            watch=args.watch,
+            restart=args.restart,
+            drain=args.drain,
+            config_cache=args.config_cache,
+            load=args.load
+        )
 
-    split_at = sys.argv.index('--')
-    args = parser.parse_args(sys.argv[1:split_at])
-    cmd = sys.argv[split_at + 1:]
+    if args.engine == 'asyncio':
+        from announcer.aio import AsyncService as service_class
+    else:
+        from announcer.service import Service as service_class
+
+    return service_class(
+        agent_address=args.agent,
+        config=args.config,
+        cmd=cmd,
+        token=args.token,
+        interval=args.interval,
+        ttl_factor=args.ttl_factor,
+        workers=args.workers,
+        timeout=args.timeout,
+        pool_size=args.pool_size,
+        keep_alive=args.keep_alive,
+        cache=args.cache,
+        metrics_address=args.metrics,
+        metrics_file=args.metrics_file,
+        pacing=args.pacing,
+        spread=args.spread,
+        retries=args.retries,
+        health_socket=args.health_socket,
+        probes=args.probes,
+        reload=args.reload,
+        watch=args.watch,
+        restart=args.restart,
+        drain=args.drain,
+        config_cache=args.config_cache,
+        ready=args.ready,
+        load=args.load
+    )
+
+
+def check_config(args):
+    """
+    Validate services config (``--check``) without initializing the service or the supervisor,
+    so the HTTP stack isn't imported (see ``announcer.validation.check_config``).
+
+    :param argparse.Namespace args: Parsed command line arguments.
+    :return: IDs of the services & TTL checks.
+    :rtype: tuple
+    :raises: AnnouncerImproperlyConfigured
+    """
+    from announcer import validation
+    if args.manifest:
+        return validation.check_manifest(args.manifest, probes=args.probes)
+    return validation.check_config(args.config, probes=args.probes)
+
+
+def main():
+    # In supervisor mode commands & their configs are specified in the manifest
+    supervisor_mode = 'CONSUL_ANNOUNCER_MANIFEST' in os.environ or any(
+        arg == '--manifest' or arg.startswith('--manifest=') for arg in sys.argv
+    )
+    parser = create_parser(supervisor_mode)
+    args, cmd = parse_args(parser, supervisor_mode)
 
     if not args.verbose:
         root_logger.setLevel(logging.WARNING)
@@ -93,14 +442,22 @@ def main():
     elif args.verbose >= 2:
         root_logger.setLevel(logging.DEBUG)
 
+    if args.check:
+        try:
+            service_ids, ttl_check_ids = check_config(args)
+        except (AnnouncerImproperlyConfigured, OSError, ValueError) as e:
+            logger.error(e)
+            sys.exit(1)
+        print("Services config is valid: {} services, {} TTL checks".format(
+            len(service_ids), len(ttl_check_ids)
+        ))
+        return
+
+    from requests.exceptions import ConnectionError
+
     try:
-        Service(
-            agent_address=args.agent,
-            config=args.config,
-            cmd=cmd,
-            token=args.token,
-            interval=args.interval
-        ).run()
+        announcer = create_announcer(args, cmd)
+        announcer.run()
     except ConnectionError as e:
         logger.error("Can't connect to \"{}\"".format(e.request.url))
         sys.exit(1)
@@ -8,3 +8,9 @@ class AnnouncerImproperlyConfigured(AnnouncerException):
     """
     consul-announcer is improperly configured.
     """
+
+
+class AnnouncerAgentUnavailable(AnnouncerException):
+    """
+    Consul agent is unavailable: requests are suspended by the circuit breaker.
+    """
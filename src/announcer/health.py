@@ -0,0 +1,210 @@
+import errno
+import logging
+import os
+import select
+import socket
+import threading
+
+from announcer.utils import monotonic
+
+logger = logging.getLogger(__name__)
+
+# Environment variable the socket path is passed to the invoked process in
+ENV_VARIABLE = 'CONSUL_ANNOUNCER_HEALTH_SOCKET'
+
+STATUSES = ('pass', 'warn', 'fail')
+
+
+class HealthSocket(object):
+    """
+    Local unix datagram socket the invoked process reports its health to.
+
+    Every datagram is a UTF-8 text: ``<pass|warn|fail> <check ID> [note]``, e.g.
+    ``fail service:web:1 database is unreachable``. The last reported status of a TTL check
+    (with its note) is sent to Consul agent on every heartbeat instead of "pass".
+
+    If the process doesn't report the check status for longer than its TTL
+    (e.g. it's deadlocked), the check is marked as failed.
+    Checks without reports are marked as passed while the process is running.
+
+    The process may also send ``ready`` when it has warmed up
+    (see ``announcer.readiness.ReadinessProbe``).
+    """
+    max_size = 65536
+
+    path = None
+    sock = None
+    clock = None
+    lock = None
+    ttls = None
+    reports = None
+    thread = None
+    closed = False
+    ready = False
+
+    def __init__(self, path, clock=monotonic):
+        """
+        Initialize the health socket.
+
+        :param str path: Unix socket path.
+        :param clock: Function that returns current time in seconds.
+        """
+        self.path = path
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.ttls = {}
+        self.reports = {}
+
+    def add_check(self, check_id, ttl):
+        """
+        Accept reports of a TTL check.
+
+        :param str check_id:
+        :param float ttl: TTL in seconds.
+        """
+        with self.lock:
+            self.ttls[check_id] = ttl
+
+    def remove_check(self, check_id):
+        """
+        :param str check_id:
+        """
+        with self.lock:
+            self.ttls.pop(check_id, None)
+            self.reports.pop(check_id, None)
+
+    def reset(self, check_id):
+        """
+        Forget the last reported status of the TTL check (e.g. the process was restarted).
+
+        :param str check_id:
+        """
+        with self.lock:
+            self.reports.pop(check_id, None)
+
+    def bind(self):
+        """
+        Create the (non-blocking) socket. Stale socket file is removed.
+        """
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.sock.bind(self.path)
+        self.sock.setblocking(False)
+        self.closed = False
+        logger.info("Listening to health reports on \"{}\"".format(self.path))
+
+    def start(self, listener):
+        """
+        Create the socket and read reports in a separate thread.
+
+        :param listener: Function called with the list of TTL check IDs
+                         whose status was reported (a batch of datagrams received at once).
+        """
+        self.bind()
+        self.thread = threading.Thread(target=self.serve, args=(listener,), name='health-socket')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def serve(self, listener):
+        """
+        Wait for datagrams and pass the reported check IDs to ``listener`` until stopped.
+        """
+        while not self.closed:
+            select.select([self.sock], [], [])
+            check_ids = self.read()
+            if check_ids and not self.closed:
+                try:
+                    listener(check_ids)
+                except Exception:
+                    logger.exception("Can't send health reports to Consul agent")
+
+    def read(self):
+        """
+        Read all the received datagrams (without blocking).
+
+        :return: IDs of TTL checks whose status was reported.
+        :rtype: list
+        """
+        check_ids = []
+        while True:
+            try:
+                data = self.sock.recv(self.max_size)
+            except socket.error as e:
+                if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    break
+                raise
+            if not data:
+                continue
+            check_id = self.report(data)
+            if check_id is not None and check_id not in check_ids:
+                check_ids.append(check_id)
+        return check_ids
+
+    def report(self, data):
+        """
+        Parse & store the health report.
+
+        :param bytes data: Datagram.
+        :return: TTL check ID or None if the report is invalid.
+        :rtype: str or None
+        """
+        parts = data.decode('utf-8', 'replace').strip().split(None, 2)
+        if parts == ['ready']:
+            logger.debug("The process is reported as ready")
+            self.ready = True
+            return None
+        if len(parts) < 2 or parts[0] not in STATUSES:
+            logger.warning("Invalid health report: {!r}".format(data))
+            return None
+        status, check_id = parts[:2]
+        with self.lock:
+            if check_id not in self.ttls:
+                logger.warning("Health report of unknown TTL check \"{}\"".format(check_id))
+                return None
+            self.reports[check_id] = (status, parts[2] if len(parts) > 2 else None, self.clock())
+        logger.debug("TTL check \"{}\" is reported as {}".format(check_id, status))
+        return check_id
+
+    def status(self, check_id):
+        """
+        Get TTL check status to send to Consul agent.
+
+        :param str check_id:
+        :return: Status ("pass", "warn" or "fail") & note (or None).
+        :rtype: tuple
+        """
+        with self.lock:
+            report = self.reports.get(check_id)
+            if report is None:
+                return 'pass', None
+            status, note, received = report
+            silence = self.clock() - received
+            if silence > self.ttls[check_id]:
+                return 'fail', "No health report from the application for {:.0f} sec".format(
+                    silence
+                )
+            return status, note
+
+    def stop(self):
+        """
+        Stop reading reports, close & remove the socket.
+        """
+        if self.sock is None:
+            return
+        self.closed = True
+        if self.thread is not None:
+            # Wake the thread up
+            client = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            try:
+                client.sendto(b'', self.path)
+            except socket.error:
+                pass
+            client.close()
+            self.thread.join(1)
+        self.sock.close()
+        self.sock = None
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
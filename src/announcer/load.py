@@ -0,0 +1,226 @@
+import logging
+import os
+import re
+import threading
+
+from announcer.exceptions import AnnouncerImproperlyConfigured
+from announcer.utils import monotonic
+
+logger = logging.getLogger(__name__)
+
+# RSS size units, in bytes
+SIZE_UNITS = {'': 1, 'k': 1024, 'm': 1024 ** 2, 'g': 1024 ** 3}
+
+# Metric label, value format & its unit (for notes): "CPU 95% >= 90%"
+METRICS = {
+    'cpu': ("CPU", "{:.0f}%", 1),
+    'rss': ("RSS", "{:.0f} MiB", SIZE_UNITS['m']),
+    'queue': ("listen queue", "{:.0f}", 1)
+}
+
+# TCP socket state in ``/proc/net/tcp``
+LISTEN = '0A'
+
+
+def parse_size(s):
+    """
+    Parse a size with an optional unit: ``512M``, ``2G``, ``1048576``.
+
+    :param str s:
+    :return: Size in bytes.
+    :rtype: int
+    :raises: ValueError
+    """
+    match = re.match(r'^(\d+)([kmg]?)i?b?$', s.strip().lower())
+    if match is None:
+        raise ValueError("Invalid size: {}".format(s))
+    return int(match.group(1)) * SIZE_UNITS[match.group(2)]
+
+
+class LoadMonitor(object):
+    """
+    Resource usage of the invoked process sampled from ``/proc``: CPU (percent of one core
+    since the previous sample), RSS and the listen queue of the services ports (connections
+    waiting to be accepted).
+
+    When any metric reaches its threshold, the process is overloaded and its passing TTL checks
+    are reported as warning (see ``announcer.service.Service.get_check_status``): Consul
+    uses ``Weights.Warning`` of the service instead of ``Weights.Passing`` for DNS SRV weights,
+    and warning instances can be filtered out by load balancers. The process is back to normal
+    when all the metrics are below ``recovery`` of their thresholds, so the status doesn't flap.
+
+    Samples are taken at most once per ``interval`` (every sample reads 2 small files, plus
+    ``/proc/net/tcp*`` for the queue), all TTL checks share them.
+    """
+    interval = 1
+    recovery = 0.9
+    clock_ticks = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+    page_size = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+    thresholds = None
+    clock = None
+    lock = None
+    pid = None
+    cpu_time = None
+    sampled = None
+    usage = None
+    overloaded = False
+    note = None
+
+    def __init__(self, spec, clock=monotonic):
+        """
+        Initialize load monitor.
+
+        :param str spec: Thresholds: comma-separated ``metric=limit``, e.g.
+                         ``cpu=90,rss=2G,queue=100`` (CPU in percent of one core,
+                         RSS in bytes with an optional K/M/G unit).
+        :param clock: Function that returns current time in seconds.
+        :raises: AnnouncerImproperlyConfigured
+        """
+        self.thresholds = self.parse_thresholds(spec)
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.usage = {}
+
+    @staticmethod
+    def parse_thresholds(spec):
+        """
+        :param str spec: Comma-separated ``metric=limit``.
+        :return: Threshold by metric name.
+        :rtype: dict
+        :raises: AnnouncerImproperlyConfigured
+        """
+        thresholds = {}
+        for item in spec.split(','):
+            metric, _, limit = item.strip().partition('=')
+            try:
+                if metric not in METRICS:
+                    raise ValueError("Unknown metric: {}".format(metric))
+                thresholds[metric] = parse_size(limit) if metric == 'rss' else float(limit)
+            except ValueError as e:
+                raise AnnouncerImproperlyConfigured(
+                    "Load thresholds must be \"metric=limit\" ({}), got \"{}\": {}".format(
+                        ', '.join(sorted(METRICS)), spec, e
+                    )
+                )
+        return thresholds
+
+    def status(self, pid, ports=()):
+        """
+        Sample the process (if the last sample is older than ``self.interval``).
+
+        :param int pid: Invoked process PID.
+        :param ports: Services ports (for the listen queue).
+        :return: TTL check status ("pass" or "warn") & note (or None).
+        :rtype: tuple
+        """
+        with self.lock:
+            now = self.clock()
+            if pid != self.pid or self.sampled is None or now - self.sampled >= self.interval:
+                try:
+                    self.sample(pid, ports, now)
+                except (IOError, OSError, ValueError, IndexError) as e:
+                    logger.debug("Can't sample the process load: {}".format(e))
+                    self.usage = {}
+                self.evaluate()
+            if self.overloaded:
+                return 'warn', self.note
+            return 'pass', None
+
+    def sample(self, pid, ports, now):
+        """
+        Read the process resource usage to ``self.usage``. CPU usage is known from
+        the second sample of the same process.
+
+        :param int pid:
+        :param ports: Services ports.
+        :param float now: Current time.
+        """
+        cpu_time, cpu_time_before = self.read_cpu_time(pid), self.cpu_time
+        if pid != self.pid:
+            cpu_time_before = None
+        usage = {}
+        if cpu_time_before is not None and now > self.sampled:
+            usage['cpu'] = (cpu_time - cpu_time_before) / (now - self.sampled) * 100
+        self.pid, self.cpu_time, self.sampled = pid, cpu_time, now
+        if 'rss' in self.thresholds:
+            usage['rss'] = self.read_rss(pid)
+        if 'queue' in self.thresholds and ports:
+            usage['queue'] = self.read_listen_queue(ports)
+        self.usage = usage
+
+    def evaluate(self):
+        """
+        Compare ``self.usage`` with the thresholds (``recovery`` of them if the process
+        is overloaded) and update ``self.overloaded`` & ``self.note``.
+        """
+        factor = self.recovery if self.overloaded else 1
+        exceeded = [metric for metric, limit in sorted(self.thresholds.items())
+                    if self.usage.get(metric, 0) >= limit * factor]
+        overloaded = bool(exceeded)
+        if overloaded:
+            self.note = "Process is overloaded: {}".format(', '.join(
+                self.describe(metric, factor) for metric in exceeded
+            ))
+        if overloaded != self.overloaded:
+            if overloaded:
+                logger.warning(self.note)
+            else:
+                logger.info("Process load is back to normal")
+        self.overloaded = overloaded
+
+    def describe(self, metric, factor=1):
+        """
+        :param str metric:
+        :param float factor: Threshold factor.
+        :return: Metric value & threshold, e.g. "CPU 95% >= 90%".
+        :rtype: str
+        """
+        label, value_format, unit = METRICS[metric]
+        return "{} {} >= {}".format(
+            label, value_format.format(self.usage[metric] / unit),
+            value_format.format(self.thresholds[metric] * factor / unit)
+        )
+
+    def read_cpu_time(self, pid):
+        """
+        :param int pid:
+        :return: CPU time (user + system) of the process in seconds.
+        :rtype: float
+        """
+        with open('/proc/{}/stat'.format(pid)) as f:
+            # The command name (in parentheses) may contain spaces
+            fields = f.read().rpartition(')')[2].split()
+        # utime & stime are the 14th & 15th fields, the state is the 3rd one
+        return float(int(fields[11]) + int(fields[12])) / self.clock_ticks
+
+    def read_rss(self, pid):
+        """
+        :param int pid:
+        :return: Resident set size of the process in bytes.
+        :rtype: int
+        """
+        with open('/proc/{}/statm'.format(pid)) as f:
+            return int(f.read().split()[1]) * self.page_size
+
+    @staticmethod
+    def read_listen_queue(ports):
+        """
+        :param ports: TCP ports.
+        :return: Max number of connections waiting to be accepted on the listening sockets
+                 of the ports.
+        :rtype: int
+        """
+        ports = set(int(port) for port in ports)
+        queue = 0
+        for path in ('/proc/net/tcp', '/proc/net/tcp6'):
+            if not os.path.exists(path):
+                continue
+            with open(path) as f:
+                next(f)
+                for line in f:
+                    fields = line.split()
+                    if fields[3] == LISTEN and int(fields[1].rpartition(':')[2], 16) in ports:
+                        # rx_queue of a listening socket is its accept queue length
+                        queue = max(queue, int(fields[4].partition(':')[2], 16))
+        return queue
@@ -0,0 +1,296 @@
+import logging
+import os
+import threading
+import time
+
+from six.moves import BaseHTTPServer, socketserver
+
+from announcer.utils import monotonic
+
+logger = logging.getLogger(__name__)
+
+# Histogram buckets for Consul agent request duration, in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class Histogram(object):
+    """
+    Cumulative histogram (Prometheus-style).
+    """
+    buckets = None
+    counts = None
+    count = 0
+    sum = 0
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+
+    def observe(self, value):
+        """
+        :param float value:
+        """
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+    def render(self, name, labels):
+        """
+        :param str name: Metric name.
+        :param str labels: Rendered labels (without braces), may be empty.
+        :return: Prometheus text format lines.
+        :rtype: list
+        """
+        prefix = labels + ',' if labels else ''
+        lines = []
+        for bound, count in zip(self.buckets, self.counts):
+            lines.append('{}_bucket{{{}le="{}"}} {}'.format(name, prefix, bound, count))
+        lines.append('{}_bucket{{{}le="+Inf"}} {}'.format(name, prefix, self.count))
+        lines.append('{}_sum{} {}'.format(name, wrap(labels), self.sum))
+        lines.append('{}_count{} {}'.format(name, wrap(labels), self.count))
+        return lines
+
+
+def label(name, value):
+    """
+    :return: Rendered label: name="value" (value is escaped).
+    :rtype: str
+    """
+    value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{}="{}"'.format(name, value)
+
+
+def wrap(labels):
+    return '{{{}}}'.format(labels) if labels else ''
+
+
+class Metrics(object):
+    """
+    consul-announcer metrics: Consul agent requests latency & errors, TTL checks freshness
+    and invoked processes uptime. Thread-safe.
+    """
+    lock = None
+    ttls = None
+    heartbeats = None
+    last_passes = None
+    requests = None
+    errors = None
+    processes = None
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.ttls = {}
+        self.heartbeats = {}
+        self.last_passes = {}
+        self.requests = {}
+        self.errors = {}
+        self.processes = {}
+
+    def add_check(self, check_id, ttl):
+        """
+        Track TTL check.
+
+        :param str check_id:
+        :param float ttl: TTL in seconds.
+        """
+        with self.lock:
+            self.ttls[check_id] = ttl
+            self.heartbeats[check_id] = Histogram()
+
+    def remove_check(self, check_id):
+        """
+        Stop tracking TTL check.
+
+        :param str check_id:
+        """
+        with self.lock:
+            for values in (self.ttls, self.heartbeats, self.last_passes):
+                values.pop(check_id, None)
+
+    def observe(self, operation, duration, success, check_id=None):
+        """
+        Record Consul agent request.
+
+        :param str operation: "register", "deregister" or "heartbeat".
+        :param float duration: Request duration in seconds.
+        :param bool success: Request result.
+        :param check_id: TTL check ID (for heartbeats).
+        :type check_id: str or None
+        """
+        with self.lock:
+            if operation not in self.requests:
+                self.requests[operation] = Histogram()
+            self.requests[operation].observe(duration)
+            if check_id in self.heartbeats:
+                self.heartbeats[check_id].observe(duration)
+            if not success:
+                self.errors[operation] = self.errors.get(operation, 0) + 1
+            elif check_id in self.ttls:
+                self.last_passes[check_id] = (time.time(), monotonic())
+
+    def process_started(self, pid):
+        with self.lock:
+            self.processes[pid] = monotonic()
+
+    def process_exited(self, pid):
+        with self.lock:
+            self.processes.pop(pid, None)
+
+    def render(self):
+        """
+        Render the metrics in Prometheus text format.
+
+        :rtype: str
+        """
+        now = monotonic()
+        lines = []
+        with self.lock:
+            lines.append('# HELP consul_announcer_agent_request_duration_seconds '
+                         'Consul agent request duration.')
+            lines.append('# TYPE consul_announcer_agent_request_duration_seconds histogram')
+            for operation, histogram in sorted(self.requests.items()):
+                lines.extend(histogram.render(
+                    'consul_announcer_agent_request_duration_seconds',
+                    label('operation', operation)
+                ))
+
+            lines.append('# HELP consul_announcer_agent_errors_total '
+                         'Failed (or timed out) Consul agent requests.')
+            lines.append('# TYPE consul_announcer_agent_errors_total counter')
+            for operation in sorted(set(self.requests) | set(self.errors)):
+                lines.append('consul_announcer_agent_errors_total{{{}}} {}'.format(
+                    label('operation', operation), self.errors.get(operation, 0)
+                ))
+
+            lines.append('# HELP consul_announcer_heartbeat_duration_seconds '
+                         'Duration of marking TTL check as passed.')
+            lines.append('# TYPE consul_announcer_heartbeat_duration_seconds histogram')
+            for check_id, histogram in sorted(self.heartbeats.items()):
+                lines.extend(histogram.render(
+                    'consul_announcer_heartbeat_duration_seconds', label('check_id', check_id)
+                ))
+
+            lines.append('# HELP consul_announcer_heartbeat_last_success_timestamp_seconds '
+                         'Time when TTL check was marked as passed last time.')
+            lines.append('# TYPE consul_announcer_heartbeat_last_success_timestamp_seconds gauge')
+            for check_id, (timestamp, _) in sorted(self.last_passes.items()):
+                lines.append(
+                    'consul_announcer_heartbeat_last_success_timestamp_seconds{{{}}} {}'.format(
+                        label('check_id', check_id), timestamp
+                    )
+                )
+
+            lines.append('# HELP consul_announcer_ttl_headroom_seconds '
+                         'Time left before TTL check expires.')
+            lines.append('# TYPE consul_announcer_ttl_headroom_seconds gauge')
+            for check_id, (_, passed) in sorted(self.last_passes.items()):
+                lines.append('consul_announcer_ttl_headroom_seconds{{{}}} {}'.format(
+                    label('check_id', check_id), self.ttls[check_id] - (now - passed)
+                ))
+
+            lines.append('# HELP consul_announcer_process_uptime_seconds '
+                         'Uptime of the invoked process.')
+            lines.append('# TYPE consul_announcer_process_uptime_seconds gauge')
+            for pid, started in sorted(self.processes.items()):
+                lines.append('consul_announcer_process_uptime_seconds{{{}}} {}'.format(
+                    label('pid', pid), now - started
+                ))
+        return '\n'.join(lines) + '\n'
+
+
+class MetricsHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """
+    Serve ``server.metrics`` on any GET request.
+    """
+    def do_GET(self):
+        body = self.server.metrics.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class MetricsServer(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    metrics = None
+
+
+class MetricsExporter(object):
+    """
+    Expose metrics via HTTP endpoint and/or write them to a file
+    (for node_exporter textfile collector). Does nothing if neither is configured.
+    """
+    metrics = None
+    address = None
+    path = None
+    interval = None
+    server = None
+    exported = None
+
+    def __init__(self, metrics, address=None, path=None, interval=1):
+        """
+        Initialize metrics exporter.
+
+        :param Metrics metrics:
+        :param address: HTTP endpoint address: "host:port" (host is optional).
+        :type address: str or None
+        :param path: Metrics file path.
+        :type path: str or None
+        :param float interval: Min interval between metrics file updates, in seconds.
+        """
+        self.metrics = metrics
+        self.address = address
+        self.path = path
+        self.interval = interval
+
+    def start(self):
+        """
+        Start HTTP endpoint (in a separate thread).
+        """
+        if not self.address:
+            return
+        host, _, port = self.address.rpartition(':')
+        self.server = MetricsServer((host, int(port)), MetricsHandler)
+        self.server.metrics = self.metrics
+        thread = threading.Thread(target=self.server.serve_forever, name='metrics-server')
+        thread.daemon = True
+        thread.start()
+        logger.info("Serving metrics on {}:{}".format(*self.server.server_address[:2]))
+
+    def export(self, force=False):
+        """
+        Write metrics file (atomically, via a temporary file).
+
+        :param bool force: Ignore ``self.interval``.
+        """
+        if not self.path:
+            return
+        now = monotonic()
+        if not force and self.exported is not None and now - self.exported < self.interval:
+            return
+        self.exported = now
+        tmp_path = '{}.tmp'.format(self.path)
+        try:
+            with open(tmp_path, 'w') as f:
+                f.write(self.metrics.render())
+            os.rename(tmp_path, self.path)
+        except (IOError, OSError) as e:
+            logger.warning("Can't write metrics to \"{}\": {}".format(self.path, e))
+
+    def stop(self):
+        """
+        Stop HTTP endpoint and write the final metrics file.
+        """
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+        self.export(force=True)
@@ -0,0 +1,104 @@
+import threading
+
+from announcer.utils import monotonic
+
+
+class HeartbeatPacer(object):
+    """
+    Adaptive TTL check heartbeats pacing.
+
+    Round-trip time & success rate of every check heartbeat are tracked (EWMA).
+    The next heartbeat is planned so that ``attempts`` more heartbeats fit into the time left
+    before the check expires (minus ``safety_rtts`` round trips):
+
+    - when the agent is fast and heartbeats succeed, checks are refreshed rarely (up to TTL / 2)
+    - when a heartbeat fails, the headroom shrinks and the next attempt comes sooner
+    - but never sooner than ``min_delay_rtts`` round trips (divided by the success rate),
+      so a slow or failing (overloaded) agent isn't hammered
+    """
+    attempts = 3
+    safety_rtts = 4
+    min_delay_rtts = 4
+    smoothing = 0.2
+
+    clock = None
+    lock = None
+    checks = None
+
+    def __init__(self, clock=monotonic):
+        """
+        Initialize the pacer.
+
+        :param clock: Function that returns current time in seconds.
+        """
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.checks = {}
+
+    def add(self, check_id, ttl):
+        """
+        Start pacing a check. Until its first heartbeat, the check is considered passed now.
+
+        :param str check_id:
+        :param float ttl: TTL in seconds.
+        """
+        with self.lock:
+            self.checks[check_id] = {
+                'ttl': ttl, 'rtt': None, 'success_rate': 1.0, 'last_success': self.clock()
+            }
+
+    def remove(self, check_id):
+        """
+        :param str check_id:
+        """
+        with self.lock:
+            self.checks.pop(check_id, None)
+
+    def observe(self, check_id, rtt, success):
+        """
+        Record heartbeat round-trip time & result.
+
+        :param str check_id:
+        :param float rtt: Round-trip time in seconds.
+        :param bool success:
+        """
+        with self.lock:
+            check = self.checks.get(check_id)
+            if check is None:
+                return
+            if check['rtt'] is None:
+                check['rtt'] = rtt
+            else:
+                check['rtt'] += self.smoothing * (rtt - check['rtt'])
+            result = 1.0 if success else 0.0
+            check['success_rate'] += self.smoothing * (result - check['success_rate'])
+            if success:
+                check['last_success'] = self.clock()
+
+    def next_delay(self, check_id):
+        """
+        Calculate the delay before the next heartbeat.
+
+        :param str check_id:
+        :return: Delay in seconds.
+        :rtype: float
+        """
+        with self.lock:
+            check = self.checks[check_id]
+            rtt = check['rtt'] or 0
+            headroom = check['last_success'] + check['ttl'] - self.clock()
+            delay = (headroom - self.safety_rtts * rtt) / self.attempts
+            min_delay = self.min_delay_rtts * rtt / max(check['success_rate'], 0.1)
+            return max(min(delay, check['ttl'] / 2.0), min_delay, 0)
+
+    def reschedule(self, scheduler, check_ids):
+        """
+        Reschedule checks heartbeats according to their pacing.
+
+        :param announcer.scheduler.HeartbeatScheduler scheduler:
+        :param list check_ids:
+        """
+        now = scheduler.clock()
+        for check_id in check_ids:
+            if check_id in scheduler and check_id in self.checks:
+                scheduler.push(check_id, now + self.next_delay(check_id))
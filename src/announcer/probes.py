@@ -0,0 +1,146 @@
+import socket
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+from announcer.exceptions import AnnouncerImproperlyConfigured
+from announcer.utils import parse_duration
+
+# Probe check is registered as a TTL check: it expires if the probe isn't reported
+# for ``TTL_FACTOR`` intervals (plus timeout)
+TTL_FACTOR = 3
+
+# Consul default check timeout, in seconds
+DEFAULT_TIMEOUT = 10
+
+# Check keys that are handled by the probe (and removed from the registered TTL check).
+# ``tls_server_name`` isn't supported: certificates are verified against the URL host.
+PROBE_KEYS = ('http', 'tcp', 'interval', 'timeout', 'method', 'header', 'body',
+              'tls_skip_verify', 'tlsskipverify', 'disable_redirects', 'disableredirects',
+              'tls_server_name', 'tlsservername')
+
+
+class Probe(object):
+    """
+    HTTP or TCP check executed by the announcer (instead of Consul agent).
+
+    Results follow Consul rules: HTTP 2xx is "pass", 429 is "warn", anything else (or a timeout)
+    is "fail"; redirects are followed unless ``disable_redirects`` is set. TCP check passes
+    if the connection is established.
+    """
+    conf = None
+    kind = None
+    target = None
+    interval = None
+    timeout = None
+    method = None
+    headers = None
+    body = None
+    verify = None
+    redirects = None
+
+    def __init__(self, check_conf):
+        """
+        Initialize probe from Consul check config.
+
+        :param dict check_conf: HTTP or TCP check config.
+        :raises: AnnouncerImproperlyConfigured
+        """
+        self.conf = check_conf
+        self.kind = 'http' if 'http' in check_conf else 'tcp'
+        self.target = check_conf[self.kind]
+        if 'interval' not in check_conf:
+            raise AnnouncerImproperlyConfigured(
+                "\"interval\" is missing in {}".format(check_conf)
+            )
+        self.interval = parse_duration(check_conf['interval']).total_seconds()
+        self.timeout = DEFAULT_TIMEOUT
+        if 'timeout' in check_conf:
+            self.timeout = parse_duration(check_conf['timeout']).total_seconds()
+        self.timeout = min(self.timeout, self.interval)
+        self.method = check_conf.get('method', 'GET')
+        self.headers = dict(
+            (name, ', '.join(values) if isinstance(values, list) else values)
+            for name, values in (check_conf.get('header') or {}).items()
+        )
+        self.body = check_conf.get('body')
+        self.verify = not (
+            check_conf.get('tls_skip_verify') or check_conf.get('tlsskipverify')
+        )
+        self.redirects = not (
+            check_conf.get('disable_redirects') or check_conf.get('disableredirects')
+        )
+
+    @staticmethod
+    def is_probe(check_conf):
+        """
+        :param dict check_conf: Consul check config.
+        :return: True if it's an HTTP or TCP check.
+        :rtype: bool
+        """
+        return ('http' in check_conf or 'tcp' in check_conf) and 'ttl' not in check_conf
+
+    def ttl_check(self, check_conf):
+        """
+        Convert the check config to a TTL check config (to register in Consul agent).
+
+        :param dict check_conf: HTTP or TCP check config.
+        :rtype: requests.structures.CaseInsensitiveDict
+        """
+        ttl_check = CaseInsensitiveDict(
+            (key, value) for key, value in check_conf.items() if key.lower() not in PROBE_KEYS
+        )
+        ttl_check['ttl'] = '{}s'.format(self.interval * TTL_FACTOR + self.timeout)
+        return ttl_check
+
+    def run(self, session):
+        """
+        Execute the probe.
+
+        :param requests.Session session: HTTP session (pool of connections) for HTTP probes.
+        :return: Status ("pass", "warn" or "fail") & note.
+        :rtype: tuple
+        """
+        if self.kind == 'http':
+            return self.run_http(session)
+        return self.run_tcp()
+
+    def run_http(self, session):
+        note = "HTTP {} {}".format(self.method, self.target)
+        try:
+            response = session.request(
+                self.method, self.target, headers=self.headers, data=self.body,
+                timeout=self.timeout, verify=self.verify, allow_redirects=self.redirects
+            )
+        except requests.RequestException as e:
+            return 'fail', "{}: {}".format(note, e)
+        note = "{}: {} {}".format(note, response.status_code, response.reason)
+        if 200 <= response.status_code < 300:
+            return 'pass', note
+        if response.status_code == 429:
+            return 'warn', note
+        return 'fail', note
+
+    def run_tcp(self):
+        host, _, port = self.target.rpartition(':')
+        note = "TCP connect {}".format(self.target)
+        try:
+            sock = socket.create_connection((host.strip('[]'), int(port)), self.timeout)
+        except (socket.error, ValueError) as e:
+            return 'fail', "{}: {}".format(note, e)
+        sock.close()
+        return 'pass', "{}: Success".format(note)
+
+
+def create_session(pool_size):
+    """
+    Create HTTP session for probes with a pool of persistent connections.
+
+    :param int pool_size: Max number of persistent connections per host.
+    :rtype: requests.Session
+    """
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
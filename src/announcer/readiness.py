@@ -0,0 +1,118 @@
+import logging
+import os
+
+from announcer.exceptions import AnnouncerImproperlyConfigured
+from announcer.probes import Probe, create_session
+from announcer.utils import monotonic
+
+logger = logging.getLogger(__name__)
+
+
+class ReadinessProbe(object):
+    """
+    Readiness probe of the invoked process: services are kept in maintenance mode
+    (they are critical) until it succeeds, so traffic arrives only after the process
+    has warmed up (see ``announcer.service.Service.check_readiness``).
+
+    Probe kinds (by the spec):
+
+    - ``tcp:host:port`` - the port is connectable
+    - ``http://...`` or ``https://...`` - HTTP 2xx response
+    - ``file:/path`` - the file exists
+    - ``health`` - the process sends ``ready`` to the health socket
+      (see ``announcer.health.HealthSocket``)
+    """
+    # Delay between probe attempts (and their timeout), in seconds
+    interval = 1
+
+    spec = None
+    kind = None
+    target = None
+    probe = None
+    session = None
+    health = None
+    clock = None
+    deadline = None
+    ready = False
+
+    def __init__(self, spec, health=None, clock=monotonic):
+        """
+        Initialize readiness probe.
+
+        :param str spec: Probe spec: ``tcp:host:port``, ``http(s)://...``, ``file:/path``
+                         or ``health``.
+        :param health: Health socket (required for ``health`` probe).
+        :type health: announcer.health.HealthSocket or None
+        :param clock: Function that returns current time in seconds.
+        :raises: AnnouncerImproperlyConfigured
+        """
+        self.spec = spec
+        self.clock = clock
+        self.kind, _, self.target = spec.partition(':')
+        if self.kind in ('http', 'https'):
+            self.kind, self.target = 'http', spec
+        interval = '{}s'.format(self.interval)
+        if self.kind in ('http', 'tcp') and self.target:
+            self.probe = Probe({self.kind: self.target, 'interval': interval})
+        elif self.kind == 'health' and not self.target:
+            if health is None:
+                raise AnnouncerImproperlyConfigured(
+                    "Readiness probe \"health\" requires the health socket"
+                )
+            self.health = health
+        elif self.kind != 'file' or not self.target:
+            raise AnnouncerImproperlyConfigured(
+                "Readiness probe must be one of: tcp:host:port, http(s)://..., file:/path, "
+                "health; got \"{}\"".format(spec)
+            )
+
+    def is_due(self):
+        """
+        :return: True if the process isn't ready yet and it's time to probe it again.
+        :rtype: bool
+        """
+        return not self.ready and (self.deadline is None or self.clock() >= self.deadline)
+
+    def time_left(self):
+        """
+        :return: Time until the next probe attempt in seconds.
+        :rtype: float
+        """
+        return 0 if self.deadline is None else max(self.deadline - self.clock(), 0)
+
+    def check(self):
+        """
+        Probe the process (the next attempt is due in ``self.interval``).
+
+        :return: True if the process is ready.
+        :rtype: bool
+        """
+        self.deadline = self.clock() + self.interval
+        if self.probe is not None:
+            if self.probe.kind == 'http' and self.session is None:
+                self.session = create_session(1)
+            status, note = self.probe.run(self.session)
+            logger.debug("Readiness probe: {}".format(note))
+            self.ready = status == 'pass'
+        elif self.health is not None:
+            self.ready = self.health.ready
+        else:
+            self.ready = os.path.exists(self.target)
+        return self.ready
+
+    def reset(self):
+        """
+        Probe the process again (e.g. it was restarted).
+        """
+        self.ready = False
+        self.deadline = None
+        if self.health is not None:
+            self.health.ready = False
+
+    def close(self):
+        """
+        Close HTTP connections of the probe.
+        """
+        if self.session is not None:
+            self.session.close()
+            self.session = None
@@ -0,0 +1,171 @@
+import logging
+import random
+import threading
+import time
+
+from requests.exceptions import ConnectionError, Timeout
+
+from announcer.exceptions import AnnouncerAgentUnavailable
+from announcer.utils import monotonic
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitBreaker(object):
+    """
+    Consul agent circuit breaker. Thread-safe.
+
+    - closed: requests are allowed
+    - open: after ``failure_threshold`` consecutive failures requests are rejected
+      for ``reset_timeout`` seconds, so an unavailable agent isn't hammered
+    - half-open: after that requests are allowed again - the first success closes the circuit,
+      the first failure opens it again
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    failure_threshold = 5
+    reset_timeout = 10
+
+    clock = None
+    lock = None
+    failures = 0
+    opened = None
+
+    def __init__(self, clock=monotonic):
+        """
+        Initialize the circuit breaker.
+
+        :param clock: Function that returns current time in seconds.
+        """
+        self.clock = clock
+        self.lock = threading.Lock()
+
+    @property
+    def state(self):
+        """
+        :return: ``CLOSED``, ``OPEN`` or ``HALF_OPEN``.
+        :rtype: str
+        """
+        if self.opened is None:
+            return self.CLOSED
+        if self.clock() - self.opened < self.reset_timeout:
+            return self.OPEN
+        return self.HALF_OPEN
+
+    def check(self):
+        """
+        :raises: AnnouncerAgentUnavailable if the circuit is open.
+        """
+        if self.state == self.OPEN:
+            raise AnnouncerAgentUnavailable(
+                "Consul agent is unavailable, requests are suspended for {} sec".format(
+                    self.reset_timeout
+                )
+            )
+
+    def record(self, success):
+        """
+        Record the result of a request.
+
+        :param bool success: False if Consul agent is unreachable.
+        """
+        with self.lock:
+            if success:
+                if self.opened is not None:
+                    logger.info("Consul agent is available again")
+                self.failures = 0
+                self.opened = None
+                return
+            self.failures += 1
+            if self.state == self.HALF_OPEN or (
+                self.opened is None and self.failures >= self.failure_threshold
+            ):
+                logger.warning(
+                    "Consul agent is unavailable, suspending requests for {} sec".format(
+                        self.reset_timeout
+                    )
+                )
+                self.opened = self.clock()
+
+
+class Resilience(object):
+    """
+    Resilience layer around Consul agent requests: bounded retries with jittered exponential
+    backoff & a circuit breaker (shared by all the requests).
+
+    Only the requests that failed to reach the agent (``errors``) are retried - if the agent
+    has responded (even with an error), it's up and running.
+    """
+    backoff = 0.1
+    max_backoff = 5
+
+    breaker = None
+    errors = None
+    retries = None
+
+    def __init__(self, retries=2, errors=(ConnectionError, Timeout), breaker=None):
+        """
+        Initialize the resilience layer.
+
+        :param int retries: Max number of retries of every request.
+        :param tuple errors: Exception classes that mean Consul agent is unreachable.
+        :param breaker: Circuit breaker. If None - a new one is created.
+        :type breaker: CircuitBreaker or None
+        """
+        self.retries = retries
+        self.errors = errors
+        self.breaker = CircuitBreaker() if breaker is None else breaker
+
+    def delay(self, attempt):
+        """
+        Calculate the delay before a retry: random, up to exponentially growing backoff
+        ("full jitter"), so announcers don't reconnect to a restarted agent all at once.
+
+        :param int attempt: Number of the failed attempt, starting from 0.
+        :return: Delay in seconds.
+        :rtype: float
+        """
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    def failed(self, attempt, error):
+        """
+        Record a failed attempt.
+
+        :param int attempt: Number of the failed attempt, starting from 0.
+        :param Exception error:
+        :return: True if the request should be retried.
+        :rtype: bool
+        """
+        self.breaker.record(False)
+        if attempt >= self.retries or self.breaker.state == self.breaker.OPEN:
+            return False
+        logger.debug("Consul agent request failed (attempt {}): {}".format(attempt + 1, error))
+        return True
+
+    def call(self, request):
+        """
+        Make a request to Consul agent, retry it if the agent is unreachable.
+
+        :param request: Function (without arguments) that makes the request.
+        :return: Request result.
+        :raises: AnnouncerAgentUnavailable if the circuit is open.
+        """
+        attempt = 0
+        while True:
+            self.breaker.check()
+            try:
+                result = request()
+            except self.errors as e:
+                if not self.failed(attempt, e):
+                    raise
+                time.sleep(self.delay(attempt))
+                attempt += 1
+            except Exception:
+                # The agent has responded (with an error) - it's reachable
+                self.breaker.record(True)
+                raise
+            else:
+                self.breaker.record(True)
+                return result
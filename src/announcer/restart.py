@@ -0,0 +1,54 @@
+import signal
+
+MODES = ('no', 'on-failure', 'always')
+
+# Signals that stop the announcer: the process terminated by them isn't restarted
+STOP_SIGNALS = (signal.SIGTERM, signal.SIGINT, signal.SIGQUIT)
+
+
+class RestartPolicy(object):
+    """
+    When & how soon to restart the invoked process after it exits:
+
+    - "no": never
+    - "on-failure": if it exits with non-zero code
+    - "always": whatever the exit code is
+
+    Restarts are delayed with exponential backoff: 1, 2, 4... sec (max ``max_delay``).
+    The backoff is reset if the process has been running for at least ``reset_after`` seconds.
+    """
+    min_delay = 1
+    max_delay = 60
+    reset_after = 60
+
+    mode = None
+    restarts = 0
+
+    def __init__(self, mode='no'):
+        """
+        :param str mode: "no", "on-failure" or "always".
+        """
+        self.mode = mode
+
+    def should_restart(self, returncode):
+        """
+        :param int returncode: Exit code of the process.
+        :rtype: bool
+        """
+        if self.mode == 'always':
+            return True
+        return self.mode == 'on-failure' and returncode != 0
+
+    def next_delay(self, uptime):
+        """
+        Calculate the delay before the next restart.
+
+        :param float uptime: How long the process has been running, in seconds.
+        :return: Delay in seconds.
+        :rtype: float
+        """
+        if uptime >= self.reset_after:
+            self.restarts = 0
+        delay = min(self.min_delay * 2 ** self.restarts, self.max_delay)
+        self.restarts += 1
+        return delay
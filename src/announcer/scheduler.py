@@ -0,0 +1,169 @@
+import hashlib
+import heapq
+import os
+import random
+import socket
+
+from announcer.utils import monotonic
+
+
+def get_instance_seed():
+    """
+    :return: Seed that differs between announcer instances: host name & PID.
+    :rtype: str
+    """
+    return '{}:{}'.format(socket.gethostname(), os.getpid())
+
+
+class HeartbeatScheduler(object):
+    """
+    Deadline-based scheduler of TTL check heartbeats.
+
+    Every check is refreshed right away (so it isn't critical after the registration) and then
+    on its own cadence. Deadlines are stored in a heap, so finding the next due check doesn't
+    depend on the number of checks.
+
+    Removed (or re-added) checks leave outdated entries in the heap - they are skipped
+    when they reach the top.
+
+    If ``spread`` is set, heartbeats don't fire in bursts, neither within one announcer
+    nor across many instances started at once (e.g. by a deploy):
+
+    - the first refresh is still right away, the second one comes after the check's phase:
+      a deterministic offset within the interval, hashed from the check ID & ``seed``
+      (see ``self.phase``)
+    - every next refresh comes up to ``max_jitter`` of the interval earlier (never later),
+      so the phases don't line up again over time
+    """
+    max_jitter = 0.1
+
+    clock = None
+    spread = False
+    seed = None
+    random = None
+    intervals = None
+    phases = None
+    deadlines = None
+    heap = None
+
+    def __init__(self, clock=monotonic, spread=False, seed=None):
+        """
+        Initialize the scheduler.
+
+        :param clock: Function that returns current time in seconds.
+        :param bool spread: Spread heartbeats with phase offsets & jitter.
+        :param seed: Phase & jitter seed. If None - host name & PID of the announcer.
+        :type seed: str or None
+        """
+        self.clock = clock
+        self.spread = spread
+        self.seed = get_instance_seed() if seed is None else seed
+        self.random = random.Random(self.seed)
+        self.intervals = {}
+        self.phases = {}
+        self.deadlines = {}
+        self.heap = []
+
+    def __len__(self):
+        return len(self.intervals)
+
+    def __contains__(self, check_id):
+        return check_id in self.intervals
+
+    def add(self, check_id, interval, delay=None):
+        """
+        Schedule a check to be refreshed every ``interval`` seconds.
+
+        :param str check_id:
+        :param float interval: Refresh interval in seconds.
+        :param delay: Delay before the first refresh in seconds. If None - the check is due
+                      right away (and if ``self.spread`` is set, the second refresh comes
+                      after its phase instead of the interval).
+        :type delay: float or None
+        """
+        self.intervals[check_id] = interval
+        if delay is None and self.spread:
+            self.phases[check_id] = self.phase(check_id, interval)
+        else:
+            self.phases.pop(check_id, None)
+        self.push(check_id, self.clock() + (delay or 0))
+
+    def phase(self, check_id, interval):
+        """
+        :param str check_id:
+        :param float interval: Refresh interval in seconds.
+        :return: Phase offset of the check within ``interval``, in seconds: the same for the same
+                 check & ``self.seed``, uniformly distributed otherwise.
+        :rtype: float
+        """
+        data = '{}:{}'.format(self.seed, check_id).encode('utf-8')
+        return interval * int(hashlib.sha1(data).hexdigest()[:8], 16) / float(1 << 32)
+
+    def next_interval(self, check_id):
+        """
+        :param str check_id:
+        :return: Time until the next refresh of the check: its interval
+                 (minus jitter if ``self.spread`` is set), in seconds.
+        :rtype: float
+        """
+        interval = self.intervals[check_id]
+        if self.spread:
+            interval *= 1 - self.max_jitter * self.random.random()
+        return interval
+
+    def remove(self, check_id):
+        """
+        Stop refreshing a check.
+
+        :param str check_id:
+        """
+        self.intervals.pop(check_id, None)
+        self.phases.pop(check_id, None)
+        self.deadlines.pop(check_id, None)
+
+    def push(self, check_id, deadline):
+        """
+        Set the next refresh time of a check.
+
+        :param str check_id:
+        :param float deadline: Refresh time (in ``self.clock`` terms).
+        """
+        self.deadlines[check_id] = deadline
+        heapq.heappush(self.heap, (deadline, check_id))
+
+    def prune(self):
+        """
+        Drop outdated entries from the top of the heap.
+        """
+        while self.heap and self.deadlines.get(self.heap[0][1]) != self.heap[0][0]:
+            heapq.heappop(self.heap)
+
+    def next_deadline(self):
+        """
+        Get the time when the next check is due.
+
+        :return: Deadline (in ``self.clock`` terms) or None if nothing is scheduled.
+        :rtype: float or None
+        """
+        self.prune()
+        return self.heap[0][0] if self.heap else None
+
+    def pop_due(self):
+        """
+        Pop all the checks that are due and schedule their next refresh
+        (after the phase, if it's the first refresh of a spread check).
+
+        :return: Due check IDs, the most overdue first.
+        :rtype: list
+        """
+        now = self.clock()
+        due = []
+        self.prune()
+        while self.heap and self.heap[0][0] <= now:
+            deadline, check_id = heapq.heappop(self.heap)
+            due.append(check_id)
+            self.prune()
+        for check_id in due:
+            phase = self.phases.pop(check_id, None)
+            self.push(check_id, now + (self.next_interval(check_id) if phase is None else phase))
+        return due
@@ -1,45 +1,201 @@
 import json
 import logging
+import os
 import signal
 import subprocess
-import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 
-import consul
-from consul.base import CB
+from consul.base import CB, ConsulException
+from requests.exceptions import ConnectionError, RequestException, Timeout
 from requests.structures import CaseInsensitiveDict
 
-from announcer.exceptions import AnnouncerImproperlyConfigured
-from announcer.utils import parse_duration
+from announcer.agent import Consul, map_requests, map_ttl_checks, parse_agent_address
+from announcer.cache import ConfigCache, FingerprintCache
+from announcer.exceptions import AnnouncerAgentUnavailable, AnnouncerImproperlyConfigured
+from announcer.health import ENV_VARIABLE, HealthSocket
+from announcer.load import LoadMonitor
+from announcer.metrics import Metrics, MetricsExporter
+from announcer.pacing import HeartbeatPacer
+from announcer.probes import Probe, create_session
+from announcer.readiness import ReadinessProbe
+from announcer.resilience import Resilience
+from announcer.restart import STOP_SIGNALS, RestartPolicy
+from announcer.scheduler import HeartbeatScheduler
+from announcer.utils import Waker, monotonic, parse_duration
+from announcer.watch import AgentWatch
 
 logger = logging.getLogger(__name__)
 
+# ID of the check that Consul agent adds to a service in maintenance mode
+MAINTENANCE_CHECK = '_service_maintenance:{}'
+
 
 class Service(object):
+    # Consul agent is unreachable - such requests are retried (see ``self.resilience``)
+    connection_errors = (ConnectionError, Timeout)
+    # Any failed Consul agent request
+    agent_errors = (RequestException, ConsulException, AnnouncerAgentUnavailable)
+    # Delay between retries of failed registrations (in seconds)
+    registration_retry = 5
+
     consul = None
     cmd = None
     config = None
+    config_cache = None
+    config_source = None
+    drain = 0
+    drain_deadline = None
+    drain_signal = None
+    draining = False
+    executor = None
+    fingerprints = None
+    health = None
     interval = None
+    load = None
+    # Serializes registrations: the poll loop & ``self.watch`` may register services at once
+    lock = None
+    maintenance = None
+    metrics = None
+    metrics_exporter = None
+    pacer = None
+    payloads = None
+    probe_executor = None
+    probe_session = None
+    probes = None
     process = None
+    readiness = None
+    process_exited = None
+    refresh_interval = None
+    registration_deadline = None
+    reload_requested = False
+    reload_signal = None
+    resilience = None
+    restart_policy = None
+    scheduler = None
     services = None
+    spread = False
+    started = None
+    stopping = False
     ttl_checks = None
+    ttl_factor = None
+    unregistered = None
+    waker = None
+    watch = None
 
-    def __init__(self, agent_address, config, cmd, token=None, interval=1):
+    def __init__(self, agent_address, config, cmd, token=None, interval=1, ttl_factor=10,
+                 workers=10, timeout=None, pool_size=None, keep_alive=True, cache=None,
+                 metrics_address=None, metrics_file=None, pacing='fixed', retries=2,
+                 health_socket=None, probes=False, reload=False, restart='no', drain=0,
+                 config_cache=None, spread=False, watch=False, ready=None, load=None):
         """
         Initialize consul-announcer service.
 
-        :param str agent_address: Agent address in a form: "hostname:port" (port is optional).
+        :param str agent_address: Agent address in a form: "hostname:port" (port is optional)
+                                  or "unix:/path/to/socket".
         :param config: Consul configuration JSON. If starts with @ - considered as file path.
         :param list cmd: Command to invoke in , e.g.: ['uwsgi', '--ini=...']". No daemons allowed.
         :param token: Consul ACL token.
         :type token: str or None
-        :param interval: Polling interval in seconds. If None - auto-calculated as min TTL / 10.
+        :param interval: Polling interval in seconds. If None - auto-calculated as min TTL / 10
+                         and every TTL check is refreshed on its own cadence:
+                         TTL / ``ttl_factor``.
         :type interval: float or None
+        :param float ttl_factor: How many times per TTL each check is refreshed
+                                 (when ``interval`` is None).
+        :param int workers: Max number of concurrent requests to Consul agent.
+        :param timeout: Consul agent request timeout in seconds. If None - wait forever.
+        :type timeout: float or None
+        :param pool_size: Max number of persistent connections to Consul agent.
+                          If None - equals to ``workers``.
+        :type pool_size: int or None
+        :param bool keep_alive: Reuse connections to Consul agent.
+        :param cache: Fingerprint cache file path. If set - services that are still registered
+                      in Consul agent with the same definition are not registered again.
+        :type cache: str or None
+        :param metrics_address: Metrics HTTP endpoint address: "host:port" (host is optional).
+        :type metrics_address: str or None
+        :param metrics_file: Metrics file path (for node_exporter textfile collector).
+        :type metrics_file: str or None
+        :param str pacing: "fixed" - TTL checks are refreshed every ``interval`` (or TTL /
+                           ``ttl_factor``); "adaptive" - after the first heartbeat each check
+                           is paced by Consul agent latency & TTL headroom
+                           (see ``announcer.pacing.HeartbeatPacer``).
+        :param int retries: Max number of retries of a request when Consul agent is unreachable
+                            (see ``announcer.resilience.Resilience``).
+        :param health_socket: Unix socket path the invoked process reports TTL checks status to
+                              (see ``announcer.health.HealthSocket``).
+        :type health_socket: str or None
+        :param bool probes: Execute HTTP & TCP checks in the announcer (instead of Consul agent)
+                            and register them as TTL checks (see ``announcer.probes.Probe``).
+        :param bool reload: Reload ``config`` on SIGHUP (instead of passing it to the invoked
+                            process), see ``self.reload``.
+        :param str restart: Restart the invoked process after it exits: "no", "on-failure"
+                            or "always" (see ``announcer.restart.RestartPolicy``). Services stay
+                            registered (in maintenance mode) while the process is restarted.
+        :param float drain: On a termination signal, put services in maintenance mode and pass
+                            the signal to the invoked process after this delay, in seconds
+                            (see ``self.drain_services``). If 0 - the signal is passed right away.
+        :param config_cache: Compiled config cache file path. If set - unchanged ``config``
+                             isn't parsed again (see ``announcer.cache.ConfigCache``).
+        :type config_cache: str or None
+        :param bool spread: Spread TTL checks heartbeats with deterministic phase offsets
+                            & jitter, so they don't fire in bursts
+                            (see ``announcer.scheduler.HeartbeatScheduler``).
+        :param bool watch: Watch Consul agent state with blocking queries and register lost
+                           services again right away (see ``announcer.watch.AgentWatch``).
+        :param ready: Readiness probe of the invoked process: ``tcp:host:port``,
+                      ``http(s)://...``, ``file:/path`` or ``health``. If set - services are
+                      in maintenance mode until it succeeds
+                      (see ``announcer.readiness.ReadinessProbe``).
+        :type ready: str or None
+        :param load: Load thresholds of the invoked process, e.g. "cpu=90,rss=2G,queue=100".
+                     If set - passing TTL checks are reported as warning while the process
+                     is overloaded (see ``announcer.load.LoadMonitor``).
+        :type load: str or None
         """
         logger.info("Initializing service")
-        self.consul = consul.Consul(*agent_address.split(':', 1), token=token)
+        self.connect(agent_address, token, workers, {
+            'timeout': timeout,
+            'pool_size': workers if pool_size is None else pool_size,
+            'keep_alive': keep_alive
+        }, watch)
+        if cache and self.fingerprints is None:
+            self.fingerprints = FingerprintCache(cache)
+        if config_cache and self.config_cache is None:
+            self.config_cache = ConfigCache(config_cache)
+        if self.metrics is None:
+            self.metrics = Metrics()
+        self.metrics_exporter = MetricsExporter(self.metrics, metrics_address, metrics_file)
+        if pacing == 'adaptive' and self.pacer is None:
+            self.pacer = HeartbeatPacer()
+        if self.resilience is None:
+            self.resilience = Resilience(retries, self.connection_errors)
+        if health_socket and self.health is None:
+            self.health = HealthSocket(health_socket)
+        self.readiness = ReadinessProbe(ready, self.health) if ready else None
+        self.load = LoadMonitor(load) if load else None
+        if probes:
+            self.probes = {}
+            if self.probe_session is None:
+                self.probe_session = create_session(workers)
+                # Probes have their own workers, so they don't delay other heartbeats
+                self.probe_executor = ThreadPoolExecutor(max_workers=workers)
+        if reload:
+            self.reload_signal = signal.SIGHUP
+        self.restart_policy = RestartPolicy(restart)
+        self.drain = drain
+        self.maintenance = {}
+        self.unregistered = set()
+        self.spread = spread
         self.cmd = cmd
+        self.ttl_factor = ttl_factor
+        self.config_source = config
+        self.refresh_interval = interval
         self.parse_services(config)
         self.parse_interval(interval)
+        self.schedule_checks(interval)
 
     def run(self):
         """
@@ -47,15 +203,75 @@ class Service(object):
 
         - register services & checks in Consul
         - invoke a subprocess
-        - poll it (keep it alive in Consul)
+        - poll it (keep it alive in Consul), restart it according to ``self.restart_policy``
         - deregister services after subprocess is finished
         """
+        self.metrics_exporter.start()
         try:
             self.register_services()
+            if self.readiness is not None:
+                self.suspend_until_ready()
+            if self.watch is not None:
+                self.watch.start(self.restore_services, self.lock)
+            if self.health is not None:
+                self.health.start(self.report_health)
             self.invoke_process()
             self.poll()
+            while self.restart_process():
+                self.poll()
         finally:
+            if self.watch is not None:
+                self.watch.stop()
+            if self.health is not None:
+                self.health.stop()
             self.deregister_services()
+            self.disconnect()
+            self.metrics_exporter.stop()
+
+    def connect(self, agent_address, token, workers, http_options, watch=False):
+        """
+        Create Consul agent client, a pool of workers for concurrent requests
+        and the lock of registrations.
+
+        :param str agent_address: Agent address in a form: "hostname:port" (port is optional)
+                                  or "unix:/path/to/socket".
+        :param token: Consul ACL token.
+        :type token: str or None
+        :param int workers: Max number of concurrent requests to Consul agent.
+        :param dict http_options: HTTP client options: timeout, pool size, etc.
+        :param bool watch: Create ``self.watch`` with its own client (for blocking queries).
+        """
+        host, port, unix_socket = parse_agent_address(agent_address)
+        http_options = dict(http_options, unix_socket=unix_socket)
+        self.consul = Consul(host, port, token=token, http_options=http_options)
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.lock = threading.RLock()
+        if watch:
+            self.watch = AgentWatch(Consul(host, port, token=token, http_options=dict(
+                http_options, timeout=AgentWatch.timeout, pool_size=1
+            )))
+
+    def disconnect(self):
+        """
+        Release resources allocated in ``self.connect``.
+        """
+        self.log_connection_stats()
+        self.executor.shutdown(wait=False)
+        if self.probe_session is not None:
+            self.probe_session.close()
+            self.probe_executor.shutdown(wait=False)
+        if self.readiness is not None:
+            self.readiness.close()
+        if self.waker is not None:
+            self.waker.close()
+
+    def log_connection_stats(self):
+        """
+        Log how many connections to Consul agent were created and reused.
+        """
+        logger.info("Consul agent connections: {new} new, {reused} reused".format(
+            **self.consul.http.connection_stats()
+        ))
 
     def parse_services(self, config):
         """
@@ -64,36 +280,113 @@ class Service(object):
         See https://www.consul.io/docs/agent/services.html
         and https://www.consul.io/docs/agent/checks.html.
 
+        If ``self.config_cache`` is set, the compiled config is taken from the cache (or saved
+        to it after parsing). Full validation against Consul schema is done by ``--check``
+        (see ``announcer.validation``).
+
         :param str config: Consul configuration JSON. If starts with @ - considered as file path.
         :raises: AnnouncerValidationError
         """
         self.services = {}
         self.ttl_checks = {}
+        self.payloads = {}
+        if self.probes is not None:
+            self.probes = {}
 
-        if config[0] == '@':
-            logger.info("Parsing services definition in \"{}\" config file".format(config[1:]))
-            with open(config[1:]) as f:
-                self.config = json.load(f, object_hook=CaseInsensitiveDict)
-        else:
-            logger.info("Parsing services definition: {}".format(config))
-            self.config = json.loads(config, object_hook=CaseInsensitiveDict)
+        config = self.read_config(config)
+        key = None
+        if self.config_cache is not None:
+            key = self.config_cache.key(
+                config, probes=self.probes is not None, ready=self.readiness is not None
+            )
+            if self.load_compiled_config(self.config_cache.get(key)):
+                return
+
+        self.config = json.loads(config, object_hook=CaseInsensitiveDict)
+        for service_conf in self.get_service_confs():
+            self.parse_service(service_conf)
 
+        if not self.services:
+            raise AnnouncerImproperlyConfigured(
+                "Please specify either \"service\" config or non-empty \"services\" list"
+            )
+
+        if key is not None:
+            self.config_cache.put(key, self.compile_config())
+
+    def get_service_confs(self):
+        """
+        :return: Service configs from "service" & "services" keys of ``self.config``.
+        :rtype: list
+        :raises: AnnouncerImproperlyConfigured
+        """
+        service_confs = []
         if 'service' in self.config:
-            self.parse_service(self.config['service'])
+            service_confs.append(self.config['service'])
 
         if 'services' in self.config:
             if not isinstance(self.config['services'], list):
                 raise AnnouncerImproperlyConfigured(
                     "\"services\" must be an array in {}".format(self.config)
                 )
+            service_confs.extend(self.config['services'])
+        return service_confs
 
-            for service_conf in self.config['services']:
-                self.parse_service(service_conf)
+    @staticmethod
+    def read_config(config):
+        """
+        :param str config: Consul configuration JSON. If starts with @ - considered as file path.
+        :return: Consul configuration JSON.
+        :rtype: str
+        """
+        if config[0] != '@':
+            logger.info("Parsing services definition: {}".format(config))
+            return config
+        logger.info("Parsing services definition in \"{}\" config file".format(config[1:]))
+        with open(config[1:]) as f:
+            return f.read()
 
-        if not self.services:
-            raise AnnouncerImproperlyConfigured(
-                "Please specify either \"service\" config or non-empty \"services\" list"
+    def compile_config(self):
+        """
+        :return: Compiled config for ``self.config_cache``: services, TTLs of TTL checks,
+                 probes (their check configs) & register payloads.
+        :rtype: dict
+        """
+        return {
+            'services': self.services,
+            'ttl_checks': self.ttl_checks,
+            'probes': dict(
+                (check_id, dict((key.lower(), value) for key, value in probe.conf.items()))
+                for check_id, probe in (self.probes or {}).items()
+            ),
+            'payloads': dict(
+                (service_id, self.get_payload(service_id)) for service_id in self.services
             )
+        }
+
+    def load_compiled_config(self, compiled):
+        """
+        Load the compiled config (see ``self.compile_config``) instead of parsing the config.
+
+        :param compiled: Compiled config or None if it's not cached.
+        :type compiled: dict or None
+        :return: True if the compiled config was loaded.
+        :rtype: bool
+        """
+        if compiled is None:
+            return False
+        self.config = None
+        self.services = compiled['services']
+        self.ttl_checks = compiled['ttl_checks']
+        self.payloads = compiled['payloads']
+        if self.probes is not None:
+            self.probes = dict(
+                (check_id, Probe(conf)) for check_id, conf in compiled['probes'].items()
+            )
+        logger.info("Services definition is loaded from the config cache: {} services".format(
+            len(self.services)
+        ))
+        return True
 
     def parse_service(self, service_conf):
         """
@@ -125,7 +418,9 @@ class Service(object):
         self.services[service_id] = service_conf
 
         if 'check' in service_conf:
-            self.parse_check(service_conf['check'], 'service:{}'.format(service_id))
+            service_conf['check'] = self.parse_check(
+                service_conf['check'], 'service:{}'.format(service_id)
+            )
 
         if 'checks' in service_conf:
             if not isinstance(service_conf['checks'], list):
@@ -133,21 +428,36 @@ class Service(object):
                     "\"checks\" must be an array in {}".format(service_conf)
                 )
 
-            for i, check_conf in enumerate(service_conf['checks'], 1):
+            service_conf['checks'] = [
                 self.parse_check(check_conf, 'service:{}:{}'.format(service_id, i))
+                for i, check_conf in enumerate(service_conf['checks'], 1)
+            ]
 
     def parse_check(self, check_conf, check_id):
         """
         Parse Consul check config.
 
-        No validation. TTL checks are detected & stored in ``self.ttl_checks``.
+        No validation. TTL checks are detected & stored in ``self.ttl_checks``
+        (with their TTL in seconds). If probes are enabled, HTTP & TCP checks are stored
+        in ``self.probes`` and converted to TTL checks. If the readiness probe is set, checks
+        are registered critical (the process isn't ready yet).
 
         :param dict check_conf: Check config
         :param str check_id: When check is inside service, its Name & ID are auto-generated
                              from service Name & ID
+        :return: Check config to register in Consul agent.
+        :rtype: dict
         """
+        if self.probes is not None and Probe.is_probe(check_conf):
+            probe = Probe(check_conf)
+            self.probes[check_id] = probe
+            check_conf = probe.ttl_check(check_conf)
         if 'ttl' in check_conf:
-            self.ttl_checks[check_id] = check_conf
+            self.ttl_checks[check_id] = parse_duration(check_conf['ttl']).total_seconds()
+        if self.readiness is not None:
+            # The service isn't routable before it's put in maintenance mode
+            check_conf['status'] = 'critical'
+        return check_conf
 
     def parse_interval(self, interval):
         """
@@ -182,45 +492,677 @@ class Service(object):
         elif interval is None:
             raise AnnouncerImproperlyConfigured("Polling interval is undefined")
 
+    def schedule_checks(self, interval):
+        """
+        Schedule TTL checks heartbeats in ``self.scheduler`` (a new one, if it's not set yet).
+
+        - If ``interval`` is ``None`` - each check is refreshed every TTL / ``self.ttl_factor``
+        - If it's not ``None`` - all the checks are refreshed every ``interval``
+        - Probes are executed (and reported) every check ``interval`` from their config
+
+        :param interval: Polling interval in seconds.
+        :type interval: float or None
+        """
+        if self.scheduler is None:
+            self.scheduler = HeartbeatScheduler(spread=self.spread)
+        for check_id, ttl in self.ttl_checks.items():
+            self.metrics.add_check(check_id, ttl)
+            if self.health is not None:
+                self.health.add_check(check_id, ttl)
+            probe = self.probes.get(check_id) if self.probes else None
+            if probe is not None:
+                check_interval = probe.interval
+            elif interval is None:
+                check_interval = ttl / self.ttl_factor
+            else:
+                check_interval = interval
+            if self.pacer is not None and probe is None:
+                self.pacer.add(check_id, ttl)
+            logger.debug("TTL check \"{}\" is refreshed every {} sec".format(
+                check_id, check_interval
+            ))
+            self.scheduler.add(check_id, check_interval)
+
+    def reload(self):
+        """
+        Reload services config without restarting the invoked process: only changed (or new)
+        services are registered, removed services are deregistered, TTL checks are rescheduled.
+        """
+        with self.lock:
+            self.reload_services()
+
+    def reload_services(self):
+        """
+        Reload services config and apply the changes to Consul agent (see ``self.reload``).
+        """
+        changes = self.reload_config()
+        if changes is None:
+            return
+        changed, removed = changes
+        if removed:
+            self.map(self.deregister_service, removed)
+            self.forget_services(removed)
+        if changed:
+            if self.fingerprints is not None:
+                self.fingerprints.journal(changed)
+            results = self.map(self.register_service, changed)
+            if self.fingerprints is not None:
+                self.remember_services(changed, results)
+
+    def reload_config(self):
+        """
+        Parse services config again (see ``self.config_source``) and reschedule TTL checks.
+        If the new config is broken, the current one is kept.
+
+        :return: IDs of changed (or new) & removed services or None if the config is broken.
+        :rtype: tuple or None
+        """
+        logger.info("Reloading services config")
+        state = (
+            self.config, self.services, self.ttl_checks, self.probes, self.payloads, self.interval
+        )
+        try:
+            self.parse_services(self.config_source)
+            self.parse_interval(self.refresh_interval)
+        except (AnnouncerImproperlyConfigured, IOError, OSError, ValueError) as e:
+            logger.error("Can't reload services config, keeping the current one: {}".format(e))
+            (self.config, self.services, self.ttl_checks, self.probes, self.payloads,
+             self.interval) = state
+            return None
+
+        old_services, old_ttl_checks = state[1:3]
+        for check_id in old_ttl_checks:
+            self.scheduler.remove(check_id)
+            self.metrics.remove_check(check_id)
+            if self.pacer is not None:
+                self.pacer.remove(check_id)
+            if self.health is not None:
+                self.health.remove_check(check_id)
+        self.schedule_checks(self.refresh_interval)
+
+        changed = [service_id for service_id, service_conf in self.services.items()
+                   if old_services.get(service_id) != service_conf]
+        removed = [service_id for service_id in old_services if service_id not in self.services]
+        if changed:
+            # Checks of the registered again services are critical until they are passed
+            now = self.scheduler.clock()
+            for check_id in self.ttl_checks:
+                self.scheduler.push(check_id, now)
+        logger.info("Services config is reloaded: {} changed, {} removed".format(
+            len(changed), len(removed)
+        ))
+        return changed, removed
+
     def get_min_ttl(self):
         """
         Find the minimum TTL value among all TTL checks.
-        :return: TTL value in seconds
-        :rtype: float
+        :return: TTL value in seconds or None if there are no TTL checks.
+        :rtype: float or None
         """
-        min_ttl = None
-        for check in self.ttl_checks.values():
-            ttl = parse_duration(check['ttl']).total_seconds()
-            if min_ttl is None or ttl < min_ttl:
-                min_ttl = ttl
-        return min_ttl
+        return min(self.ttl_checks.values()) if self.ttl_checks else None
 
     def register_services(self):
         """
-        Register services in Consul agent.
+        Register services in Consul agent (concurrently).
         """
         logger.info("Registering Consul services")
+        with self.lock:
+            if self.fingerprints is None:
+                self.map(self.register_service, list(self.services))
+            else:
+                agent_services = self.get_agent_services()
+                self.remove_orphans(agent_services)
+                service_ids = self.outdated_services(agent_services or {})
+                self.fingerprints.journal(service_ids)
+                self.remember_services(service_ids, self.map(self.register_service, service_ids))
+                self.release_maintenance(self.get_skipped_services(agent_services, service_ids))
+
+    def get_agent_services(self):
+        """
+        Get services registered in Consul agent.
+
+        :return: Services by ID or None if the request has failed.
+        :rtype: dict or None
+        """
+        try:
+            return self.resilience.call(partial(
+                self.consul.http.get,
+                CB.json(), '/v1/agent/services', params={'token': self.consul.token}
+            ))
+        except self.agent_errors as e:
+            logger.warning("Can't get services registered in Consul agent: {}".format(e))
+
+    def get_agent_checks(self):
+        """
+        Get checks registered in Consul agent.
+
+        :return: Checks by ID or None if the request has failed.
+        :rtype: dict or None
+        """
+        try:
+            return self.resilience.call(partial(
+                self.consul.http.get,
+                CB.json(), '/v1/agent/checks', params={'token': self.consul.token}
+            ))
+        except self.agent_errors as e:
+            logger.warning("Can't get checks registered in Consul agent: {}".format(e))
+
+    def replay_registrations(self, agent_services=None):
+        """
+        Register services that are missing in Consul agent again: e.g. the agent was restarted
+        and lost them or it was unreachable when the services were registered.
+
+        Services in maintenance mode (waiting for readiness, drained or restarted) are put
+        in maintenance mode again: the agent has lost it with the services.
+
+        Replays are serialized with ``self.lock``: the poll loop (failed heartbeats) and
+        ``self.watch`` notice a restarted agent at once.
+
+        :param agent_services: Services registered in Consul agent, by ID. If None - requested.
+        :type agent_services: dict or None
+        :return: True if any active (not in maintenance mode) service was registered again -
+                 its TTL checks should be passed right away.
+        :rtype: bool
+        """
+        with self.lock:
+            if agent_services is None:
+                agent_services = self.get_agent_services()
+                if agent_services is None:
+                    return False
+            service_ids = self.get_missing_services(agent_services)
+            if not service_ids:
+                return False
+            results = self.map(self.register_service, service_ids)
+            if self.fingerprints is not None:
+                self.remember_services(service_ids, results)
+            registered, maintained = self.split_maintained(service_ids, results)
+            self.map(self.restore_maintenance, maintained)
+            return bool(registered)
+
+    def get_missing_services(self, agent_services):
+        """
+        :param dict agent_services: Services registered in Consul agent, by ID.
+        :return: IDs of the services missing in Consul agent.
+        :rtype: list
+        """
+        service_ids = [service_id for service_id in self.services
+                       if service_id not in agent_services]
+        if service_ids:
+            logger.warning("Services are missing in Consul agent, registering them again: "
+                           "{}".format(', '.join(service_ids)))
+        return service_ids
+
+    def split_maintained(self, service_ids, results):
+        """
+        :param list service_ids:
+        :param list results: Registration result (True/False) for every service.
+        :return: IDs of the registered services: active ones & ones in maintenance mode.
+        :rtype: tuple
+        """
+        registered = [service_id for service_id, success in zip(service_ids, results) if success]
+        maintained = [service_id for service_id in registered if service_id in self.maintenance]
+        active = [service_id for service_id in registered if service_id not in maintained]
+        return active, maintained
+
+    def restore_maintenance(self, service_id):
+        """
+        Put the registered again service in maintenance mode (with the same reason).
+
+        :param str service_id:
+        :return: True if the maintenance mode was switched.
+        :rtype: bool
+        """
+        logger.info("Putting service \"{}\" in maintenance mode again".format(service_id))
+        return self.maintain_service(service_id, True, self.maintenance[service_id])
+
+    def restore_services(self):
+        """
+        Register services that are missing in Consul agent again and mark their TTL checks
+        right away (unless the services are in maintenance mode). Called by ``self.watch``
+        when the agent state may have changed.
+        """
+        with self.lock:
+            if self.replay_registrations():
+                # Checks of the registered again services are critical until they are passed
+                check_ids = list(self.ttl_checks)
+                self.log_ttl_checks(check_ids, self.map_ttl_checks(check_ids))
+
+    def find_orphans(self, agent_services, service_ids=None):
+        """
+        Find services registered by the previous run of the announcer that are not in the config
+        anymore (see ``self.fingerprints``): e.g. it was killed, had no chance to deregister them
+        and was started again with a changed config.
+
+        :param dict agent_services: Services registered in Consul agent, by ID.
+        :param service_ids: IDs of the services that should be registered.
+                            If None - ``self.services``.
+        :return: IDs of orphaned services still registered in the agent & already missing there.
+        :rtype: tuple
+        """
+        orphans = self.fingerprints.orphans(self.services if service_ids is None else service_ids)
+        registered = [service_id for service_id in orphans if service_id in agent_services]
+        return registered, [service_id for service_id in orphans if service_id not in registered]
+
+    def remove_orphans(self, agent_services, service_ids=None):
+        """
+        Deregister orphaned services (see ``self.find_orphans``) and drop them from the journal.
+
+        :param agent_services: Services registered in Consul agent, by ID.
+                               If None (unknown) - nothing is done.
+        :type agent_services: dict or None
+        :param service_ids: IDs of the services that should be registered.
+                            If None - ``self.services``.
+        :type service_ids: list or None
+        """
+        if agent_services is None:
+            return
+        registered, missing = self.find_orphans(agent_services, service_ids)
+        if registered:
+            logger.warning("Deregistering services left by the previous run: {}".format(
+                ', '.join(registered)
+            ))
+            results = self.map(self.deregister_service, registered)
+            missing += [service_id for service_id, success in zip(registered, results) if success]
+        if missing:
+            self.forget_services(missing)
+
+    def outdated_services(self, agent_services):
+        """
+        Find services that need to be registered: missing in Consul agent
+        or changed since the last registration (see ``self.fingerprints``).
+
+        :param dict agent_services: Services registered in Consul agent, by ID.
+        :return: Service IDs.
+        :rtype: list
+        """
+        service_ids = []
         for service_id, service_conf in self.services.items():
-            logger.debug("Registering service \"{}\": {}".format(service_id, service_conf))
-            # Use low-level ``self.consul.http`` instead of ``self.consul.agent.service.register``
-            # because we don't want to parse the service config - we just pass it as-is.
-            success = self.consul.http.put(
-                CB.bool(),
-                '/v1/agent/service/register',
-                params={'token': self.consul.token},
-                data=json.dumps(service_conf, default=dict)
+            if service_id in agent_services and self.fingerprints.is_fresh(
+                service_id, service_conf
+            ):
+                logger.info("Service \"{}\" is up to date, skipping registration".format(
+                    service_id
+                ))
+            else:
+                service_ids.append(service_id)
+        return service_ids
+
+    def get_skipped_services(self, agent_services, service_ids):
+        """
+        :param agent_services: Services registered in Consul agent, by ID.
+                               If None (unknown) - all the services were registered.
+        :type agent_services: dict or None
+        :param list service_ids: IDs of the registered (outdated) services.
+        :return: IDs of the services skipped as up to date, that may be left in maintenance mode
+                 by the previous run. Empty if ``self.readiness`` is set: services are
+                 in maintenance mode until the process is ready anyway.
+        :rtype: list
+        """
+        if agent_services is None or self.readiness is not None:
+            return []
+        return [service_id for service_id in self.services if service_id not in service_ids]
+
+    def find_maintained(self, service_ids, agent_checks):
+        """
+        :param list service_ids:
+        :param dict agent_checks: Checks registered in Consul agent, by ID.
+        :return: IDs of the services in maintenance mode in Consul agent.
+        :rtype: list
+        """
+        maintained = [service_id for service_id in service_ids
+                      if MAINTENANCE_CHECK.format(service_id) in agent_checks]
+        if maintained:
+            logger.warning("Services are left in maintenance mode by the previous run, "
+                           "taking them out of it: {}".format(', '.join(maintained)))
+        return maintained
+
+    def release_maintenance(self, service_ids, agent_checks=None):
+        """
+        Take services skipped as up to date out of maintenance mode left by the previous run
+        of the announcer: e.g. it was killed while the process was restarted or drained.
+        The mode isn't a part of the fingerprint and isn't known to this run.
+
+        :param list service_ids: See ``self.get_skipped_services``.
+        :param agent_checks: Checks registered in Consul agent, by ID. If None - requested.
+        :type agent_checks: dict or None
+        """
+        if not service_ids:
+            return
+        if agent_checks is None:
+            agent_checks = self.get_agent_checks() or {}
+        self.map(
+            partial(self.maintain_service, enable=False),
+            self.find_maintained(service_ids, agent_checks)
+        )
+
+    def remember_services(self, service_ids, results):
+        """
+        Save fingerprints of the registered services.
+
+        :param list service_ids:
+        :param list results: Registration result (True/False) for every service.
+        """
+        for service_id, success in zip(service_ids, results):
+            if success:
+                self.fingerprints.update(service_id, self.services[service_id])
+            else:
+                self.fingerprints.discard(service_id)
+        self.fingerprints.save()
+
+    def forget_services(self, service_ids):
+        """
+        Drop fingerprints of the deregistered services.
+
+        :param list service_ids:
+        """
+        if self.fingerprints is not None:
+            for service_id in service_ids:
+                self.fingerprints.discard(service_id)
+            self.fingerprints.save()
+
+    def register_service(self, service_id):
+        """
+        Register service in Consul agent.
+
+        :param str service_id:
+        :return: True if the service was registered.
+        :rtype: bool
+        """
+        logger.debug("Registering service \"{}\": {}".format(
+            service_id, self.services[service_id]
+        ))
+        start = monotonic()
+        success = False
+        try:
+            success = self.call_agent('register', self.get_register_request(service_id))
+        finally:
+            # Request errors are logged by ``self.map``
+            self.track_registration(service_id, success)
+        self.log_request_result(service_id, 'registered', success, start)
+        return success
+
+    def track_registration(self, service_id, success):
+        """
+        Remember services that failed to register: they are registered again from the poll loop
+        every ``self.registration_retry`` seconds (see ``self.retry_registrations``).
+
+        :param str service_id:
+        :param bool success: Registration result.
+        """
+        if success:
+            self.unregistered.discard(service_id)
+        else:
+            self.unregistered.add(service_id)
+            self.registration_deadline = monotonic() + self.registration_retry
+
+    def get_failed_registrations(self):
+        """
+        :return: IDs of the services that failed to register if it's time to retry.
+        :rtype: list
+        """
+        if not self.unregistered or monotonic() < self.registration_deadline:
+            return []
+        # The next retry is scheduled by ``self.track_registration`` if this one fails
+        self.registration_deadline = monotonic() + self.registration_retry
+        service_ids = [service_id for service_id in self.services
+                       if service_id in self.unregistered]
+        if service_ids:
+            logger.info("Retrying registration of services: {}".format(', '.join(service_ids)))
+        return service_ids
+
+    def retry_registrations(self):
+        """
+        Register services that failed to register (e.g. Consul agent was unavailable at startup)
+        again, regardless of TTL checks: services without them aren't registered by heartbeats.
+        TTL checks are due right away, maintenance mode is restored.
+        """
+        with self.lock:
+            service_ids = self.get_failed_registrations()
+            if not service_ids:
+                return
+            results = self.map(self.register_service, service_ids)
+            if self.fingerprints is not None:
+                self.remember_services(service_ids, results)
+            registered, maintained = self.split_maintained(service_ids, results)
+            self.map(self.restore_maintenance, maintained)
+        if registered:
+            self.schedule_now()
+
+    def schedule_now(self):
+        """
+        Make all the TTL checks due right away.
+        """
+        now = self.scheduler.clock()
+        for check_id in self.ttl_checks:
+            self.scheduler.push(check_id, now)
+
+    def get_register_request(self, service_id):
+        """
+        Service registration request (the same for all the engines).
+
+        :param str service_id:
+        :return: Function (without arguments) that makes the request.
+        """
+        # Use low-level ``self.consul.http`` instead of ``self.consul.agent.service.register``
+        # because we don't want to parse the service config - we just pass it as-is.
+        return partial(
+            self.consul.http.put,
+            CB.bool(),
+            '/v1/agent/service/register',
+            params={'token': self.consul.token},
+            data=self.get_payload(service_id)
+        )
+
+    def get_deregister_request(self, service_id):
+        """
+        Service deregistration request (the same for all the engines).
+
+        :param str service_id:
+        :return: Function (without arguments) that makes the request.
+        """
+        return partial(self.consul.agent.service.deregister, service_id)
+
+    @staticmethod
+    def log_request_result(service_id, action, success, start):
+        """
+        :param str service_id:
+        :param str action: "registered" or "deregistered".
+        :param bool success: Request result.
+        :param float start: Request start time (``announcer.utils.monotonic``).
+        """
+        if success:
+            logger.info("Service \"{}\" was {} in {:.3f} sec".format(
+                service_id, action, monotonic() - start
+            ))
+        else:
+            logger.warning("Service \"{}\" was not {}".format(service_id, action))
+
+    def get_payload(self, service_id):
+        """
+        :param str service_id:
+        :return: Service registration payload (serialized once).
+        :rtype: str
+        """
+        payload = self.payloads.get(service_id)
+        if payload is None:
+            payload = self.payloads[service_id] = json.dumps(
+                self.services[service_id], default=dict
             )
-            if not success:
-                logger.warning("Service \"{}\" was not registered".format(service_id))
+        return payload
 
     def invoke_process(self):
         """
         Invoke the sub-process to monitor.
         """
         logger.info("Starting process: {}".format(' '.join(self.cmd)))
-        self.process = subprocess.Popen(self.cmd)
+        self.process = subprocess.Popen(self.cmd, env=self.get_process_env())
+        self.started = monotonic()
+        self.metrics.process_started(self.process.pid)
+        self.process_exited = threading.Event()
+        if self.waker is None:
+            self.waker = Waker()
+        waiter = threading.Thread(target=self.wait_process, name='process-waiter')
+        waiter.daemon = True
+        waiter.start()
         self.handle_signals()
 
+    def restart_process(self):
+        """
+        Restart the exited process (with a delay) according to ``self.restart_policy``.
+        Services are in maintenance mode until the process is invoked again.
+
+        :return: True if the process was restarted.
+        :rtype: bool
+        """
+        delay = self.get_restart_delay()
+        if delay is None:
+            return False
+        self.suspend_services(delay)
+        deadline = monotonic() + delay
+        while monotonic() < deadline:
+            # Termination signals wake it up (see ``self.handle_signal``)
+            self.waker.wait(max(deadline - monotonic(), 0))
+            if self.stopping:
+                return False
+        self.invoke_process()
+        self.resume_services()
+        return True
+
+    def get_restart_delay(self):
+        """
+        :return: Delay before restarting the exited process in seconds or None if it shouldn't
+                 be restarted: the policy says so or the announcer is stopping.
+        :rtype: float or None
+        """
+        if self.stopping or not self.restart_policy.should_restart(self.process.returncode):
+            return None
+        return self.restart_policy.next_delay(monotonic() - self.started)
+
+    def suspend_services(self, delay):
+        """
+        Put services in maintenance mode (they are critical) while the process is restarted.
+
+        :param float delay: Delay before the restart in seconds.
+        """
+        reason = "Process exited with code {}, restarting in {} sec".format(
+            self.process.returncode, delay
+        )
+        logger.warning(reason)
+        return self.set_maintenance(True, reason)
+
+    def resume_services(self):
+        """
+        Take services out of maintenance mode after the process is restarted
+        (or when it's ready, if ``self.readiness`` is set).
+        Health reports of the previous process are dropped.
+        """
+        if self.health is not None:
+            for check_id in self.ttl_checks:
+                self.health.reset(check_id)
+        if self.readiness is not None:
+            return self.suspend_until_ready()
+        return self.activate_services()
+
+    def activate_services(self):
+        """
+        Take services out of maintenance mode. TTL checks are due right away.
+        """
+        self.schedule_now()
+        return self.set_maintenance(False)
+
+    def suspend_until_ready(self):
+        """
+        Put services in maintenance mode (they are critical) until the invoked process
+        is ready (see ``self.check_readiness``).
+        """
+        self.readiness.reset()
+        logger.info("Waiting for the process to be ready: {}".format(self.readiness.spec))
+        return self.set_maintenance(True, "Waiting for the process to be ready")
+
+    def check_readiness(self):
+        """
+        Probe the invoked process (if it's not ready yet) and take services out of maintenance
+        mode once it's ready. Services being drained are left in maintenance mode.
+        """
+        if self.readiness is None or self.draining or not self.readiness.is_due():
+            return
+        if self.readiness.check():
+            logger.info("The process is ready in {:.3f} sec".format(monotonic() - self.started))
+            self.activate_services()
+
+    def set_maintenance(self, enable, reason=None):
+        """
+        Enable or disable maintenance mode of all the services (concurrently).
+
+        :param bool enable:
+        :param reason: Human-readable maintenance reason.
+        :type reason: str or None
+        :return: Result (True/False) for every service.
+        :rtype: list
+        """
+        return self.map(
+            partial(self.maintain_service, enable=enable, reason=reason), list(self.services)
+        )
+
+    def maintain_service(self, service_id, enable, reason=None):
+        """
+        Enable or disable service maintenance mode in Consul agent.
+
+        :param str service_id:
+        :param bool enable:
+        :param reason: Human-readable maintenance reason.
+        :type reason: str or None
+        :return: True if the maintenance mode was switched.
+        :rtype: bool
+        """
+        # Remember the mode: it's restored if the agent loses the service
+        if enable:
+            self.maintenance[service_id] = reason
+        else:
+            self.maintenance.pop(service_id, None)
+        return self.call_agent('maintenance', partial(
+            self.consul.agent.service.maintenance, service_id, 'true' if enable else 'false',
+            reason
+        ))
+
+    def get_process_env(self):
+        """
+        :return: Environment of the invoked process: the health socket path is passed
+                 in ``CONSUL_ANNOUNCER_HEALTH_SOCKET`` variable. None - inherit the environment.
+        :rtype: dict or None
+        """
+        if self.health is None:
+            return None
+        return dict(os.environ, **{ENV_VARIABLE: self.health.path})
+
+    def wait_process(self):
+        """
+        Wait for the invoked process termination and set ``self.process_exited`` event.
+
+        Runs in a separate thread, so the termination is detected immediately.
+        """
+        self.process.wait()
+        logger.info("Process with PID {} exited with code {}".format(
+            self.process.pid, self.process.returncode
+        ))
+        self.metrics.process_exited(self.process.pid)
+        self.notify_exited()
+
+    def notify_exited(self):
+        """
+        Set ``self.process_exited`` event and wake up the poll loop.
+        """
+        self.process_exited.set()
+        self.wake_up()
+
+    def wake_up(self):
+        """
+        Wake up the poll loop (see ``self.waker``): safe to call from signal handlers
+        and other threads.
+        """
+        if self.waker is not None:
+            self.waker.wake()
+
     def handle_signals(self):
         """
         Transparently pass all the incoming signals to the invoked process.
@@ -238,59 +1180,296 @@ class Service(object):
 
     def handle_signal(self, signal_number, *args):
         """
-        OS signal listener that passes the signal to the invoked process.
+        OS signal listener that passes the signal to the invoked process
+        (except for ``self.reload_signal`` - it requests config reload).
+        Termination signals also cancel the process restart. The first one is passed after
+        the services are drained (if ``self.drain`` is set), the next ones - right away.
 
         :param int signal_number:
         :param args:
         """
-        self.process.send_signal(signal_number)
+        if signal_number == self.reload_signal:
+            self.request_reload()
+            return
+        if signal_number in STOP_SIGNALS:
+            stopping, self.stopping = self.stopping, True
+            # The process restart is cancelled (see ``self.restart_process``)
+            self.wake_up()
+            if self.drain and not stopping and self.process.returncode is None:
+                self.request_drain(signal_number)
+                return
+        if self.process.returncode is None:
+            self.process.send_signal(signal_number)
 
-    def poll(self):
+    def request_reload(self):
+        """
+        Request config reload: it's done by ``self.poll`` - not in the signal handler,
+        which may interrupt a heartbeat.
+        """
+        self.reload_requested = True
+        self.wake_up()
+
+    def request_drain(self, signal_number):
+        """
+        Request services drain: it's done by ``self.poll`` (see ``self.request_reload``),
+        the signal is passed to the invoked process in ``self.drain`` seconds.
+
+        :param int signal_number: Termination signal.
         """
-        Check if invoked process is still running and mark all related TTL checks as passed.
+        self.drain_deadline = monotonic() + self.drain
+        self.drain_signal = signal_number
+        self.wake_up()
+
+    def drain_services(self):
+        """
+        Put services in maintenance mode (so clients stop sending new requests to them)
+        before the invoked process is terminated.
         """
-        logger.info("Start polling the process with PID {} every {} sec".format(
-            self.process.pid, self.interval
+        logger.warning("Draining services for {} sec before stopping the process".format(
+            self.drain
         ))
+        self.draining = True
+        return self.set_maintenance(True, "The process is stopping")
+
+    def pass_drained_signal(self):
+        """
+        Pass the termination signal to the invoked process after the services are drained.
+        """
+        signal_number, self.drain_signal = self.drain_signal, None
+        if self.process.returncode is None:
+            logger.info("Services are drained, passing signal {} to the process".format(
+                signal_number
+            ))
+            self.process.send_signal(signal_number)
+
+    def get_poll_timeout(self):
+        """
+        :return: Time until the next heartbeat (the end of services drain, registration retry
+                 or readiness probe attempt) in seconds. None if nothing is pending: the poll
+                 loop is woken up by the process exit & signals (see ``self.waker``).
+        :rtype: float or None
+        """
+        timeouts = []
+        deadline = self.scheduler.next_deadline()
+        if deadline is not None:
+            timeouts.append(deadline - self.scheduler.clock())
+        if self.drain_signal is not None:
+            timeouts.append(self.drain_deadline - monotonic())
+        if self.unregistered:
+            timeouts.append(self.registration_deadline - monotonic())
+        if self.readiness is not None and not self.readiness.ready and not self.draining:
+            timeouts.append(self.readiness.time_left())
+        return max(min(timeouts), 0) if timeouts else None
+
+    def poll(self):
+        """
+        Mark due TTL checks as passed until the invoked process is finished.
+
+        TTL checks are refreshed according to ``self.scheduler``. Between heartbeats
+        (or all the time if there are no TTL checks) we just wait for ``self.waker``:
+        the process exit or a signal.
+        """
+        logger.info("Start polling the process with PID {}".format(self.process.pid))
+        if not self.ttl_checks:
+            logger.debug("No TTL checks registered")
 
         while True:
-            time.sleep(self.interval)
-            if self.process.poll() is None:
-                self.pass_ttl_checks()
-            else:
+            self.waker.wait(self.get_poll_timeout())
+            if self.process_exited.is_set():
                 break
+            if self.reload_requested:
+                self.reload_requested = False
+                self.reload()
+            if self.drain_signal is not None:
+                if not self.draining:
+                    self.drain_services()
+                if monotonic() >= self.drain_deadline:
+                    self.pass_drained_signal()
+            self.check_readiness()
+            self.retry_registrations()
+            due = self.scheduler.pop_due()
+            if due:
+                self.pass_ttl_checks(due)
 
-    def pass_ttl_checks(self):
+    def pass_ttl_checks(self, check_ids=None):
         """
-        Mark all the registered TTL checks as passed.
+        Mark the registered TTL checks as passed.
+
+        :param check_ids: IDs of TTL checks to mark. If None - all the registered TTL checks.
+        :type check_ids: list or None
         """
         if self.ttl_checks:
-            statuses = []
-            for check_id in self.ttl_checks:
-                success = self.pass_ttl_check(check_id)
-                statuses.append('\"{}\" - {}'.format(check_id, 'passed' if success else 'failed'))
-            logger.debug("Updating TTL checks: {}".format(', '.join(statuses)))
+            check_ids = list(self.ttl_checks if check_ids is None else check_ids)
+            results = self.map_ttl_checks(check_ids)
+            self.log_ttl_checks(check_ids, results)
+            failed = [check_id for check_id, success in zip(check_ids, results) if not success]
+            if failed and self.replay_registrations():
+                # Checks of the registered again services are critical until they are passed
+                self.log_ttl_checks(failed, self.map_ttl_checks(failed))
+            if self.pacer is not None:
+                self.pacer.reschedule(self.scheduler, check_ids)
+            self.metrics_exporter.export()
         else:
             logger.debug("No TTL checks registered")
 
+    @staticmethod
+    def log_ttl_checks(check_ids, results):
+        """
+        Log TTL checks update results.
+
+        :param list check_ids:
+        :param list results: Update result (True/False) for every check.
+        """
+        statuses = []
+        for check_id, success in zip(check_ids, results):
+            statuses.append('\"{}\" - {}'.format(check_id, 'passed' if success else 'failed'))
+        logger.debug("Updating TTL checks: {}".format(', '.join(statuses)))
+
+    def report_health(self, check_ids):
+        """
+        Send the status of TTL checks reported by the invoked process to Consul agent
+        (concurrently). Called by ``self.health`` for every batch of reports.
+
+        :param list check_ids:
+        """
+        check_ids = [check_id for check_id in check_ids if check_id in self.ttl_checks]
+        self.log_ttl_checks(check_ids, self.map_ttl_checks(check_ids))
+
+    def get_check_status(self, check_id):
+        """
+        :param str check_id:
+        :return: TTL check status ("pass", "warn" or "fail") & note (or None): the probe result
+                 for probes, otherwise "pass" unless the invoked process reports otherwise
+                 to ``self.health``. Passing checks are "warn" while the invoked process
+                 is overloaded (see ``self.load``).
+        :rtype: tuple
+        """
+        if self.probes and check_id in self.probes:
+            status, note = self.probes[check_id].run(self.probe_session)
+        elif self.health is None:
+            status, note = 'pass', None
+        else:
+            status, note = self.health.status(check_id)
+        if status == 'pass' and self.load is not None and self.process is not None:
+            load_status, load_note = self.load.status(self.process.pid, self.get_ports())
+            if load_status != 'pass':
+                return load_status, load_note
+        return status, note
+
+    def get_ports(self):
+        """
+        :return: Ports of the services (their listen queue is monitored by ``self.load``).
+        :rtype: list
+        """
+        return [value for service_conf in self.services.values()
+                for key, value in service_conf.items() if key.lower() == 'port']
+
     def pass_ttl_check(self, check_id):
         """
-        Mark specified TTL check as passed.
+        Mark specified TTL check as passed (or with the status reported by the invoked process,
+        or with the probe result).
+
+        :param str check_id:
+        """
+        status, note = self.get_check_status(check_id)
+        return self.update_ttl_check(check_id, status, note)
+
+    def update_ttl_check(self, check_id, status, note=None):
+        """
+        Set TTL check status in Consul agent.
 
         :param str check_id:
+        :param str status: "pass", "warn" or "fail".
+        :param note: Human-readable status description.
+        :type note: str or None
+        :return: True if the check was updated.
+        :rtype: bool
+        """
+        request = getattr(self.consul.agent.check, 'ttl_{}'.format(status))
+        return self.call_agent('heartbeat', partial(request, check_id, note), check_id)
+
+    def call_agent(self, operation, request, check_id=None):
         """
-        return self.consul.agent.check.ttl_pass(check_id)
+        Make a request to Consul agent (through ``self.resilience``: it's retried if the agent
+        is unreachable) and record its duration & result in ``self.metrics``.
+
+        :param str operation: "register", "deregister", "heartbeat" or "maintenance".
+        :param request: Function (without arguments) that makes the request.
+        :param check_id: TTL check ID (for heartbeats).
+        :type check_id: str or None
+        :return: Request result.
+        """
+        start = monotonic()
+        success = False
+        try:
+            success = self.resilience.call(request)
+            return success
+        finally:
+            self.record_request(operation, monotonic() - start, success, check_id)
+
+    def record_request(self, operation, duration, success, check_id=None):
+        """
+        Record Consul agent request in ``self.metrics`` (and heartbeat in ``self.pacer``).
+
+        :param str operation: "register", "deregister" or "heartbeat".
+        :param float duration: Request duration in seconds.
+        :param bool success: Request result.
+        :param check_id: TTL check ID (for heartbeats).
+        :type check_id: str or None
+        """
+        self.metrics.observe(operation, duration, success, check_id)
+        if self.pacer is not None and check_id is not None:
+            self.pacer.observe(check_id, duration, success)
+
+    def map(self, func, items):
+        """
+        Call ``func`` for every item concurrently (using ``self.executor``).
+
+        Consul agent request timeouts & errors are logged and the result is ``False``
+        for such items. Other exceptions are re-raised.
+
+        :param func: Function that makes a request to Consul agent.
+        :param list items: ``func`` arguments.
+        :return: Results in the same order as ``items``.
+        :rtype: list
+        """
+        return map_requests(self.executor, func, items)
+
+    def map_ttl_checks(self, check_ids):
+        """
+        Mark TTL checks concurrently: probes are executed by their own workers
+        (see ``announcer.agent.map_ttl_checks``).
+
+        :param list check_ids:
+        :return: Result (True/False) for every check.
+        :rtype: list
+        """
+        return map_ttl_checks(
+            self.executor, self.probe_executor, self.pass_ttl_check, check_ids, self.probes or ()
+        )
 
     def deregister_services(self):
         """
-        Deregister services in Consul agent.
+        Deregister services in Consul agent (concurrently).
         """
         logger.info("Deregistering Consul services")
-        for service_id in self.services:
-            logger.debug("Deregistering service \"{}\"".format(service_id))
-            success = self.consul.agent.service.deregister(service_id)
-            if not success:
-                logger.warning("Service \"{}\" was not deregistered".format(service_id))
+        with self.lock:
+            self.map(self.deregister_service, list(self.services))
+            self.forget_services(list(self.services))
+
+    def deregister_service(self, service_id):
+        """
+        Deregister service in Consul agent.
+
+        :param str service_id:
+        :return: True if the service was deregistered.
+        :rtype: bool
+        """
+        logger.debug("Deregistering service \"{}\"".format(service_id))
+        start = monotonic()
+        success = self.call_agent('deregister', self.get_deregister_request(service_id))
+        self.log_request_result(service_id, 'deregistered', success, start)
+        return success
 
     def __del__(self):
         """
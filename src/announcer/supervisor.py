@@ -0,0 +1,691 @@
+import json
+import logging
+import signal
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import six
+
+from announcer.agent import Consul, map_requests, map_ttl_checks, parse_agent_address
+from announcer.cache import ConfigCache, FingerprintCache
+from announcer.exceptions import AnnouncerImproperlyConfigured
+from announcer.health import HealthSocket
+from announcer.metrics import Metrics, MetricsExporter
+from announcer.pacing import HeartbeatPacer
+from announcer.probes import create_session
+from announcer.resilience import Resilience
+from announcer.restart import STOP_SIGNALS
+from announcer.scheduler import HeartbeatScheduler
+from announcer.service import Service
+from announcer.utils import Waker, monotonic
+from announcer.validation import check_process
+from announcer.watch import AgentWatch
+
+logger = logging.getLogger(__name__)
+
+
+class SupervisedService(Service):
+    """
+    Service (one child command) run by ``announcer.supervisor.Supervisor``.
+
+    Consul agent client, workers pool, heartbeats scheduler, resilience layer, health socket
+    and probes HTTP session are shared between all the supervised services, signals are handled
+    by the supervisor.
+    """
+    supervisor = None
+
+    def __init__(self, supervisor, config, cmd):
+        """
+        Initialize supervised service.
+
+        :param Supervisor supervisor:
+        :param str config: Consul configuration JSON. If starts with @ - considered as file path.
+        :param list cmd: Command to invoke, e.g.: ['uwsgi', '--ini=...']. No daemons allowed.
+        """
+        self.supervisor = supervisor
+        self.lock = supervisor.lock
+        self.scheduler = supervisor.scheduler
+        self.fingerprints = supervisor.fingerprints
+        self.config_cache = supervisor.config_cache
+        self.metrics = supervisor.metrics
+        self.pacer = supervisor.pacer
+        self.resilience = supervisor.resilience
+        self.health = supervisor.health
+        self.probe_session = supervisor.probe_session
+        self.probe_executor = supervisor.probe_executor
+        super(SupervisedService, self).__init__(
+            supervisor.agent_address, config, cmd,
+            interval=supervisor.interval, ttl_factor=supervisor.ttl_factor,
+            probes=supervisor.probe_session is not None, restart=supervisor.restart,
+            load=supervisor.load
+        )
+
+    def parse_services(self, config):
+        """
+        Parse Consul services config (see ``announcer.service.Service.parse_services``).
+        Service IDs must be unique across all the processes.
+        """
+        super(SupervisedService, self).parse_services(config)
+        for service_id in self.services:
+            if self.supervisor.services.get(service_id, self) is not self:
+                raise AnnouncerImproperlyConfigured(
+                    "Service ID \"{}\" is duplicated".format(service_id)
+                )
+
+    def connect(self, agent_address, token, workers, http_options, watch=False):
+        self.consul = self.supervisor.consul
+        self.executor = self.supervisor.executor
+
+    def disconnect(self):
+        pass
+
+    def handle_signals(self):
+        pass
+
+    def notify_exited(self):
+        """
+        Notify the supervisor about the process termination (``self.waker`` is its one).
+        """
+        self.process_exited.set()
+        self.supervisor.process_exited.set()
+        self.wake_up()
+
+
+class Supervisor(object):
+    """
+    Run many commands (each one with its own Consul services config) from one process.
+    """
+    agent_address = None
+    config_cache = None
+    consul = None
+    drain = 0
+    drain_deadline = None
+    drain_signal = None
+    draining = False
+    executor = None
+    fingerprints = None
+    health = None
+    interval = None
+    load = None
+    # See ``announcer.service.Service.lock`` (shared by all the processes)
+    lock = None
+    manifest = None
+    metrics = None
+    metrics_exporter = None
+    pacer = None
+    probe_executor = None
+    probe_session = None
+    process_exited = None
+    processes = None
+    reload_requested = False
+    reload_signal = None
+    resilience = None
+    restart = None
+    restarts = None
+    scheduler = None
+    services = None
+    stopping = False
+    ttl_factor = None
+    ttl_checks = None
+    waker = None
+    watch = None
+
+    def __init__(self, agent_address, manifest, token=None, interval=1, ttl_factor=10,
+                 workers=10, timeout=None, pool_size=None, keep_alive=True, cache=None,
+                 metrics_address=None, metrics_file=None, pacing='fixed', retries=2,
+                 health_socket=None, probes=False, reload=False, restart='no', drain=0,
+                 config_cache=None, spread=False, watch=False, load=None):
+        """
+        Initialize consul-announcer supervisor.
+
+        :param str agent_address: Agent address in a form: "hostname:port" (port is optional)
+                                  or "unix:/path/to/socket".
+        :param manifest: Manifest JSON: ``{"processes": [{"cmd": [...], "config": ...}, ...]}``.
+                         If starts with @ - considered as file path.
+        :param token: Consul ACL token.
+        :type token: str or None
+        :param interval: See ``announcer.service.Service``.
+        :type interval: float or None
+        :param float ttl_factor: See ``announcer.service.Service``.
+        :param int workers: Max number of concurrent requests to Consul agent (for all processes).
+        :param timeout: Consul agent request timeout in seconds. If None - wait forever.
+        :type timeout: float or None
+        :param pool_size: Max number of persistent connections to Consul agent.
+                          If None - equals to ``workers``.
+        :type pool_size: int or None
+        :param bool keep_alive: Reuse connections to Consul agent.
+        :param cache: Fingerprint cache file path (for all processes).
+                      See ``announcer.service.Service``.
+        :type cache: str or None
+        :param metrics_address: Metrics HTTP endpoint address (for all processes).
+                                See ``announcer.service.Service``.
+        :type metrics_address: str or None
+        :param metrics_file: Metrics file path (for all processes).
+        :type metrics_file: str or None
+        :param str pacing: "fixed" or "adaptive", see ``announcer.service.Service``.
+        :param int retries: Max number of retries of a request when Consul agent is unreachable.
+        :param health_socket: Unix socket path all the processes report TTL checks status to.
+                              See ``announcer.service.Service``.
+        :type health_socket: str or None
+        :param bool probes: Execute HTTP & TCP checks in the announcer,
+                            see ``announcer.service.Service``.
+        :param bool reload: Reload services configs of the processes on SIGHUP
+                            (instead of passing it to the processes).
+        :param str restart: Restart each process after it exits: "no", "on-failure" or "always",
+                            see ``announcer.service.Service``.
+        :param float drain: On a termination signal, put services of all the processes
+                            in maintenance mode and pass the signal to the processes after
+                            this delay, in seconds (see ``announcer.service.Service``).
+        :param config_cache: Compiled config cache file path (for all processes).
+                             See ``announcer.service.Service``.
+        :type config_cache: str or None
+        :param bool spread: Spread TTL checks heartbeats of all the processes,
+                            see ``announcer.service.Service``.
+        :param bool watch: Watch Consul agent state and register lost services of all
+                           the processes again right away, see ``announcer.service.Service``.
+        :param load: Load thresholds of each process, see ``announcer.service.Service``.
+        :type load: str or None
+        """
+        logger.info("Initializing supervisor")
+        self.agent_address = agent_address
+        self.interval = interval
+        self.ttl_factor = ttl_factor
+        host, port, unix_socket = parse_agent_address(agent_address)
+        http_options = {
+            'timeout': timeout,
+            'pool_size': workers if pool_size is None else pool_size,
+            'keep_alive': keep_alive,
+            'unix_socket': unix_socket
+        }
+        self.consul = Consul(host, port, token=token, http_options=http_options)
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.lock = threading.RLock()
+        if watch:
+            self.watch = AgentWatch(Consul(host, port, token=token, http_options=dict(
+                http_options, timeout=AgentWatch.timeout, pool_size=1
+            )))
+        self.scheduler = HeartbeatScheduler(spread=spread)
+        if cache:
+            self.fingerprints = FingerprintCache(cache)
+        if config_cache:
+            self.config_cache = ConfigCache(config_cache)
+        self.metrics = Metrics()
+        self.metrics_exporter = MetricsExporter(self.metrics, metrics_address, metrics_file)
+        if pacing == 'adaptive':
+            self.pacer = HeartbeatPacer()
+        self.resilience = Resilience(retries)
+        if health_socket:
+            self.health = HealthSocket(health_socket)
+        if probes:
+            self.probe_session = create_session(workers)
+            self.probe_executor = ThreadPoolExecutor(max_workers=workers)
+        if reload:
+            self.reload_signal = signal.SIGHUP
+        self.restart = restart
+        self.restarts = {}
+        self.drain = drain
+        self.load = load
+        self.parse_manifest(manifest)
+
+    def run(self):
+        """
+        Run the supervisor:
+
+        - register services & checks of all the processes in Consul
+        - invoke all the processes
+        - keep their TTL checks alive; deregister services of each process after it's finished
+          (or restart it according to the restart policy)
+        - deregister services of the rest of the processes on error
+        """
+        self.metrics_exporter.start()
+        try:
+            self.register_services()
+            if self.watch is not None:
+                self.watch.start(self.restore_services, self.lock)
+            if self.health is not None:
+                self.health.start(self.report_health)
+            self.invoke_processes()
+            self.poll()
+        finally:
+            if self.watch is not None:
+                self.watch.stop()
+            if self.health is not None:
+                self.health.stop()
+            self.deregister_services(list(self.services))
+            self.disconnect()
+            self.metrics_exporter.stop()
+
+    def disconnect(self):
+        """
+        Log Consul agent connections stats and shut down the workers.
+        """
+        logger.info("Consul agent connections: {new} new, {reused} reused".format(
+            **self.consul.http.connection_stats()
+        ))
+        self.executor.shutdown(wait=False)
+        if self.probe_session is not None:
+            self.probe_session.close()
+            self.probe_executor.shutdown(wait=False)
+        if self.waker is not None:
+            self.waker.close()
+
+    def parse_manifest(self, manifest):
+        """
+        Parse supervisor manifest and initialize a service for every process.
+
+        Supervised services are stored in ``self.processes``. Services & TTL checks (their IDs)
+        are mapped to their supervised services in ``self.services`` & ``self.ttl_checks``.
+
+        :param str manifest: Manifest JSON. If starts with @ - considered as file path.
+        :raises: AnnouncerImproperlyConfigured
+        """
+        if manifest[0] == '@':
+            logger.info("Parsing manifest in \"{}\" file".format(manifest[1:]))
+            with open(manifest[1:]) as f:
+                self.manifest = json.load(f)
+        else:
+            logger.info("Parsing manifest: {}".format(manifest))
+            self.manifest = json.loads(manifest)
+
+        processes = self.manifest.get('processes') if isinstance(self.manifest, dict) else None
+        if not processes or not isinstance(processes, list):
+            raise AnnouncerImproperlyConfigured(
+                "Please specify non-empty \"processes\" list in the manifest"
+            )
+
+        self.processes = []
+        self.services = {}
+        self.ttl_checks = {}
+        for process_conf in processes:
+            check_process(process_conf)
+            config = process_conf['config']
+            if not isinstance(config, six.string_types):
+                config = json.dumps(config)
+            service = SupervisedService(self, config, process_conf['cmd'])
+            self.processes.append(service)
+
+            self.map_services(service)
+
+    def map_services(self, service):
+        """
+        Map services & TTL checks (their IDs) of the supervised service to it.
+
+        :param SupervisedService service:
+        """
+        for service_id, owner in list(self.services.items()):
+            if owner is service and service_id not in service.services:
+                del self.services[service_id]
+        for check_id, owner in list(self.ttl_checks.items()):
+            if owner is service and check_id not in service.ttl_checks:
+                del self.ttl_checks[check_id]
+        for service_id in service.services:
+            self.services[service_id] = service
+        for check_id in service.ttl_checks:
+            self.ttl_checks[check_id] = service
+
+    def reload(self):
+        """
+        Reload services configs of the running processes (see
+        ``announcer.service.Service.reload``). The manifest itself isn't reloaded.
+        """
+        with self.lock:
+            for service in self.processes:
+                if not service.process_exited.is_set():
+                    service.reload()
+                    self.map_services(service)
+
+    def map(self, func, items):
+        """
+        Call ``func`` for every item concurrently (see ``announcer.agent.map_requests``).
+        """
+        return map_requests(self.executor, func, items)
+
+    def register_services(self):
+        """
+        Register services of all the processes in Consul agent (concurrently).
+        """
+        logger.info("Registering Consul services")
+        with self.lock:
+            if self.fingerprints is None:
+                self.map(self.register_service, list(self.services))
+            else:
+                self.reconcile_services()
+
+    def reconcile_services(self):
+        """
+        Register services of all the processes that are missing in Consul agent or changed
+        since the last registration, deregister orphaned services, take skipped services out
+        of maintenance mode left by the previous run
+        (see ``announcer.service.Service.register_services``).
+        """
+        agent_services = self.processes[0].get_agent_services()
+        self.processes[0].remove_orphans(agent_services, self.services)
+        outdated = [(service, service.outdated_services(agent_services or {}))
+                    for service in self.processes]
+        service_ids = [service_id for service, ids in outdated for service_id in ids]
+        self.fingerprints.journal(service_ids)
+        results = dict(zip(service_ids, self.map(self.register_service, service_ids)))
+        for service, ids in outdated:
+            service.remember_services(ids, [results[service_id] for service_id in ids])
+
+        skipped = [(service, service.get_skipped_services(agent_services, ids))
+                   for service, ids in outdated]
+        if any(ids for service, ids in skipped):
+            agent_checks = self.processes[0].get_agent_checks() or {}
+            for service, ids in skipped:
+                service.release_maintenance(ids, agent_checks)
+
+    def register_service(self, service_id):
+        return self.services[service_id].register_service(service_id)
+
+    def retry_registrations(self):
+        """
+        Register services of the running processes that failed to register again
+        (see ``announcer.service.Service.retry_registrations``).
+        """
+        for service in set(self.services.values()):
+            service.retry_registrations()
+
+    def invoke_processes(self):
+        """
+        Invoke all the processes.
+        """
+        self.process_exited = threading.Event()
+        # The poll loop is woken up by any process exit (see ``SupervisedService.notify_exited``)
+        self.waker = Waker()
+        for service in self.processes:
+            service.waker = self.waker
+            service.invoke_process()
+        self.handle_signals()
+
+    def handle_signals(self):
+        """
+        Transparently pass all the incoming signals to the invoked processes.
+        """
+        for i in dir(signal):
+            if i.startswith("SIG") and '_' not in i:
+                signum = getattr(signal, i)
+                try:
+                    signal.signal(signum, self.handle_signal)
+                except (RuntimeError, OSError, ValueError):
+                    # See ``announcer.service.Service.handle_signals``
+                    pass
+
+    def handle_signal(self, signal_number, *args):
+        """
+        OS signal listener that passes the signal to all the running processes.
+        The first termination signal is passed after the services are drained
+        (see ``announcer.service.Service.handle_signal``).
+
+        :param int signal_number:
+        :param args:
+        """
+        if signal_number == self.reload_signal:
+            # See ``announcer.service.Service.request_reload``
+            self.reload_requested = True
+            self.waker.wake()
+            return
+        if signal_number in STOP_SIGNALS:
+            stopping, self.stopping = self.stopping, True
+            # Restarts are cancelled, drain is started by the poll loop
+            self.waker.wake()
+            if self.drain and not stopping:
+                self.drain_deadline = monotonic() + self.drain
+                self.drain_signal = signal_number
+                return
+        self.pass_signal(signal_number)
+
+    def pass_signal(self, signal_number):
+        """
+        Pass the signal to all the running processes.
+
+        :param int signal_number:
+        """
+        for service in self.processes:
+            if not service.process_exited.is_set():
+                service.handle_signal(signal_number)
+
+    def poll(self):
+        """
+        Mark due TTL checks as passed until all the invoked processes are finished.
+
+        Services of each process are deregistered right after the process is finished
+        (unless it's restarted, see ``self.process_exits``).
+        """
+        logger.info("Start polling {} processes".format(len(self.processes)))
+
+        while self.services:
+            self.waker.wait(self.get_poll_timeout())
+            if self.process_exited.is_set():
+                self.process_exited.clear()
+                self.process_exits()
+                continue
+            if self.reload_requested:
+                self.reload_requested = False
+                self.reload()
+            if self.drain_signal is not None:
+                self.drain_processes()
+            self.restart_processes()
+            self.retry_registrations()
+            # TTL checks of the processes being restarted are not refreshed (they're critical)
+            due = [check_id for check_id in self.scheduler.pop_due()
+                   if self.ttl_checks[check_id] not in self.restarts]
+            if due:
+                self.pass_ttl_checks(due)
+
+    def get_poll_timeout(self):
+        """
+        :return: Time until the next heartbeat, process restart (the end of services drain
+                 or registration retry) in seconds. None if nothing is pending
+                 (see ``announcer.service.Service.get_poll_timeout``).
+        :rtype: float or None
+        """
+        now = self.scheduler.clock()
+        deadlines = list(self.restarts.values())
+        if self.scheduler.next_deadline() is not None:
+            deadlines.append(self.scheduler.next_deadline())
+        if self.drain_signal is not None:
+            deadlines.append(now + self.drain_deadline - monotonic())
+        for service in set(self.services.values()):
+            if service.unregistered:
+                deadlines.append(now + service.registration_deadline - monotonic())
+        return max(min(deadlines) - now, 0) if deadlines else None
+
+    def drain_processes(self):
+        """
+        Put services of all the processes in maintenance mode and pass the termination signal
+        to the processes after ``self.drain`` seconds.
+        """
+        if not self.draining:
+            logger.warning("Draining services for {} sec before stopping the processes".format(
+                self.drain
+            ))
+            self.draining = True
+            self.map(partial(self.maintain_service, enable=True, reason="The process is stopping"),
+                     list(self.services))
+        if monotonic() >= self.drain_deadline:
+            signal_number, self.drain_signal = self.drain_signal, None
+            logger.info("Services are drained, passing signal {} to the processes".format(
+                signal_number
+            ))
+            self.pass_signal(signal_number)
+
+    def process_exits(self):
+        """
+        Handle the finished processes: schedule their restart (their services are put
+        in maintenance mode) or deregister their services.
+        """
+        running = set(self.services.values())
+        for service in self.processes:
+            if service not in running or service in self.restarts \
+                    or not service.process_exited.is_set():
+                continue
+            delay = None if self.stopping else service.get_restart_delay()
+            if delay is None:
+                self.deregister_process_services(service)
+            else:
+                service.suspend_services(delay)
+                self.restarts[service] = self.scheduler.clock() + delay
+
+    def restart_processes(self):
+        """
+        Invoke the processes whose restart is due. If the supervisor is stopping,
+        services of the processes waiting for restart are deregistered instead.
+        """
+        now = self.scheduler.clock()
+        for service, deadline in list(self.restarts.items()):
+            if self.stopping:
+                del self.restarts[service]
+                self.deregister_process_services(service)
+            elif deadline <= now:
+                del self.restarts[service]
+                service.invoke_process()
+                service.resume_services()
+
+    def deregister_process_services(self, service):
+        """
+        :param SupervisedService service:
+        """
+        self.deregister_services([
+            service_id for service_id, owner in self.services.items() if owner is service
+        ])
+
+    def pass_ttl_checks(self, check_ids):
+        """
+        Mark TTL checks (of different processes) as passed.
+
+        If some checks have failed, services missing in Consul agent are registered again
+        (see ``announcer.service.Service.replay_registrations``).
+
+        :param list check_ids:
+        """
+        results = self.map_ttl_checks(check_ids)
+        Service.log_ttl_checks(check_ids, results)
+        failed = [check_id for check_id, success in zip(check_ids, results) if not success]
+        if failed:
+            self.replay_registrations(failed)
+        if self.pacer is not None:
+            self.pacer.reschedule(self.scheduler, check_ids)
+        self.metrics_exporter.export()
+
+    def replay_registrations(self, check_ids):
+        """
+        Register services of the failed TTL checks that are missing in Consul agent again
+        and mark the checks right away (see ``announcer.service.Service.replay_registrations``).
+
+        :param list check_ids: Failed TTL checks.
+        """
+        with self.lock:
+            # Services of the finished processes may have been deregistered meanwhile
+            owners = set(self.ttl_checks[check_id] for check_id in check_ids
+                         if check_id in self.ttl_checks)
+            if not owners:
+                return
+            agent_services = self.processes[0].get_agent_services()
+            if agent_services is not None and any([
+                service.replay_registrations(agent_services) for service in owners
+            ]):
+                check_ids = [check_id for check_id in check_ids if check_id in self.ttl_checks]
+                Service.log_ttl_checks(check_ids, self.map_ttl_checks(check_ids))
+
+    def pass_ttl_check(self, check_id):
+        return self.ttl_checks[check_id].pass_ttl_check(check_id)
+
+    def map_ttl_checks(self, check_ids):
+        """
+        Mark TTL checks of different processes concurrently
+        (see ``announcer.service.Service.map_ttl_checks``).
+
+        :param list check_ids:
+        :return: Result (True/False) for every check.
+        :rtype: list
+        """
+        probe_ids = [check_id for check_id in check_ids
+                     if check_id in (self.ttl_checks[check_id].probes or ())]
+        return map_ttl_checks(
+            self.executor, self.probe_executor, self.pass_ttl_check, check_ids, probe_ids
+        )
+
+    def restore_services(self):
+        """
+        Register services of the running processes that are missing in Consul agent again
+        and mark their TTL checks right away (see ``announcer.service.Service.restore_services``).
+        Called by ``self.watch`` holding ``self.lock``.
+        """
+        owners = set(self.services.values())
+        if not owners:
+            return
+        agent_services = self.processes[0].get_agent_services()
+        if agent_services is None:
+            return
+        restored = set(
+            service for service in owners if service.replay_registrations(agent_services)
+        )
+        check_ids = [check_id for check_id, service in self.ttl_checks.items()
+                     if service in restored]
+        Service.log_ttl_checks(check_ids, self.map_ttl_checks(check_ids))
+
+    def report_health(self, check_ids):
+        """
+        Send the status of TTL checks reported by the processes to Consul agent
+        (see ``announcer.service.Service.report_health``).
+
+        :param list check_ids:
+        """
+        # Services of the finished processes are deregistered concurrently (in the main thread)
+        services = dict((check_id, self.ttl_checks.get(check_id)) for check_id in check_ids)
+        check_ids = [check_id for check_id in check_ids if services[check_id] is not None]
+        Service.log_ttl_checks(check_ids, self.map(
+            lambda check_id: services[check_id].pass_ttl_check(check_id), check_ids
+        ))
+
+    def deregister_services(self, service_ids):
+        """
+        Deregister services in Consul agent (concurrently) and stop refreshing their TTL checks.
+
+        :param list service_ids:
+        """
+        if not service_ids:
+            return
+        logger.info("Deregistering Consul services: {}".format(', '.join(service_ids)))
+        with self.lock:
+            self.deregister_owned_services(service_ids)
+
+    def deregister_owned_services(self, service_ids):
+        """
+        Deregister services (see ``self.deregister_services``) & drop them from ``self.services``
+        and ``self.ttl_checks``.
+
+        :param list service_ids:
+        """
+        services = set(self.services[service_id] for service_id in service_ids)
+        for check_id, service in list(self.ttl_checks.items()):
+            if service in services:
+                self.scheduler.remove(check_id)
+                self.metrics.remove_check(check_id)
+                if self.pacer is not None:
+                    self.pacer.remove(check_id)
+                if self.health is not None:
+                    self.health.remove_check(check_id)
+                del self.ttl_checks[check_id]
+        self.map(self.deregister_service, service_ids)
+        for service in services:
+            service.forget_services([
+                service_id for service_id in service_ids if self.services[service_id] is service
+            ])
+        for service_id in service_ids:
+            del self.services[service_id]
+
+    def deregister_service(self, service_id):
+        return self.services[service_id].deregister_service(service_id)
+
+    def maintain_service(self, service_id, enable, reason=None):
+        return self.services[service_id].maintain_service(service_id, enable, reason)
+
+    def __del__(self):
+        """
+        Cleanup on object destruction.
+        """
+        for service in self.processes or []:
+            service.__del__()
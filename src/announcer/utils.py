@@ -1,10 +1,18 @@
 # encoding: utf-8
+import errno
+import fcntl
+import os
 import re
 import datetime
+import select
+import time
 
 import six
 
 
+# Monotonic clock is not affected by system time changes (Python 3.3+)
+monotonic = getattr(time, 'monotonic', time.time)
+
 # duration units, converted to microseconds
 duration_units = {
     'us': 1,  # microsecond - minimum ``datetime.timedelta`` precision
@@ -35,3 +43,65 @@ def parse_duration(s):
     for (value, unit) in bits:
         total_microseconds += float(value) * duration_units[unit]
     return datetime.timedelta(microseconds=sign * total_microseconds)
+
+
+class Waker(object):
+    """
+    Wakes up a thread waiting for something to happen (e.g. the poll loop): the process exit,
+    a signal, etc.
+
+    Unlike ``threading.Event.set()``, ``self.wake`` is safe to call from signal handlers
+    (it writes to a non-blocking pipe), and ``self.wait`` (``select()``) is interrupted
+    by signals on Python 2 as well. Wake-ups are not lost: if ``self.wake`` is called before
+    ``self.wait``, the latter returns right away.
+    """
+    read_fd = None
+    write_fd = None
+
+    def __init__(self):
+        self.read_fd, self.write_fd = os.pipe()
+        for fd in (self.read_fd, self.write_fd):
+            fcntl.fcntl(fd, fcntl.F_SETFL, fcntl.fcntl(fd, fcntl.F_GETFL) | os.O_NONBLOCK)
+
+    def wake(self):
+        """
+        Wake up the waiting thread.
+        """
+        try:
+            os.write(self.write_fd, b'.')
+        except OSError:
+            # The pipe is full (a wake-up is pending anyway) or closed
+            pass
+
+    def wait(self, timeout=None):
+        """
+        Wait until woken up (or interrupted by a signal).
+
+        :param timeout: Max time to wait in seconds. If None - wait forever.
+        :type timeout: float or None
+        :return: True if woken up (pending wake-ups are consumed).
+        :rtype: bool
+        """
+        try:
+            readable = select.select([self.read_fd], [], [], timeout)[0]
+        except (select.error, OSError) as e:
+            # Python 2 doesn't retry system calls interrupted by signals
+            if e.args[0] != errno.EINTR:
+                raise
+            readable = [self.read_fd]
+        if not readable:
+            return False
+        try:
+            while os.read(self.read_fd, 1024):
+                pass
+        except OSError:
+            # Nothing more to read
+            pass
+        return True
+
+    def close(self):
+        """
+        Close the pipe.
+        """
+        os.close(self.read_fd)
+        os.close(self.write_fd)
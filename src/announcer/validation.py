@@ -0,0 +1,382 @@
+"""
+Services config validation against Consul schema (without contacting the agent).
+
+See https://www.consul.io/docs/agent/services.html
+and https://www.consul.io/docs/agent/checks.html.
+Keys are matched like Consul does: case-insensitively, with or without underscores
+(``deregister_critical_service_after`` or ``DeregisterCriticalServiceAfter``).
+"""
+import json
+
+try:
+    from collections.abc import Mapping
+except ImportError:  # Python 2
+    from collections import Mapping
+
+import six
+
+from announcer.exceptions import AnnouncerImproperlyConfigured
+from announcer.utils import parse_duration
+
+SERVICE_FIELDS = {
+    'id': 'string',
+    'name': 'string',
+    'kind': 'string',
+    'tags': 'strings',
+    'address': 'string',
+    'port': 'port',
+    'socket_path': 'string',
+    'meta': 'map',
+    'tagged_addresses': 'object',
+    'enable_tag_override': 'boolean',
+    'weights': 'weights',
+    'check': 'object',
+    'checks': 'array',
+    'token': 'string',
+    'connect': 'object',
+    'proxy': 'object',
+    'namespace': 'string',
+    'partition': 'string',
+    'locality': 'object'
+}
+
+CHECK_FIELDS = {
+    'id': 'string',
+    'check_id': 'string',
+    'name': 'string',
+    'notes': 'string',
+    'status': 'status',
+    'service_id': 'string',
+    'ttl': 'duration',
+    'http': 'string',
+    'method': 'string',
+    'header': 'headers',
+    'body': 'string',
+    'disable_redirects': 'boolean',
+    'tcp': 'address',
+    'udp': 'address',
+    'script': 'string',
+    'args': 'strings',
+    'docker_container_id': 'string',
+    'shell': 'string',
+    'grpc': 'string',
+    'grpc_use_tls': 'boolean',
+    'h2ping': 'string',
+    'h2ping_use_tls': 'boolean',
+    'alias_service': 'string',
+    'alias_node': 'string',
+    'os_service': 'string',
+    'tls_server_name': 'string',
+    'tls_skip_verify': 'boolean',
+    'interval': 'duration',
+    'timeout': 'duration',
+    'deregister_critical_service_after': 'duration',
+    'success_before_passing': 'count',
+    'failures_before_warning': 'count',
+    'failures_before_critical': 'count',
+    'output_max_size': 'count'
+}
+
+# Check types (by their defining key) and whether they require ``interval``
+CHECK_TYPES = {
+    'ttl': False,
+    'http': True,
+    'tcp': True,
+    'udp': True,
+    'script': True,
+    'args': True,
+    'grpc': True,
+    'h2ping': True,
+    'os_service': True,
+    'alias_service': False
+}
+
+STATUSES = ('passing', 'warning', 'critical')
+
+
+def normalize(key):
+    """
+    :param str key: Config key.
+    :return: Key as Consul matches it: lowercase, without underscores.
+    :rtype: str
+    """
+    return key.lower().replace('_', '')
+
+
+def get_value(conf, key, default=None):
+    """
+    :param dict conf:
+    :param str key:
+    :param default:
+    :return: Value of the key matched like Consul does (see ``normalize``).
+    """
+    for conf_key, value in conf.items():
+        if normalize(conf_key) == normalize(key):
+            return value
+    return default
+
+
+def is_integer(value):
+    return isinstance(value, six.integer_types) and not isinstance(value, bool)
+
+
+def is_string(value):
+    return isinstance(value, six.string_types)
+
+
+def is_string_list(value):
+    return isinstance(value, list) and all(is_string(i) for i in value)
+
+
+def is_object_list(value):
+    return isinstance(value, list) and all(isinstance(i, Mapping) for i in value)
+
+
+def is_object_of(is_valid):
+    """
+    :param is_valid: Values validator.
+    :return: Validator of objects whose values are valid.
+    """
+    return lambda value: isinstance(value, Mapping) and all(is_valid(i) for i in value.values())
+
+
+def is_weights(value):
+    return is_object_of(is_integer)(value) and all(
+        normalize(key) in ('passing', 'warning') for key in value
+    )
+
+
+def is_duration(value):
+    try:
+        parse_duration(value)
+    except ValueError:
+        return False
+    return True
+
+
+def is_address(value):
+    return is_string(value) and value.rpartition(':')[2].isdigit()
+
+
+# Value description & validator by type
+VALIDATORS = {
+    'string': ("a string", is_string),
+    'strings': ("an array of strings", is_string_list),
+    'boolean': ("a boolean", lambda value: isinstance(value, bool)),
+    'count': ("a non-negative integer", lambda value: is_integer(value) and value >= 0),
+    'port': ("an integer (0-65535)", lambda value: is_integer(value) and 0 <= value <= 65535),
+    'object': ("an object", lambda value: isinstance(value, Mapping)),
+    'array': ("an array of objects", is_object_list),
+    'map': ("an object with string values", is_object_of(is_string)),
+    'headers': ("an object with arrays of strings", is_object_of(is_string_list)),
+    'weights': ("an object with integer \"passing\" & \"warning\"", is_weights),
+    'status': ("one of: {}".format(', '.join(STATUSES)), lambda value: value in STATUSES),
+    'duration': ("a duration, e.g. \"10s\"", is_duration),
+    'address': ("an address: \"host:port\"", is_address)
+}
+
+SERVICE_KEYS = dict((normalize(key), value) for key, value in SERVICE_FIELDS.items())
+CHECK_KEYS = dict((normalize(key), value) for key, value in CHECK_FIELDS.items())
+
+
+def validate_fields(conf, fields, where):
+    """
+    Validate config keys & value types.
+
+    :param dict conf: Service or check config.
+    :param dict fields: Value type by normalized key.
+    :param str where: Config description for error messages.
+    :return: Errors.
+    :rtype: list
+    """
+    errors = []
+    for key, value in conf.items():
+        value_type = fields.get(normalize(key))
+        if value_type is None:
+            errors.append("{}: unknown field \"{}\"".format(where, key))
+            continue
+        description, is_valid = VALIDATORS[value_type]
+        if not is_valid(value):
+            errors.append("{}: \"{}\" must be {}, got {!r}".format(where, key, description, value))
+    return errors
+
+
+def validate_check(check_conf, where):
+    """
+    Validate check config: fields, exactly one check type and its ``interval``.
+
+    :param dict check_conf:
+    :param str where: Check description for error messages.
+    :return: Errors.
+    :rtype: list
+    """
+    errors = validate_fields(check_conf, CHECK_KEYS, where)
+    keys = set(normalize(key) for key in check_conf)
+    types = sorted(
+        check_type for check_type in CHECK_TYPES if normalize(check_type) in keys
+    )
+    if 'script' in types and 'args' in types:
+        types.remove('script')
+    if not types:
+        errors.append("{}: check type is not specified, use one of: {}".format(
+            where, ', '.join(sorted(CHECK_TYPES))
+        ))
+    elif len(types) > 1:
+        errors.append("{}: only one check type is allowed, got: {}".format(
+            where, ', '.join(types)
+        ))
+    elif CHECK_TYPES[types[0]] and 'interval' not in keys:
+        errors.append("{}: \"interval\" is required for \"{}\" check".format(where, types[0]))
+    elif types[0] == 'ttl' and 'interval' in keys:
+        errors.append("{}: \"interval\" is not allowed for \"ttl\" check".format(where))
+    return errors
+
+
+def validate_service(service_conf):
+    """
+    Validate service config & its checks.
+
+    :param dict service_conf:
+    :return: Errors.
+    :rtype: list
+    """
+    if not isinstance(service_conf, Mapping):
+        return ["Service must be an object, got {!r}".format(service_conf)]
+    name = get_value(service_conf, 'name')
+    where = "Service \"{}\"".format(get_value(service_conf, 'id', name))
+    errors = validate_fields(service_conf, SERVICE_KEYS, where)
+    if name is None:
+        errors.append("{}: \"name\" is required".format(where))
+    checks = []
+    if isinstance(get_value(service_conf, 'check'), Mapping):
+        checks.append(("{} check".format(where), get_value(service_conf, 'check')))
+    if is_object_list(get_value(service_conf, 'checks')):
+        checks.extend(
+            ("{} check #{}".format(where, i), check_conf)
+            for i, check_conf in enumerate(get_value(service_conf, 'checks'), 1)
+        )
+    for check_where, check_conf in checks:
+        errors.extend(validate_check(check_conf, check_where))
+    return errors
+
+
+def read_json(source):
+    """
+    :param str source: JSON. If starts with @ - considered as file path.
+    :return: Parsed JSON.
+    :raises: ValueError
+    """
+    if source[0] != '@':
+        return json.loads(source)
+    with open(source[1:]) as f:
+        return json.load(f)
+
+
+def check_config(config, probes=False):
+    """
+    Validate services config without initializing the service (``--check``): only
+    the standard library is used, not the HTTP stack of ``announcer.service``.
+
+    :param config: Consul configuration: JSON (if starts with @ - considered as file path)
+                   or parsed JSON.
+    :type config: str or dict
+    :param bool probes: HTTP & TCP checks are executed by the announcer (they are TTL checks).
+    :return: IDs of the services & TTL checks.
+    :rtype: tuple
+    :raises: AnnouncerImproperlyConfigured with all the errors found
+    """
+    if isinstance(config, six.string_types):
+        config = read_json(config)
+    if not isinstance(config, Mapping):
+        raise AnnouncerImproperlyConfigured("Services config must be an object")
+    service_confs = [] if get_value(config, 'service') is None else [get_value(config, 'service')]
+    if not isinstance(get_value(config, 'services', []), list):
+        raise AnnouncerImproperlyConfigured("\"services\" must be an array in {}".format(config))
+    service_confs.extend(get_value(config, 'services', []))
+    if not service_confs:
+        raise AnnouncerImproperlyConfigured(
+            "Please specify either \"service\" config or non-empty \"services\" list"
+        )
+    errors = [error for service_conf in service_confs
+              for error in validate_service(service_conf)]
+    if errors:
+        raise AnnouncerImproperlyConfigured(
+            "Services config is invalid:\n{}".format('\n'.join(errors))
+        )
+
+    service_ids, ttl_check_ids = [], []
+    for service_conf in service_confs:
+        service_id = get_value(service_conf, 'id', get_value(service_conf, 'name'))
+        service_ids.append(service_id)
+        checks = [('service:{}'.format(service_id), get_value(service_conf, 'check'))] + [
+            ('service:{}:{}'.format(service_id, i), check_conf)
+            for i, check_conf in enumerate(get_value(service_conf, 'checks', []), 1)
+        ]
+        for check_id, check_conf in checks:
+            keys = set(normalize(key) for key in check_conf or {})
+            if 'ttl' in keys or (probes and keys & {'http', 'tcp'}):
+                ttl_check_ids.append(check_id)
+    check_duplicates(service_ids)
+    return service_ids, ttl_check_ids
+
+
+def check_duplicates(service_ids):
+    """
+    :param list service_ids:
+    :raises: AnnouncerImproperlyConfigured if any service ID is duplicated
+    """
+    seen = set()
+    for service_id in service_ids:
+        if service_id in seen:
+            raise AnnouncerImproperlyConfigured(
+                "Service ID \"{}\" is duplicated".format(service_id)
+            )
+        seen.add(service_id)
+
+
+def check_process(process_conf):
+    """
+    Validate a process entry of supervisor manifest: an object with non-empty "cmd" array
+    and "config".
+
+    :param process_conf: Process entry.
+    :raises: AnnouncerImproperlyConfigured
+    """
+    if not isinstance(process_conf, dict):
+        raise AnnouncerImproperlyConfigured(
+            "Process must be an object, got {!r}".format(process_conf)
+        )
+    if not process_conf.get('cmd') or not isinstance(process_conf['cmd'], list):
+        raise AnnouncerImproperlyConfigured(
+            "\"cmd\" must be a non-empty array in {}".format(process_conf)
+        )
+    if 'config' not in process_conf:
+        raise AnnouncerImproperlyConfigured(
+            "\"config\" is missing in {}".format(process_conf)
+        )
+
+
+def check_manifest(manifest, probes=False):
+    """
+    Validate supervisor manifest & services configs of its processes (see ``check_config``).
+
+    :param str manifest: Manifest JSON. If starts with @ - considered as file path.
+    :param bool probes: HTTP & TCP checks are executed by the announcer.
+    :return: IDs of the services & TTL checks of all the processes.
+    :rtype: tuple
+    :raises: AnnouncerImproperlyConfigured
+    """
+    manifest = read_json(manifest)
+    processes = manifest.get('processes') if isinstance(manifest, dict) else None
+    if not processes or not isinstance(processes, list):
+        raise AnnouncerImproperlyConfigured(
+            "Please specify non-empty \"processes\" list in the manifest"
+        )
+    service_ids, ttl_check_ids = [], []
+    for process_conf in processes:
+        check_process(process_conf)
+        process_service_ids, process_ttl_check_ids = check_config(process_conf['config'], probes)
+        service_ids.extend(process_service_ids)
+        ttl_check_ids.extend(process_ttl_check_ids)
+    check_duplicates(service_ids)
+    return service_ids, ttl_check_ids
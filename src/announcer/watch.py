@@ -0,0 +1,134 @@
+import logging
+import threading
+
+from consul.base import ConsulException
+from requests.exceptions import RequestException
+
+logger = logging.getLogger(__name__)
+
+
+class AgentWatch(object):
+    """
+    Watch of Consul agent state with blocking queries: services lost by the agent
+    (e.g. it was restarted and lost its state, or they were deregistered by someone else)
+    are noticed within one round trip, without polling.
+
+    Agent endpoints (``/v1/agent/services``, ``/v1/agent/checks``) don't support blocking
+    queries, so services of the agent's node are watched in the catalog instead
+    (``/v1/catalog/node/<node>``): the agent syncs its state there right away.
+    ``X-Consul-Index`` of the last result is tracked (and reset when it goes backwards),
+    so every query blocks until the node changes or ``wait`` seconds pass.
+
+    The listener is called after every query (the node has changed or nothing has happened
+    for ``wait`` seconds) and when the agent is reachable again after an error
+    (e.g. it was restarted). It compares the agent state to the desired one
+    (see ``announcer.service.Service.restore_services``). The listener is called holding
+    ``lock``, so it doesn't race with registrations of the announcer and isn't called
+    once the watch is stopped.
+    """
+    wait = 60
+    # Consul adds up to wait / 16 jitter to blocking queries
+    timeout = 70
+    retry_delay = 1
+    errors = (RequestException, ConsulException, KeyError, ValueError)
+
+    consul = None
+    node = None
+    index = None
+    lock = None
+    thread = None
+    stopped = None
+
+    def __init__(self, consul):
+        """
+        Initialize the watch.
+
+        :param consul: Consul agent client dedicated to the watch (with ``self.timeout``).
+        :type consul: announcer.agent.Consul
+        """
+        self.consul = consul
+        self.lock = threading.RLock()
+        self.stopped = threading.Event()
+
+    def update(self, index):
+        """
+        Track the index of the last query result: the next query blocks until it changes.
+
+        :param index: ``X-Consul-Index`` of the result.
+        :type index: str or None
+        """
+        index = max(int(index or 0), 1)
+        if self.index is not None and index < self.index:
+            logger.debug("Consul catalog index went backwards, resetting it")
+            index = None
+        self.index = index
+
+    def query(self):
+        """
+        Wait for changes of the agent's node in the catalog (blocking query).
+        """
+        if self.node is None:
+            self.node = self.consul.agent.self()['Config']['NodeName']
+        index, _ = self.consul.catalog.node(
+            self.node, index=self.index, wait='{}s'.format(self.wait)
+        )
+        self.update(index)
+
+    def start(self, listener, lock=None):
+        """
+        Watch the agent in a separate thread.
+
+        :param listener: Function (without arguments) called when the agent state may
+                         have changed.
+        :param lock: Lock held while the listener is called (e.g. the one that serializes
+                     registrations). If None - the watch's own lock.
+        :type lock: threading.RLock or None
+        """
+        if lock is not None:
+            self.lock = lock
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self.serve, args=(listener,), name='agent-watch')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def serve(self, listener):
+        """
+        Query the agent and call ``listener`` until stopped. Errors are retried after
+        ``self.retry_delay`` seconds.
+        """
+        failed = False
+        while not self.stopped.is_set():
+            try:
+                self.query()
+            except self.errors as e:
+                if not failed:
+                    logger.warning("Can't watch Consul agent state: {}".format(e))
+                failed = True
+                self.reset()
+                self.stopped.wait(self.retry_delay)
+                continue
+            if failed:
+                logger.info("Consul agent is reachable again, checking its state")
+                failed = False
+            with self.lock:
+                if self.stopped.is_set():
+                    break
+                try:
+                    listener()
+                except Exception:
+                    logger.exception("Can't restore services in Consul agent")
+
+    def reset(self):
+        """
+        Forget the node & index: the agent may have been restarted.
+        """
+        self.node = None
+        self.index = None
+
+    def stop(self):
+        """
+        Stop watching. A query in progress isn't interrupted, but its result is ignored.
+        Waits for the listener, if it's being called: it's not called after this.
+        """
+        with self.lock:
+            self.stopped.set()
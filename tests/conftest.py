@@ -1,8 +1,34 @@
+import sys
+
 import pytest
 
 from announcer.service import Service
 
 
+if sys.version_info < (3, 5):
+    # asyncio engine requires Python 3.5+
+    collect_ignore = ['unit_tests/test_aio.py']
+
+
+class FakeClock(object):
+    """
+    Manually controlled clock.
+    """
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    """
+    Manually controlled clock (set ``clock.now`` to move the time).
+    """
+    return FakeClock()
+
+
 @pytest.fixture
 def fake_consul(monkeypatch):
     """
@@ -3,12 +3,18 @@ Test ``announcer.service.Service`` interaction with subprocess and Consul (faked
 """
 import json
 import logging
+import os
+import signal
+import sys
+import threading
 import time
 
 import responses
+from requests.exceptions import Timeout
 
-from announcer import root_logger
+from announcer.cache import FingerprintCache
 from announcer.service import Service
+from announcer.supervisor import Supervisor
 
 
 def test_subprocess_alive(fake_consul):
@@ -25,15 +31,14 @@ def test_subprocess_alive(fake_consul):
     assert service.process.poll() == 0
 
 
-def test_subprocess_polling(fake_consul, caplog, monkeypatch):
+def test_subprocess_polling(fake_consul, caplog):
     """
     Test ``announcer.service.Service`` subprocess keeping alive.
 
     :param fake_consul: custom fixture to disable calls to Consul API
     :param caplog: ``pytest-catchlog`` fixture to catch Python logs
-    :param monkeypatch: pytest "patching" fixture
     """
-    monkeypatch.setattr(root_logger, 'level', logging.DEBUG)
+    caplog.set_level(logging.DEBUG, 'announcer')
     service = Service(
         'localhost', '@tests/config/correct.json', ['sleep', '0.2'], None, 0.1
     )
@@ -46,7 +51,11 @@ def test_subprocess_polling(fake_consul, caplog, monkeypatch):
     )
     service.run()
     assert service.process.poll() == 0
-    assert caplog.records[-1].message == "No TTL checks registered"
+    messages = [record.message for record in caplog.records]
+    assert "No TTL checks registered" in messages
+    # Process exit is followed only by the deregistration & connection stats
+    assert "Process with PID {} exited with code 0".format(service.process.pid) in messages
+    assert messages[-1].startswith("Consul agent connections:")
 
 
 def test_subprocess_cleanup(fake_consul):
@@ -90,3 +99,706 @@ def test_consul_interaction():
     responses.add(responses.GET, api_url.format('service/deregister/service-2'), status=404)
 
     Service('localhost:1234', '@tests/config/correct.json', ['sleep', '0.2'], None, 0.1).run()
+
+
+def test_concurrent_ttl_checks(fake_consul, monkeypatch):
+    """
+    Test ``announcer.service.Service`` marks TTL checks as passed concurrently.
+
+    :param fake_consul: custom fixture to disable calls to Consul API
+    :param monkeypatch: pytest "patching" fixture
+    """
+    def slow_pass_ttl_check(self, check_id):
+        time.sleep(0.2)
+        return True
+
+    monkeypatch.setattr(Service, 'pass_ttl_check', slow_pass_ttl_check)
+    config = json.dumps({'service': {'name': 's', 'checks': [{'ttl': '10s'}] * 5}})
+
+    service = Service('localhost', config, ['...'], None, None, workers=5)
+    start = time.time()
+    service.pass_ttl_checks()
+    # Time depends on the slowest request, not the sum of all of them
+    assert time.time() - start < 0.5
+
+
+@responses.activate
+def test_ttl_check_timeout():
+    """
+    Test ``announcer.service.Service`` handles TTL check request timeout.
+    """
+    api_url = 'http://localhost:1234/v1/agent/check/pass/{}'
+    responses.add(responses.GET, api_url.format('service:s:1'))
+    responses.add(responses.GET, api_url.format('service:s:2'), body=Timeout())
+    config = json.dumps({'service': {'name': 's', 'checks': [{'ttl': '10s'}, {'ttl': '10s'}]}})
+
+    service = Service('localhost:1234', config, ['...'], None, None, timeout=0.1)
+    assert service.map(service.pass_ttl_check, ['service:s:1', 'service:s:2']) == [True, False]
+
+
+@responses.activate
+def test_concurrent_registration(caplog):
+    """
+    Test ``announcer.service.Service`` registers & deregisters services concurrently.
+
+    :param caplog: ``pytest-catchlog`` fixture to catch Python logs
+    """
+    def slow_callback(request):
+        time.sleep(0.2)
+        return 200, {}, ''
+
+    api_url = 'http://localhost:1234/v1/agent/service/{}'
+    responses.add_callback(responses.PUT, api_url.format('register'), callback=slow_callback)
+    for i in range(5):
+        responses.add_callback(
+            responses.GET, api_url.format('deregister/service-{}'.format(i)),
+            callback=slow_callback
+        )
+    config = json.dumps({'services': [{'name': 'service-{}'.format(i)} for i in range(5)]})
+    service = Service('localhost:1234', config, ['...'], workers=5)
+    caplog.set_level(logging.INFO, 'announcer')
+
+    start = time.time()
+    service.register_services()
+    assert time.time() - start < 0.5
+
+    start = time.time()
+    service.deregister_services()
+    assert time.time() - start < 0.5
+
+    # Timing is reported per service
+    messages = [record.message for record in caplog.records]
+    for i in range(5):
+        assert any(
+            message.startswith('Service "service-{}" was registered in'.format(i))
+            for message in messages
+        )
+        assert any(
+            message.startswith('Service "service-{}" was deregistered in'.format(i))
+            for message in messages
+        )
+
+
+@responses.activate
+def test_registration_cache(tmpdir):
+    """
+    Test ``announcer.service.Service`` skips registration of services that are still registered
+    in Consul agent with the same definition.
+
+    :param tmpdir: pytest fixture: temporary directory
+    """
+    api_url = 'http://localhost:1234/v1/agent/{}'
+    agent_services = {}
+    responses.add_callback(
+        responses.GET, api_url.format('services'),
+        callback=lambda request: (200, {}, json.dumps(agent_services))
+    )
+    responses.add(responses.PUT, api_url.format('service/register'))
+    responses.add(responses.GET, api_url.format('checks'), body='{}')
+    cache = str(tmpdir.join('cache.json'))
+
+    def register(services):
+        config = json.dumps({'services': [{'name': n, 'port': port} for n, port in services]})
+        responses.calls.reset()
+        Service('localhost:1234', config, ['...'], cache=cache).register_services()
+        return [
+            json.loads(call.request.body)['name'] for call in responses.calls
+            if call.request.method == 'PUT'
+        ]
+
+    # Nothing is cached yet
+    assert sorted(register([('a', 1), ('b', 2)])) == ['a', 'b']
+    agent_services = {'a': {'ID': 'a'}, 'b': {'ID': 'b'}}
+    # Unchanged services are skipped
+    assert register([('a', 1), ('b', 2)]) == []
+    # Only changed service is registered
+    assert register([('a', 1), ('b', 3)]) == ['b']
+    # Service is missing in Consul agent (e.g. it was restarted)
+    agent_services = {'b': {'ID': 'b'}}
+    assert register([('a', 1), ('b', 3)]) == ['a']
+
+
+@responses.activate
+def test_registration_cache_maintenance(tmpdir):
+    """
+    Test ``announcer.service.Service`` takes services skipped as up to date out of maintenance
+    mode left by the previous (killed) run.
+
+    :param tmpdir: pytest fixture: temporary directory
+    """
+    api_url = 'http://localhost:1234/v1/agent/{}'
+    responses.add(
+        responses.GET, api_url.format('services'),
+        body=json.dumps({'a': {'ID': 'a'}, 'b': {'ID': 'b'}})
+    )
+    responses.add(
+        responses.GET, api_url.format('checks'),
+        body=json.dumps({'_service_maintenance:a': {'CheckID': '_service_maintenance:a'}})
+    )
+    responses.add(responses.PUT, api_url.format('service/maintenance/a'))
+    cache = tmpdir.join('cache.json')
+    config = json.dumps({'services': [{'name': 'a'}, {'name': 'b'}]})
+
+    # Previous run registered "a" & "b" and was killed while "a" was in maintenance mode
+    previous = FingerprintCache(str(cache))
+    previous.update('a', {'name': 'a'})
+    previous.update('b', {'name': 'b'})
+    previous.save()
+
+    Service('localhost:1234', config, ['...'], cache=str(cache)).register_services()
+    assert [call.request.path_url.split('?')[0][len('/v1/agent/'):]
+            for call in responses.calls] == ['services', 'checks', 'service/maintenance/a']
+    assert 'enable=false' in responses.calls[2].request.path_url
+
+    # Services are put in maintenance mode until the process is ready anyway
+    responses.calls.reset()
+    Service(
+        'localhost:1234', config, ['...'], cache=str(cache),
+        ready='file:{}'.format(tmpdir.join('ready'))
+    ).register_services()
+    assert [call.request.path_url.split('?')[0][len('/v1/agent/'):]
+            for call in responses.calls] == ['services']
+
+
+@responses.activate
+def test_orphaned_services(tmpdir):
+    """
+    Test ``announcer.service.Service`` deregisters services left in Consul agent
+    by the previous (killed) run that are not in the config anymore.
+
+    :param tmpdir: pytest fixture: temporary directory
+    """
+    api_url = 'http://localhost:1234/v1/agent/{}'
+    responses.add(
+        responses.GET, api_url.format('services'),
+        body=json.dumps({'a': {'ID': 'a'}, 'old': {'ID': 'old'}})
+    )
+    responses.add(responses.PUT, api_url.format('service/register'))
+    responses.add(responses.GET, api_url.format('service/deregister/old'))
+    responses.add(responses.GET, api_url.format('checks'), body='{}')
+    cache = tmpdir.join('cache.json')
+    config = json.dumps({'services': [{'name': 'a'}, {'name': 'b'}]})
+
+    # Previous run registered "a" & "old", was killed while registering "gone"
+    previous = FingerprintCache(str(cache))
+    previous.update('a', {'name': 'a'})
+    previous.update('old', {'name': 'old'})
+    previous.journal(['gone'])
+
+    Service('localhost:1234', config, ['...'], cache=str(cache)).register_services()
+
+    assert [call.request.path_url.split('?')[0][len('/v1/agent/'):]
+            for call in responses.calls] == [
+        'services', 'service/deregister/old', 'service/register', 'checks'
+    ]
+    assert json.loads(responses.calls[2].request.body)['name'] == 'b'
+    assert sorted(json.loads(cache.read())) == ['a', 'b']
+
+
+@responses.activate
+def test_service_metrics():
+    """
+    Test ``announcer.service.Service`` records Consul agent requests in metrics.
+    """
+    api_url = 'http://localhost:1234/v1/agent/{}'
+    responses.add(responses.PUT, api_url.format('service/register'))
+    responses.add(responses.GET, api_url.format('check/pass/service:s:1'))
+    responses.add(responses.GET, api_url.format('check/pass/service:s:2'), body=Timeout())
+    responses.add(responses.GET, api_url.format('service/deregister/s'), status=404)
+    config = json.dumps({'service': {'name': 's', 'checks': [{'ttl': '10s'}, {'ttl': '10s'}]}})
+
+    service = Service('localhost:1234', config, ['...'], None, None, timeout=0.1)
+    service.register_services()
+    service.pass_ttl_checks()
+    service.deregister_services()
+
+    lines = service.metrics.render().splitlines()
+    for operation, errors in [('deregister', 1), ('heartbeat', 1), ('register', 0)]:
+        assert 'consul_announcer_agent_errors_total{{operation="{}"}} {}'.format(
+            operation, errors
+        ) in lines
+    assert [line.split('{')[1].split('}')[0] for line in lines
+            if line.startswith('consul_announcer_ttl_headroom_seconds')] == [
+        'check_id="service:s:1"'
+    ]
+
+
+@responses.activate
+def test_registration_replay():
+    """
+    Test ``announcer.service.Service`` survives unreachable Consul agent and registers services
+    again once the agent is back (e.g. after restart).
+    """
+    api_url = 'http://localhost:1234/v1/agent/{}'
+    agent_services = {}
+
+    def register(request):
+        agent_services['s'] = {'ID': 's'}
+        return 200, {}, ''
+
+    def ttl_pass(request):
+        if 's' in agent_services:
+            return 200, {}, ''
+        return 500, {}, 'CheckID "service:s" does not have associated TTL'
+
+    config = json.dumps({'service': {'name': 's', 'check': {'ttl': '10s'}}})
+    service = Service('localhost:1234', config, ['...'], None, None)
+    # Agent is unreachable - registration fails, but doesn't crash the service
+    service.register_services()
+    assert len(responses.calls) == 3  # 2 retries
+
+    responses.add_callback(responses.PUT, api_url.format('service/register'), callback=register)
+    responses.add_callback(
+        responses.GET, api_url.format('services'),
+        callback=lambda request: (200, {}, json.dumps(agent_services))
+    )
+    responses.add_callback(
+        responses.GET, api_url.format('check/pass/service:s'), callback=ttl_pass
+    )
+    for i in range(2):
+        responses.calls.reset()
+        service.pass_ttl_checks()
+        urls = [
+            call.request.url.replace(api_url.format(''), '').split('?')[0]
+            for call in responses.calls
+        ]
+        if i == 0:
+            # Service is registered again and its check is passed right away
+            assert urls == [
+                'check/pass/service:s', 'services', 'service/register', 'check/pass/service:s'
+            ]
+        else:
+            assert urls == ['check/pass/service:s']
+
+
+@responses.activate
+def test_registration_retry():
+    """
+    Test ``announcer.service.Service`` retries failed registrations from the poll loop:
+    a service without TTL checks isn't registered again by heartbeats.
+    """
+    api_url = 'http://localhost:1234/v1/agent/{}'
+    attempts = []
+
+    def register(request):
+        attempts.append(time.time())
+        if len(attempts) < 3:
+            return 500, {}, 'Agent is starting'
+        return 200, {}, ''
+
+    responses.add_callback(responses.PUT, api_url.format('service/register'), callback=register)
+    responses.add(responses.GET, api_url.format('service/deregister/s'))
+    service = Service(
+        'localhost:1234', '{"service": {"name": "s"}}', ['sleep', '1'], None, 0.1
+    )
+    service.registration_retry = 0.2
+    service.run()
+
+    urls = [call.request.path_url.split('?')[0] for call in responses.calls]
+    assert urls == ['/v1/agent/service/register'] * 3 + ['/v1/agent/service/deregister/s']
+    assert all(b - a >= 0.2 for a, b in zip(attempts, attempts[1:]))
+    assert service.unregistered == set()
+
+
+@responses.activate
+def test_health_socket(tmpdir):
+    """
+    Test ``announcer.service.Service`` sends TTL check status reported by the invoked process
+    to Consul agent right away and on every heartbeat.
+
+    :param tmpdir: pytest fixture: temporary directory
+    """
+    api_url = 'http://localhost:1234/v1/agent/{}'
+    responses.add(responses.PUT, api_url.format('service/register'))
+    responses.add(responses.GET, api_url.format('check/pass/service:s'))
+    responses.add(responses.GET, api_url.format('check/fail/service:s'))
+    responses.add(responses.GET, api_url.format('service/deregister/s'))
+    script = (
+        'import os, socket, time; time.sleep(0.25); '
+        's = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM); '
+        's.sendto(b"fail service:s deadlock", os.environ["CONSUL_ANNOUNCER_HEALTH_SOCKET"]); '
+        'time.sleep(0.3)'
+    )
+    config = json.dumps({'service': {'name': 's', 'check': {'ttl': '10s'}}})
+    path = str(tmpdir.join('health.sock'))
+
+    service = Service(
+        'localhost:1234', config, [sys.executable, '-c', script], None, 0.1, health_socket=path
+    )
+    service.run()
+    assert service.process.poll() == 0
+
+    urls = [call.request.url.replace(api_url.format(''), '') for call in responses.calls]
+    heartbeats = [url for url in urls if url.startswith('check/')]
+    first_failure = heartbeats.index('check/fail/service:s?note=deadlock')
+    # Heartbeats pass until the failure is reported, then they fail
+    assert set(heartbeats[:first_failure]) == {'check/pass/service:s'}
+    assert set(heartbeats[first_failure:]) == {'check/fail/service:s?note=deadlock'}
+    assert len(heartbeats) - first_failure >= 2
+    assert not os.path.exists(path)
+
+
+@responses.activate
+def test_config_reload(tmpdir):
+    """
+    Test ``announcer.service.Service`` reloads config on SIGHUP without restarting
+    the invoked process: only changed services are registered or deregistered.
+
+    :param tmpdir: pytest fixture: temporary directory
+    """
+    api_url = 'http://localhost:1234/v1/agent/{}'
+    responses.add(responses.PUT, api_url.format('service/register'))
+    for service_id in ['a', 'b', 'c']:
+        responses.add(responses.GET, api_url.format('service/deregister/' + service_id))
+    config = tmpdir.join('config.json')
+    config.write(json.dumps({'services': [{'name': 'a'}, {'name': 'b', 'port': 1}]}))
+
+    def change_config():
+        config.write(json.dumps({'services': [{'name': 'b', 'port': 2}, {'name': 'c'}]}))
+        os.kill(os.getpid(), signal.SIGHUP)
+
+    service = Service(
+        'localhost:1234', '@{}'.format(config), ['sleep', '1.5'], reload=True
+    )
+    timer = threading.Timer(0.2, change_config)
+    timer.start()
+    service.run()
+    timer.join()
+    # SIGHUP wasn't passed to the process
+    assert service.process.poll() == 0
+
+    calls = [
+        (call.request.method, call.request.url.replace(api_url.format(''), '').split('?')[0],
+         call.request.body and json.loads(call.request.body)['name'])
+        for call in responses.calls
+    ]
+    assert sorted(calls[:2]) == [
+        ('PUT', 'service/register', 'a'), ('PUT', 'service/register', 'b')
+    ]
+    assert sorted(calls[2:5]) == [
+        ('GET', 'service/deregister/a', None),
+        ('PUT', 'service/register', 'b'),
+        ('PUT', 'service/register', 'c')
+    ]
+    assert sorted(calls[5:]) == [
+        ('GET', 'service/deregister/b', None), ('GET', 'service/deregister/c', None)
+    ]
+
+
+@responses.activate
+def test_process_restart(tmpdir):
+    """
+    Test ``announcer.service.Service`` restarts the failed process: its services stay
+    registered in maintenance mode until the process is up again.
+
+    :param tmpdir: pytest fixture: temporary directory
+    """
+    api_url = 'http://localhost:1234/v1/agent/{}'
+    responses.add(responses.PUT, api_url.format('service/register'))
+    responses.add(responses.PUT, api_url.format('service/maintenance/s'))
+    responses.add(responses.GET, api_url.format('service/deregister/s'))
+    responses.add(responses.GET, api_url.format('check/pass/service:s'))
+    # Fails on the first run only
+    marker = tmpdir.join('started')
+    cmd = ['sh', '-c', 'test -e {0} && sleep 0.3 || {{ touch {0}; exit 3; }}'.format(marker)]
+
+    service = Service(
+        'localhost:1234', '{"service": {"name": "s", "check": {"ttl": "10s"}}}', cmd,
+        interval=None, restart='on-failure'
+    )
+    service.restart_policy.min_delay = 0.2
+    start = time.time()
+    service.run()
+    assert time.time() - start >= 0.2
+    assert service.process.poll() == 0
+
+    calls = [
+        (call.request.url.replace(api_url.format(''), '').split('?')[0], call.request.url)
+        for call in responses.calls
+    ]
+    # TTL check is passed right after the registration
+    assert [url for url, _ in calls] == [
+        'service/register', 'check/pass/service:s', 'service/maintenance/s',
+        'service/maintenance/s', 'check/pass/service:s', 'service/deregister/s'
+    ]
+    assert 'enable=true' in calls[2][1]
+    assert 'Process+exited+with+code+3' in calls[2][1]
+    # TTL check is passed right after the restart
+    assert 'enable=false' in calls[3][1]
+
+
+@responses.activate
+def test_readiness(tmpdir):
+    """
+    Test ``announcer.service.Service`` registers checks critical & keeps services
+    in maintenance mode until the invoked process reports it's ready, then TTL checks
+    are passed right away.
+
+    :param tmpdir: pytest fixture: temporary directory
+    """
+    api_url = 'http://localhost:1234/v1/agent/{}'
+    responses.add(responses.PUT, api_url.format('service/register'))
+    responses.add(responses.PUT, api_url.format('service/maintenance/s'))
+    responses.add(responses.GET, api_url.format('check/pass/service:s'))
+    responses.add(responses.GET, api_url.format('service/deregister/s'))
+    script = (
+        'import os, socket, time; time.sleep(0.2); '
+        's = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM); '
+        's.sendto(b"ready", os.environ["CONSUL_ANNOUNCER_HEALTH_SOCKET"]); '
+        'time.sleep(1.3)'
+    )
+    config = json.dumps({'service': {'name': 's', 'check': {'ttl': '100s'}}})
+
+    service = Service(
+        'localhost:1234', config, [sys.executable, '-c', script], interval=None,
+        health_socket=str(tmpdir.join('health.sock')), ready='health'
+    )
+    service.run()
+    assert service.process.poll() == 0
+    assert service.readiness.ready
+
+    calls = [call.request.url.replace(api_url.format(''), '') for call in responses.calls]
+    assert calls[0].startswith('service/register?')
+    # The service isn't routable before it's put in maintenance mode
+    assert json.loads(responses.calls[0].request.body) == {
+        'name': 's', 'check': {'ttl': '100s', 'status': 'critical'}
+    }
+    assert calls[1] == (
+        'service/maintenance/s?enable=true&reason=Waiting+for+the+process+to+be+ready'
+    )
+    assert calls[2:] == [
+        'check/pass/service:s', 'service/maintenance/s?enable=false', 'check/pass/service:s',
+        'service/deregister/s'
+    ]
+
+
+@responses.activate
+def test_process_restart_stop():
+    """
+    Test ``announcer.service.Service`` doesn't restart the process when it's terminated
+    by the announcer.
+    """
+    api_url = 'http://localhost:1234/v1/agent/{}'
+    responses.add(responses.PUT, api_url.format('service/register'))
+    responses.add(responses.GET, api_url.format('service/deregister/s'))
+
+    service = Service(
+        'localhost:1234', '{"service": {"name": "s"}}', ['sleep', '10'], restart='always'
+    )
+    timer = threading.Timer(0.2, os.kill, (os.getpid(), signal.SIGTERM))
+    timer.start()
+    service.run()
+    timer.join()
+    assert service.process.poll() == -signal.SIGTERM
+    assert [call.request.url.split('?')[0] for call in responses.calls] == [
+        api_url.format('service/register'), api_url.format('service/deregister/s')
+    ]
+
+
+@responses.activate
+def test_drain():
+    """
+    Test ``announcer.service.Service`` drains services on SIGTERM: they're put in maintenance
+    mode and the signal is passed to the process after the drain delay.
+    """
+    api_url = 'http://localhost:1234/v1/agent/{}'
+    responses.add(responses.PUT, api_url.format('service/register'))
+    responses.add(responses.PUT, api_url.format('service/maintenance/s'))
+    responses.add(responses.GET, api_url.format('service/deregister/s'))
+
+    service = Service(
+        'localhost:1234', '{"service": {"name": "s"}}', ['sleep', '10'], drain=0.5
+    )
+    timer = threading.Timer(0.2, os.kill, (os.getpid(), signal.SIGTERM))
+    timer.start()
+    start = time.time()
+    service.run()
+    timer.join()
+    # The poll loop is woken up by the signal & the drain deadline (no TTL checks)
+    assert 0.7 <= time.time() - start < 1.5
+    assert service.process.poll() == -signal.SIGTERM
+    calls = [call.request.url.replace(api_url.format(''), '') for call in responses.calls]
+    assert calls[1].startswith('service/maintenance/s?enable=true&reason=')
+    assert calls[2:] == ['service/deregister/s']
+
+
+@responses.activate
+def test_agent_watch():
+    """
+    Test ``announcer.service.Service`` watches Consul agent state: services lost by the agent
+    are registered again right away (not on the next failed heartbeat).
+    """
+    api_url = 'http://localhost:1234/v1/{}'
+    agent_services = {}
+    registered = []
+
+    def register(request):
+        agent_services['s'] = {'ID': 's'}
+        registered.append(time.time())
+        return 200, {}, ''
+
+    def catalog_node(request):
+        index = int(request.params.get('index', 0))
+        if index == 1:
+            # The agent has lost its state
+            agent_services.clear()
+        elif index > 1:
+            # Blocking query: nothing changes
+            time.sleep(0.2)
+        return 200, {'X-Consul-Index': str(max(index, 2) if index else 1)}, '{}'
+
+    responses.add_callback(responses.PUT, api_url.format('agent/service/register'), register)
+    responses.add_callback(
+        responses.GET, api_url.format('agent/services'),
+        callback=lambda request: (200, {}, json.dumps(agent_services))
+    )
+    responses.add(
+        responses.GET, api_url.format('agent/self'), json={'Config': {'NodeName': 'node-1'}}
+    )
+    responses.add_callback(responses.GET, api_url.format('catalog/node/node-1'), catalog_node)
+    responses.add(responses.GET, api_url.format('agent/check/pass/service:s'))
+    responses.add(responses.GET, api_url.format('agent/service/deregister/s'))
+
+    config = json.dumps({'service': {'name': 's', 'check': {'ttl': '100s'}}})
+    service = Service('localhost:1234', config, ['sleep', '0.5'], None, None, watch=True)
+    service.run()
+    # Wait for the blocking query in progress
+    service.watch.thread.join(1)
+    # Registered on start & again right after the agent has lost it
+    assert len(registered) == 2
+    assert registered[1] - registered[0] < 0.2
+    calls = [call.request.url.replace(api_url.format(''), '').split('?')[0]
+             for call in responses.calls]
+    # Its check is passed right away (heartbeats are every 10 sec)
+    assert calls[calls.index('agent/service/register', 1) + 1] == 'agent/check/pass/service:s'
+    # Blocking queries track the index
+    assert [call.request.params.get('index') for call in responses.calls
+            if 'catalog/node' in call.request.url][:3] == [None, '1', '2']
+    # The watch is stopped before deregistration
+    assert 'agent/service/register' not in calls[calls.index('agent/service/deregister/s'):]
+
+
+def test_subprocess_exit_detection(fake_consul):
+    """
+    Test ``announcer.service.Service`` detects subprocess termination immediately,
+    even if the next TTL check heartbeat is far away.
+
+    :param fake_consul: custom fixture to disable calls to Consul API
+    """
+    service = Service(
+        'localhost', '{"service": {"name": "s", "check": {"ttl": "10m"}}}', ['sleep', '0.2'],
+        None, None
+    )
+    start = time.time()
+    service.run()
+    assert service.process.poll() == 0
+    assert time.time() - start < 1
+
+
+@responses.activate
+def test_supervisor():
+    """
+    Test ``announcer.supervisor.Supervisor`` interaction with subprocesses and Consul:
+    services of each process are deregistered right after the process is finished.
+    """
+    api_url = 'http://localhost:1234/v1/agent/{}'
+    responses.add(responses.PUT, api_url.format('service/register'))
+    for service_id in ['Service%201', 'service-1.1', 'service-2', 'Service%203']:
+        responses.add(responses.GET, api_url.format('service/deregister/' + service_id))
+    responses.add(responses.GET, api_url.format('check/pass/service:Service%203'))
+    responses.add(responses.GET, api_url.format('check/pass/service:service-2:2'))
+
+    supervisor = Supervisor('localhost:1234', '@tests/config/manifest.json', interval=None)
+    supervisor.run()
+    for service in supervisor.processes:
+        assert service.process.poll() == 0
+
+    urls = [
+        call.request.url.replace(api_url.format(''), '').split('?')[0]
+        for call in responses.calls
+    ]
+    assert urls[:4] == ['service/register'] * 4
+    deregistered = [url for url in urls if url.startswith('service/deregister/')]
+    assert sorted(deregistered[:3]) == [
+        'service/deregister/Service%201',
+        'service/deregister/service-1.1',
+        'service/deregister/service-2'
+    ]
+    assert deregistered[3:] == ['service/deregister/Service%203']
+    # TTL checks are marked as passed right away
+    assert 'check/pass/service:service-2:2' in urls[4:6]
+    # Second process is still running after the first one is finished -
+    # its TTL check is marked as passed right away and then every 0.1 sec
+    heartbeats = [i for i, url in enumerate(urls) if url == 'check/pass/service:Service%203']
+    assert heartbeats[0] in (4, 5)
+    assert 4 <= len(heartbeats) <= 6
+    assert heartbeats[-1] > urls.index(deregistered[2])
+    assert urls[-1] == 'service/deregister/Service%203'
+    assert not supervisor.services
+
+
+@responses.activate
+def test_supervisor_restart(tmpdir):
+    """
+    Test ``announcer.supervisor.Supervisor`` restarts the failed process while the others
+    keep running; services of the restarted process are in maintenance mode meanwhile.
+
+    :param tmpdir: pytest fixture: temporary directory
+    """
+    api_url = 'http://localhost:1234/v1/agent/{}'
+    responses.add(responses.PUT, api_url.format('service/register'))
+    responses.add(responses.PUT, api_url.format('service/maintenance/a'))
+    for service_id in ['a', 'b']:
+        responses.add(responses.GET, api_url.format('service/deregister/' + service_id))
+    marker = tmpdir.join('started')
+    manifest = json.dumps({'processes': [
+        {
+            'cmd': ['sh', '-c', 'test -e {0} || {{ touch {0}; exit 1; }}'.format(marker)],
+            'config': {'service': {'name': 'a'}}
+        },
+        {'cmd': ['sleep', '0.8'], 'config': {'service': {'name': 'b'}}}
+    ]})
+
+    supervisor = Supervisor('localhost:1234', manifest, restart='on-failure')
+    for service in supervisor.processes:
+        service.restart_policy.min_delay = 0.2
+    supervisor.run()
+    assert [service.process.poll() for service in supervisor.processes] == [0, 0]
+
+    urls = [call.request.url.split('?')[0].replace(api_url.format(''), '')
+            for call in responses.calls]
+    assert urls[2:] == [
+        'service/maintenance/a', 'service/maintenance/a',
+        'service/deregister/a', 'service/deregister/b'
+    ]
+    assert not supervisor.services
+
+
+@responses.activate
+def test_supervisor_drain():
+    """
+    Test ``announcer.supervisor.Supervisor`` drains services of all the processes on SIGTERM.
+    """
+    api_url = 'http://localhost:1234/v1/agent/{}'
+    responses.add(responses.PUT, api_url.format('service/register'))
+    for service_id in ['a', 'b']:
+        responses.add(responses.PUT, api_url.format('service/maintenance/' + service_id))
+        responses.add(responses.GET, api_url.format('service/deregister/' + service_id))
+    manifest = json.dumps({'processes': [
+        {'cmd': ['sleep', '10'], 'config': {'service': {'name': 'a'}}},
+        {'cmd': ['sleep', '10'], 'config': {'service': {'name': 'b'}}}
+    ]})
+
+    supervisor = Supervisor('localhost:1234', manifest, drain=0.5)
+    timer = threading.Timer(0.2, os.kill, (os.getpid(), signal.SIGTERM))
+    timer.start()
+    start = time.time()
+    supervisor.run()
+    timer.join()
+    assert 0.7 <= time.time() - start < 2
+    assert [service.process.poll() for service in supervisor.processes] == [-signal.SIGTERM] * 2
+
+    urls = [call.request.url.split('?')[0].replace(api_url.format(''), '')
+            for call in responses.calls]
+    assert sorted(urls[2:4]) == ['service/maintenance/a', 'service/maintenance/b']
+    assert sorted(urls[4:]) == ['service/deregister/a', 'service/deregister/b']
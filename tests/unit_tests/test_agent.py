@@ -0,0 +1,210 @@
+"""
+Test ``announcer.agent`` (Consul agent client).
+"""
+import os
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+import requests
+from six.moves import BaseHTTPServer, socketserver
+
+from announcer.agent import Consul, DEFAULT_SOCKET_OPTIONS, map_ttl_checks, parse_agent_address
+from announcer.exceptions import AnnouncerImproperlyConfigured
+
+
+class FakeAgentHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """
+    Fake Consul agent: empty 200 response to any request, keep-alive connections.
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Length', '0')
+        if self.headers.get('Connection') == 'close':
+            # Like Consul agent does
+            self.send_header('Connection', 'close')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+def serve(server):
+    """
+    Run fake Consul agent server in a separate thread until the test is finished.
+
+    :param server: socket server
+    """
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+    thread.join()
+
+
+@pytest.fixture
+def fake_agent():
+    """
+    Fake Consul agent HTTP server running in a separate thread.
+    """
+    server_class = type(
+        'FakeAgent', (socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer), {}
+    )
+    for server in serve(server_class(('127.0.0.1', 0), FakeAgentHandler)):
+        yield server
+
+
+@pytest.fixture
+def fake_unix_agent(tmpdir):
+    """
+    Fake Consul agent HTTP server listening on a unix domain socket.
+    """
+    server_class = type(
+        'FakeUnixAgent', (socketserver.ThreadingMixIn, socketserver.UnixStreamServer), {}
+    )
+    path = str(tmpdir.join('consul.sock'))
+    for server in serve(server_class(path, FakeAgentHandler)):
+        yield server
+
+
+def test_agent_request_timeout(monkeypatch):
+    """
+    Test ``announcer.agent.Consul`` passes request timeout to every request.
+
+    :param monkeypatch: pytest "patching" fixture
+    """
+    requests_kwargs = []
+
+    def fake_request(session, method, url, **kwargs):
+        requests_kwargs.append(dict(kwargs, method=method, url=url))
+        response = requests.Response()
+        response.status_code = 200
+        response._content = b''
+        return response
+
+    monkeypatch.setattr(requests.Session, 'request', fake_request)
+
+    client = Consul('localhost', 1234, http_options={'timeout': 2.5})
+    assert client.agent.check.ttl_pass('check-1') is True
+    assert client.agent.service.deregister('service-1') is True
+
+    assert [(kw['method'], kw['url'], kw['timeout']) for kw in requests_kwargs] == [
+        ('GET', 'http://localhost:1234/v1/agent/check/pass/check-1', 2.5),
+        ('GET', 'http://localhost:1234/v1/agent/service/deregister/service-1', 2.5)
+    ]
+
+
+@pytest.mark.parametrize('keep_alive, stats', [
+    [True, {'new': 1, 'reused': 4}],
+    [False, {'new': 5, 'reused': 0}]
+], ids=['keep-alive', 'no keep-alive'])
+def test_agent_connections(keep_alive, stats, fake_agent):
+    """
+    Test ``announcer.agent.Consul`` connections reuse & stats.
+
+    :param keep_alive: custom test function parameter: reuse connections
+    :param stats: custom test function parameter: expected connections stats
+    :param fake_agent: custom fixture: fake Consul agent HTTP server
+    """
+    client = Consul('127.0.0.1', fake_agent.server_address[1], http_options={
+        'pool_size': 2, 'keep_alive': keep_alive
+    })
+    for i in range(5):
+        assert client.agent.check.ttl_pass('check') is True
+    assert client.http.connection_stats() == stats
+
+
+def test_agent_socket_options():
+    """
+    Test ``announcer.agent.Consul`` socket options: TCP_NODELAY & SO_KEEPALIVE by default.
+    """
+    assert (socket.IPPROTO_TCP, socket.TCP_NODELAY, 1) in DEFAULT_SOCKET_OPTIONS
+    assert (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1) in DEFAULT_SOCKET_OPTIONS
+
+    client = Consul('127.0.0.1', 1234)
+    pool_kw = client.http.adapter.poolmanager.connection_pool_kw
+    assert pool_kw['socket_options'] == DEFAULT_SOCKET_OPTIONS
+    assert pool_kw['maxsize'] == 10
+
+    options = [(socket.IPPROTO_TCP, socket.TCP_NODELAY, 0)]
+    client = Consul('127.0.0.1', 1234, http_options={'socket_options': options})
+    assert client.http.adapter.poolmanager.connection_pool_kw['socket_options'] == options
+
+
+@pytest.mark.parametrize('address, expected', [
+    ['localhost', ('localhost', 8500, None)],
+    ['1.2.3.4:8501', ('1.2.3.4', '8501', None)],
+    ['unix:/var/run/consul.sock', ('localhost', 8500, '/var/run/consul.sock')],
+    ['unix:///var/run/consul.sock', ('localhost', 8500, '/var/run/consul.sock')]
+], ids=['host', 'host & port', 'unix', 'unix URL'])
+def test_parse_agent_address(address, expected):
+    """
+    Test ``announcer.agent.parse_agent_address``.
+
+    :param address: custom test function parameter: agent address
+    :param expected: custom test function parameter: host, port & unix socket path
+    """
+    assert parse_agent_address(address) == expected
+
+
+def test_parse_agent_address_error():
+    """
+    Test ``announcer.agent.parse_agent_address`` fails without unix socket path.
+    """
+    with pytest.raises(AnnouncerImproperlyConfigured):
+        parse_agent_address('unix:')
+
+
+def test_agent_unix_socket(fake_unix_agent):
+    """
+    Test ``announcer.agent.Consul`` requests through a unix domain socket.
+
+    :param fake_unix_agent: custom fixture: fake Consul agent listening on a unix socket
+    """
+    path = fake_unix_agent.server_address
+    client = Consul('localhost', 8500, http_options={'unix_socket': path})
+    for i in range(3):
+        assert client.agent.check.ttl_pass('check') is True
+    assert client.agent.service.deregister('service') is True
+    assert client.http.connection_stats() == {'new': 1, 'reused': 3}
+
+    os.remove(path)
+    client = Consul('localhost', 8500, http_options={'unix_socket': path})
+    with pytest.raises(requests.exceptions.ConnectionError):
+        client.agent.check.ttl_pass('check')
+
+
+def test_map_ttl_checks():
+    """
+    Test ``announcer.agent.map_ttl_checks``: slow probes are executed by their own workers
+    and don't delay the other heartbeats, failed requests are False.
+    """
+    done = {}
+    start = time.time()
+
+    def pass_ttl_check(check_id):
+        if check_id.startswith('probe'):
+            time.sleep(0.3)
+        if check_id == 'failed':
+            raise requests.ConnectionError('refused')
+        done[check_id] = time.time() - start
+        return True
+
+    executor, probe_executor = ThreadPoolExecutor(max_workers=2), ThreadPoolExecutor(2)
+    check_ids = ['probe-1', 'a', 'probe-2', 'b', 'failed', 'c']
+    assert map_ttl_checks(
+        executor, probe_executor, pass_ttl_check, check_ids, {'probe-1', 'probe-2'}
+    ) == [True, True, True, True, False, True]
+    assert all(done[check_id] < 0.2 for check_id in 'abc')
+    assert 0.3 <= done['probe-2'] < 0.5
+
+    # No probes among the checks - the probe executor isn't needed
+    assert map_ttl_checks(executor, None, pass_ttl_check, ['a'], {'probe-1'}) == [True]
+    executor.shutdown()
+    probe_executor.shutdown()
@@ -0,0 +1,429 @@
+"""
+Test ``announcer.aio`` (asyncio engine).
+"""
+import asyncio
+import json
+import logging
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+
+import pytest
+from consul.base import CB
+
+from announcer.aio import AsyncService, HTTPClient
+
+
+@pytest.fixture
+def loop():
+    """
+    New asyncio event loop.
+    """
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
+
+
+@pytest.fixture
+def fake_agent():
+    """
+    Fake Consul agent: an asyncio HTTP server (running in a separate thread) that records
+    requests and responds with the next canned response.
+
+    Canned response is a tuple: (status line & headers, body, delay).
+    By default - empty 200 response with ``Content-Length`` header.
+    Requests whose path starts with a prefix from ``routes`` get its response instead
+    (e.g. heartbeats, which are concurrent with other requests).
+    """
+    agent = type('FakeAgent', (object,), {
+        'requests': [], 'responses': [], 'routes': {}, 'connections': []
+    })()
+
+    async def handle(reader, writer):
+        agent.connections.append(writer)
+        while True:
+            request_line = await reader.readline()
+            if not request_line:
+                break
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if not line.strip():
+                    break
+                name, value = line.decode().split(':', 1)
+                headers[name.strip().lower()] = value.strip()
+            body = await reader.readexactly(int(headers.get('content-length', 0)))
+            request = request_line.decode().split()[:2]
+            agent.requests.append((request, body.decode()))
+
+            routes = [response for prefix, response in agent.routes.items()
+                      if request[1].startswith(prefix)]
+            head, content, delay = routes[0] if routes else (
+                agent.responses.pop(0) if agent.responses
+                else ('HTTP/1.1 200 OK\r\nContent-Length: 0', '', 0)
+            )
+            await asyncio.sleep(delay)
+            writer.write('{}\r\n\r\n{}'.format(head, content).encode())
+            if 'Connection: close' in head:
+                break
+        writer.close()
+
+    agent_loop = asyncio.new_event_loop()
+    server = agent_loop.run_until_complete(asyncio.start_server(handle, '127.0.0.1', 0))
+    agent.port = server.sockets[0].getsockname()[1]
+    thread = threading.Thread(target=agent_loop.run_forever)
+    thread.start()
+    yield agent
+
+    async def stop():
+        server.close()
+        for writer in agent.connections:
+            writer.transport.abort()
+        await asyncio.sleep(0.01)
+        agent_loop.stop()
+
+    asyncio.run_coroutine_threadsafe(stop(), agent_loop)
+    thread.join()
+    agent_loop.close()
+
+
+def test_http_client_responses(loop, fake_agent):
+    """
+    Test ``announcer.aio.HTTPClient`` response parsing & connections reuse.
+    """
+    fake_agent.responses = [
+        ('HTTP/1.1 200 OK\r\nContent-Length: 2', '[]', 0),
+        ('HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked', '2\r\n[1\r\n1\r\n]\r\n0\r\n\r\n', 0),
+        ('HTTP/1.1 404 Not Found\r\nConnection: close', '', 0),
+        ('HTTP/1.1 200 OK\r\nContent-Length: 0', '', 0)
+    ]
+    client = HTTPClient('127.0.0.1', fake_agent.port)
+
+    assert loop.run_until_complete(client.get(CB.json(), '/v1/agent/checks')) == []
+    assert loop.run_until_complete(
+        client.put(CB.json(), '/v1/agent/services', params={'a': 'b c'}, data='{}')
+    ) == [1]
+    # Keep-alive connection is reused
+    assert len(fake_agent.connections) == 1
+    assert loop.run_until_complete(client.get(CB.bool(), '/v1/agent/self')) is False
+    # Connection is closed by the agent - a new one is used
+    assert loop.run_until_complete(client.get(CB.bool(), '/v1/agent/self')) is True
+    assert len(fake_agent.connections) == 2
+    client.close()
+
+    assert fake_agent.requests == [
+        (['GET', '/v1/agent/checks'], ''),
+        (['PUT', '/v1/agent/services?a=b+c'], '{}'),
+        (['GET', '/v1/agent/self'], ''),
+        (['GET', '/v1/agent/self'], '')
+    ]
+
+
+def test_http_client_timeout(loop, fake_agent):
+    """
+    Test ``announcer.aio.HTTPClient`` request timeout.
+    """
+    fake_agent.responses = [('HTTP/1.1 200 OK\r\nContent-Length: 0', '', 1)]
+    client = HTTPClient('127.0.0.1', fake_agent.port, timeout=0.1)
+    with pytest.raises(asyncio.TimeoutError):
+        loop.run_until_complete(client.get(CB.bool(), '/v1/agent/check/pass/check'))
+
+
+def test_http_client_unix_socket(loop, tmpdir):
+    """
+    Test ``announcer.aio.HTTPClient`` requests through a unix domain socket.
+    """
+    requests = []
+
+    async def handle(reader, writer):
+        while True:
+            request_line = await reader.readline()
+            if not request_line:
+                break
+            while (await reader.readline()).strip():
+                pass
+            requests.append(request_line.decode().split()[:2])
+            writer.write(b'HTTP/1.1 200 OK\r\nContent-Length: 0\r\n\r\n')
+        writer.close()
+
+    path = str(tmpdir.join('consul.sock'))
+    server = loop.run_until_complete(asyncio.start_unix_server(handle, path))
+    client = HTTPClient('localhost', 8500, unix_socket=path)
+    for i in range(2):
+        assert loop.run_until_complete(client.get(CB.bool(), '/v1/agent/check/pass/c')) is True
+    assert client.connection_stats() == {'new': 1, 'reused': 1}
+    client.close()
+    server.close()
+    loop.run_until_complete(server.wait_closed())
+
+    assert requests == [['GET', '/v1/agent/check/pass/c']] * 2
+
+
+def test_async_service(fake_agent, caplog):
+    """
+    Test ``announcer.aio.AsyncService`` lifecycle: register services, keep TTL checks alive
+    while the sub-process is running, deregister services.
+    """
+    caplog.set_level(logging.DEBUG, 'announcer')
+    config = json.dumps({'service': {'name': 's', 'checks': [{'ttl': '1s'}, {'ttl': '1s'}]}})
+    service = AsyncService(
+        '127.0.0.1:{}'.format(fake_agent.port), config, ['sleep', '0.35'], None, None
+    )
+    start = time.time()
+    service.run()
+    # Process termination is detected immediately
+    assert time.time() - start < 1
+    assert service.process.returncode == 0
+
+    requests = [request for request, body in fake_agent.requests]
+    assert requests[0] == ['PUT', '/v1/agent/service/register']
+    assert json.loads(fake_agent.requests[0][1]) == {'name': 's', 'checks': [{'ttl': '1s'}] * 2}
+    # TTL checks are marked as passed every 0.1 sec
+    assert 2 <= requests.count(['GET', '/v1/agent/check/pass/service:s:1']) <= 4
+    assert 2 <= requests.count(['GET', '/v1/agent/check/pass/service:s:2']) <= 4
+    assert requests[-1] == ['GET', '/v1/agent/service/deregister/s']
+    # Heartbeats share keep-alive connections
+    assert len(fake_agent.connections) <= 2
+    assert 'Updating TTL checks: "service:s:1" - passed, "service:s:2" - passed' in [
+        record.message for record in caplog.records
+    ]
+
+
+def test_async_service_subprocess(fake_agent, tmpdir, monkeypatch):
+    """
+    Test ``announcer.aio.AsyncService`` spawns a real command: the service event loop is
+    the current one while it runs (the child watcher is attached to it on Python < 3.8).
+    """
+    loops = []
+    invoke_process = AsyncService.invoke_process
+
+    async def fake_invoke_process(self):
+        loops.append(asyncio.get_event_loop_policy().get_event_loop())
+        await invoke_process(self)
+
+    monkeypatch.setattr(AsyncService, 'invoke_process', fake_invoke_process)
+    output = tmpdir.join('output')
+    service = AsyncService(
+        '127.0.0.1:{}'.format(fake_agent.port), '{"service": {"name": "s"}}',
+        ['sh', '-c', 'echo $$ > {}; exit 3'.format(output)], None, 10
+    )
+    service.run()
+    assert loops == [service.loop]
+    assert service.process.returncode == 3
+    assert output.read() == '{}\n'.format(service.process.pid)
+    assert service.loop.is_closed()
+
+
+def test_async_service_unreachable_agent(loop):
+    """
+    Test ``announcer.aio.AsyncService`` retries requests to unreachable Consul agent
+    and doesn't crash.
+    """
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    service = AsyncService('127.0.0.1:{}'.format(port), '{"service": {"name": "s"}}', ['...'])
+    assert loop.run_until_complete(service.map(service.register_service, ['s'])) == [False]
+    assert service.resilience.breaker.failures == 3
+    assert loop.run_until_complete(service.get_agent_services()) is None
+
+
+def test_async_service_restore_maintenance(loop, monkeypatch):
+    """
+    Test ``announcer.aio.AsyncService.restore_services``: maintenance mode of services lost
+    by Consul agent is restored, their TTL checks aren't passed.
+    """
+    requests = []
+
+    async def get_agent_services(self):
+        return {}
+
+    async def call_agent(self, operation, request, check_id=None):
+        requests.append((operation, request.args[1:] if operation == 'maintenance' else check_id))
+        return True
+
+    monkeypatch.setattr(AsyncService, 'get_agent_services', get_agent_services)
+    monkeypatch.setattr(AsyncService, 'call_agent', call_agent)
+    service = AsyncService(
+        'localhost', '{"service": {"name": "s", "check": {"ttl": "10s"}}}', ['...'], None, None
+    )
+    # Created by ``run_async`` in the service event loop
+    service.lock = asyncio.Lock()
+    loop.run_until_complete(service.drain_services())
+    del requests[:]
+    loop.run_until_complete(service.restore_services())
+    assert requests == [('register', None), ('maintenance', ('true', "The process is stopping"))]
+
+    loop.run_until_complete(service.activate_services())
+    del requests[:]
+    loop.run_until_complete(service.restore_services())
+    assert requests == [('register', None), ('heartbeat', 'service:s')]
+
+
+def test_async_service_health_socket(fake_agent, tmpdir):
+    """
+    Test ``announcer.aio.AsyncService`` sends TTL check status reported by the invoked process
+    to Consul agent.
+
+    :param tmpdir: pytest fixture: temporary directory
+    """
+    script = (
+        'import os, socket, time; '
+        's = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM); '
+        's.sendto(b"warn service:s slow", os.environ["CONSUL_ANNOUNCER_HEALTH_SOCKET"]); '
+        'time.sleep(0.2)'
+    )
+    config = json.dumps({'service': {'name': 's', 'check': {'ttl': '10s'}}})
+    service = AsyncService(
+        '127.0.0.1:{}'.format(fake_agent.port), config, [sys.executable, '-c', script], None, 1,
+        health_socket=str(tmpdir.join('health.sock'))
+    )
+    service.run()
+    assert service.process.returncode == 0
+    requests = [request for request, body in fake_agent.requests]
+    warning = requests.index(['GET', '/v1/agent/check/warn/service:s?note=slow'])
+    # The check is passed right after the registration, until the process reports otherwise
+    assert ['GET', '/v1/agent/check/pass/service:s'] not in requests[warning:]
+
+
+def test_async_service_restart(fake_agent, tmpdir):
+    """
+    Test ``announcer.aio.AsyncService`` restarts the failed process, its service is
+    in maintenance mode meanwhile.
+
+    :param tmpdir: pytest fixture: temporary directory
+    """
+    marker = tmpdir.join('started')
+    cmd = ['sh', '-c', 'test -e {0} || {{ touch {0}; exit 1; }}'.format(marker)]
+    service = AsyncService(
+        '127.0.0.1:{}'.format(fake_agent.port), '{"service": {"name": "s"}}', cmd,
+        restart='on-failure'
+    )
+    service.restart_policy.min_delay = 0.1
+    service.run()
+    assert service.process.returncode == 0
+    requests = [request for request, body in fake_agent.requests]
+    assert [method for method, uri in requests] == ['PUT', 'PUT', 'PUT', 'GET']
+    assert requests[1][1].startswith('/v1/agent/service/maintenance/s?enable=true&reason=')
+    assert requests[2][1] == '/v1/agent/service/maintenance/s?enable=false'
+
+
+def test_async_service_readiness(fake_agent, tmpdir):
+    """
+    Test ``announcer.aio.AsyncService`` keeps services in maintenance mode until the readiness
+    probe of the invoked process succeeds.
+
+    :param tmpdir: pytest fixture: temporary directory
+    """
+    marker = tmpdir.join('ready')
+    config = json.dumps({'service': {'name': 's', 'check': {'ttl': '100s'}}})
+    service = AsyncService(
+        '127.0.0.1:{}'.format(fake_agent.port), config,
+        ['sh', '-c', 'sleep 0.2; touch {}; sleep 1'.format(marker)], None, None,
+        ready='file:{}'.format(marker)
+    )
+    service.run()
+    assert service.process.returncode == 0
+    requests = [uri for (method, uri), body in fake_agent.requests]
+    assert requests == [
+        '/v1/agent/service/register',
+        '/v1/agent/service/maintenance/s?enable=true&reason=Waiting+for+the+process+to+be+ready',
+        '/v1/agent/check/pass/service:s',
+        '/v1/agent/service/maintenance/s?enable=false',
+        '/v1/agent/check/pass/service:s',
+        '/v1/agent/service/deregister/s'
+    ]
+
+
+def test_async_service_drain(fake_agent):
+    """
+    Test ``announcer.aio.AsyncService`` drains services on SIGTERM before passing it
+    to the invoked process.
+    """
+    service = AsyncService(
+        '127.0.0.1:{}'.format(fake_agent.port), '{"service": {"name": "s"}}', ['sleep', '10'],
+        drain=0.3
+    )
+    timer = threading.Timer(0.2, os.kill, (os.getpid(), signal.SIGTERM))
+    timer.start()
+    start = time.time()
+    service.run()
+    timer.join()
+    assert 0.5 <= time.time() - start < 2
+    assert service.process.returncode == -signal.SIGTERM
+    requests = [request for request, body in fake_agent.requests]
+    assert requests[1][1].startswith('/v1/agent/service/maintenance/s?enable=true&reason=')
+    assert requests[2:] == [['GET', '/v1/agent/service/deregister/s']]
+
+
+def test_async_service_registration_retry(fake_agent):
+    """
+    Test ``announcer.aio.AsyncService`` retries failed registrations from the poll loop
+    (the service has no TTL checks).
+    """
+    error = 'Agent is starting'
+    fake_agent.responses.extend([
+        ('HTTP/1.1 500 Internal Server Error\r\nContent-Length: {}'.format(len(error)), error, 0)
+    ] * 2)
+    service = AsyncService(
+        '127.0.0.1:{}'.format(fake_agent.port), '{"service": {"name": "s"}}', ['sleep', '0.6'],
+        None, 0.1
+    )
+    service.registration_retry = 0.2
+    service.run()
+    requests = [request for request, body in fake_agent.requests]
+    assert requests == [['PUT', '/v1/agent/service/register']] * 3 + [
+        ['GET', '/v1/agent/service/deregister/s']
+    ]
+    assert service.unregistered == set()
+
+
+def test_async_service_watch(fake_agent):
+    """
+    Test ``announcer.aio.AsyncService`` watches Consul agent state with blocking queries
+    and registers lost services again right away.
+    """
+    def response(content, index=None, delay=0):
+        head = 'HTTP/1.1 200 OK\r\nContent-Length: {}'.format(len(content))
+        if index is not None:
+            head += '\r\nX-Consul-Index: {}'.format(index)
+        return head, content, delay
+
+    fake_agent.routes['/v1/agent/check/pass/'] = response('')
+    fake_agent.responses.extend([
+        response(''),  # register
+        response('{"Config": {"NodeName": "node-1"}}'),
+        response('{}', index=5),
+        response('{}'),  # the agent has lost the service
+        response(''),  # register again
+        response('{}', index=5, delay=0.5)  # blocking query until cancelled
+    ])
+    config = json.dumps({'service': {'name': 's', 'check': {'ttl': '100s'}}})
+    service = AsyncService(
+        '127.0.0.1:{}'.format(fake_agent.port), config, ['sleep', '0.3'], None, None, watch=True
+    )
+    start = time.time()
+    service.run()
+    # The blocking query is cancelled right away
+    assert time.time() - start < 1
+    assert service.watch.index == 5
+    requests = [uri for (method, uri), body in fake_agent.requests]
+    # Heartbeats: right after the registration & after the service is registered again
+    heartbeats = [i for i, uri in enumerate(requests) if uri.startswith('/v1/agent/check/pass/')]
+    assert len(heartbeats) == 2
+    assert heartbeats[1] > requests.index('/v1/agent/services')
+    requests = [uri.split('?')[0] if 'index=' not in uri else uri
+                for i, uri in enumerate(requests) if i not in heartbeats]
+    assert requests[:6] == [
+        '/v1/agent/service/register',
+        '/v1/agent/self',
+        '/v1/catalog/node/node-1',
+        '/v1/agent/services',
+        '/v1/agent/service/register',
+        '/v1/catalog/node/node-1?index=5&wait=60s'
+    ]
+    assert requests[-1] == '/v1/agent/service/deregister/s'
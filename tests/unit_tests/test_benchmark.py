@@ -0,0 +1,65 @@
+"""
+Test ``announcer.benchmark`` (load benchmark harness).
+"""
+import json
+
+from announcer.benchmark import (
+    TickRecorder, format_header, format_result, make_config, measure_startup, percentile,
+    run_benchmark
+)
+
+
+def test_make_config():
+    """
+    Test ``announcer.benchmark.make_config`` splits TTL checks between services.
+    """
+    config = json.loads(make_config(25, checks_per_service=10, ttl='5s'))
+    assert [len(service['checks']) for service in config['services']] == [10, 10, 5]
+    assert len(set(service['name'] for service in config['services'])) == 3
+    assert config['services'][0]['checks'][0] == {'ttl': '5s'}
+
+
+def test_tick_recorder():
+    """
+    Test ``announcer.benchmark.TickRecorder`` records how late every tick is
+    and how many checks are due in it.
+    """
+    now = [0]
+    scheduler = TickRecorder(clock=lambda: now[0])
+    scheduler.add('a', 1, delay=1)
+    assert scheduler.pop_due() == []
+    now[0] = 1.25
+    assert scheduler.pop_due() == ['a']
+    assert scheduler.jitter == [0.25]
+    assert scheduler.bursts == [1]
+    assert percentile([3, 1, 2], 50) == 2
+    assert percentile([], 50) is None
+
+
+def test_run_benchmark():
+    """
+    Test ``announcer.benchmark.run_benchmark`` against the fake Consul agent.
+    """
+    result = run_benchmark(
+        4, duration=0.5, ttl='1s', checks_per_service=2,
+        agent_options={'latency': 0.001, 'error_rate': 0}
+    )
+    assert result['checks'] == 4
+    assert result['services'] == 2
+    assert result['errors'] == 0
+    # 4 checks are marked as passed right away and then every 0.1 sec
+    assert 20 <= result['heartbeats_per_sec'] <= 55
+    assert result['ticks'] >= 3
+    assert 1 <= result['max_burst'] <= 4
+    assert len(format_result(result)) == len(format_header())
+
+
+def test_measure_startup():
+    """
+    Test ``announcer.benchmark.measure_startup``: the CLI doesn't import the HTTP stack
+    before the announcer is created.
+    """
+    result = measure_startup(runs=1)
+    assert result['heavy_modules'] == []
+    assert result['modules'] > 0
+    assert result['help_sec'] > 0
@@ -0,0 +1,99 @@
+"""
+Test ``announcer.cache`` (services fingerprint & compiled config caches).
+"""
+import json
+
+import pytest
+from requests.structures import CaseInsensitiveDict
+
+from announcer.cache import ConfigCache, FingerprintCache
+from announcer.service import Service
+
+
+def test_fingerprint():
+    """
+    Test ``announcer.cache.FingerprintCache.fingerprint`` doesn't depend on the keys order.
+    """
+    fingerprint = FingerprintCache.fingerprint
+    conf = {'name': 's', 'tags': ['a'], 'check': {'ttl': '10s', 'notes': '...'}}
+    assert fingerprint(conf) == fingerprint(
+        {'check': {'notes': '...', 'ttl': '10s'}, 'tags': ['a'], 'name': 's'}
+    )
+    assert fingerprint(conf) == fingerprint(CaseInsensitiveDict(conf))
+    assert fingerprint(conf) != fingerprint(dict(conf, tags=['b']))
+
+
+def test_fingerprint_cache(tmpdir):
+    """
+    Test ``announcer.cache.FingerprintCache`` updates & persistence.
+
+    :param tmpdir: pytest fixture: temporary directory
+    """
+    path = tmpdir.join('cache.json')
+    conf = {'name': 's-1'}
+
+    cache = FingerprintCache(str(path))
+    assert not cache.is_fresh('s-1', conf)
+    cache.update('s-1', conf)
+    cache.update('s-2', {'name': 's-2'})
+    assert cache.is_fresh('s-1', conf)
+    assert not cache.is_fresh('s-1', {'name': 's-1', 'port': 80})
+    cache.discard('s-2')
+    cache.save()
+
+    cache = FingerprintCache(str(path))
+    assert cache.is_fresh('s-1', conf)
+    assert not cache.is_fresh('s-2', {'name': 's-2'})
+
+    # Journaled services aren't fresh until registered, but are known after restart
+    cache.journal(['s-1', 's-3'])
+    assert not cache.is_fresh('s-3', {'name': 's-3'})
+    cache = FingerprintCache(str(path))
+    assert cache.is_fresh('s-1', conf)
+    assert cache.orphans(['s-1', 's-2']) == ['s-3']
+
+    # Broken cache file is ignored
+    path.write('{')
+    assert FingerprintCache(str(path)).fingerprints == {}
+
+
+def test_config_cache(fake_service, tmpdir, monkeypatch):
+    """
+    Test ``announcer.cache.ConfigCache``: unchanged config is loaded compiled (not parsed),
+    changed config is parsed again.
+
+    :param fake_service: custom fixture to disable calls to Consul API and subprocess spawning
+    :param tmpdir: pytest fixture: temporary directory
+    :param monkeypatch: pytest "patching" fixture
+    """
+    path = str(tmpdir.join('config-cache.json'))
+    config = json.dumps({'services': [
+        {'Name': 's', 'check': {'TTL': '10s'}},
+        {'name': 'p', 'checks': [{'HTTP': 'http://localhost/', 'Interval': '5s'}]}
+    ]})
+    service = Service('localhost', config, ['...'], interval=None, probes=True,
+                      config_cache=path)
+    assert service.config is not None
+    payloads = dict(
+        (service_id, service.get_payload(service_id)) for service_id in service.services
+    )
+
+    monkeypatch.setattr(Service, 'parse_service', None)
+    cached = Service('localhost', config, ['...'], interval=None, probes=True, config_cache=path)
+    assert cached.config is None
+    assert cached.services == service.services
+    assert cached.ttl_checks == {'service:s': 10, 'service:p:1': 20}
+    assert cached.payloads == payloads
+    assert cached.probes['service:p:1'].target == 'http://localhost/'
+    assert cached.scheduler.intervals == {'service:s': 1, 'service:p:1': 5}
+
+    # Config cache depends on the options
+    with pytest.raises(TypeError):
+        Service('localhost', config, ['...'], interval=None, config_cache=path)
+    monkeypatch.undo()
+    changed = Service('localhost', config.replace('10s', '30s'), ['...'], interval=None,
+                      config_cache=path)
+    assert changed.config is not None
+    assert changed.ttl_checks == {'service:s': 30}
+    # Only the configs used by the process are kept
+    assert len(ConfigCache(path).entries) == 1
@@ -1,6 +1,7 @@
 """
 Test ``announcer.client`` (CLI).
 """
+import json
 import logging
 import sys
 
@@ -9,9 +10,11 @@ import requests
 from requests.exceptions import ConnectionError
 
 from announcer import root_logger, root_logging_handler
+from announcer.benchmark import run_python
 from announcer.client import main
 from announcer.exceptions import AnnouncerImproperlyConfigured
 from announcer.service import Service
+from announcer.supervisor import Supervisor
 
 
 # This fixture needs to be located in this file
@@ -24,10 +27,34 @@ def fake_service(monkeypatch):
     """
     monkeypatch.setattr(Service, '__init__', lambda *args, **kwargs: None)
     monkeypatch.setattr(Service, 'run', lambda self: None)
+    monkeypatch.setattr(Supervisor, '__init__', lambda *args, **kwargs: None)
+    monkeypatch.setattr(Supervisor, 'run', lambda self: None)
     monkeypatch.delenv('CONSUL_ANNOUNCER_CONFIG', False)
     monkeypatch.delenv('CONSUL_ANNOUNCER_AGENT', False)
     monkeypatch.delenv('CONSUL_ANNOUNCER_INTERVAL', False)
     monkeypatch.delenv('CONSUL_ANNOUNCER_TOKEN', False)
+    monkeypatch.delenv('CONSUL_ANNOUNCER_TTL_FACTOR', False)
+    monkeypatch.delenv('CONSUL_ANNOUNCER_WORKERS', False)
+    monkeypatch.delenv('CONSUL_ANNOUNCER_TIMEOUT', False)
+    monkeypatch.delenv('CONSUL_ANNOUNCER_RETRIES', False)
+    monkeypatch.delenv('CONSUL_ANNOUNCER_POOL_SIZE', False)
+    monkeypatch.delenv('CONSUL_ANNOUNCER_KEEP_ALIVE', False)
+    monkeypatch.delenv('CONSUL_ANNOUNCER_CACHE', False)
+    monkeypatch.delenv('CONSUL_ANNOUNCER_CONFIG_CACHE', False)
+    monkeypatch.delenv('CONSUL_ANNOUNCER_HEALTH_SOCKET', False)
+    monkeypatch.delenv('CONSUL_ANNOUNCER_PROBES', False)
+    monkeypatch.delenv('CONSUL_ANNOUNCER_READY', False)
+    monkeypatch.delenv('CONSUL_ANNOUNCER_LOAD', False)
+    monkeypatch.delenv('CONSUL_ANNOUNCER_RELOAD', False)
+    monkeypatch.delenv('CONSUL_ANNOUNCER_WATCH', False)
+    monkeypatch.delenv('CONSUL_ANNOUNCER_RESTART', False)
+    monkeypatch.delenv('CONSUL_ANNOUNCER_DRAIN', False)
+    monkeypatch.delenv('CONSUL_ANNOUNCER_METRICS', False)
+    monkeypatch.delenv('CONSUL_ANNOUNCER_PACING', False)
+    monkeypatch.delenv('CONSUL_ANNOUNCER_SPREAD', False)
+    monkeypatch.delenv('CONSUL_ANNOUNCER_METRICS_FILE', False)
+    monkeypatch.delenv('CONSUL_ANNOUNCER_ENGINE', False)
+    monkeypatch.delenv('CONSUL_ANNOUNCER_MANIFEST', False)
 
 
 @pytest.mark.parametrize('command', [
@@ -146,6 +173,393 @@ def test_client_interval_argument(monkeypatch):
     assert test_kwargs['interval'] == 6
 
 
+def test_client_ttl_factor_argument(monkeypatch):
+    """
+    Test client's ``--ttl-factor`` argument correctly passed or missing.
+
+    :param monkeypatch: pytest "patching" fixture
+    """
+    test_kwargs = {}
+    monkeypatch.setattr(Service, '__init__', lambda *args, **kwargs: test_kwargs.update(kwargs))
+
+    monkeypatch.setattr(sys, 'argv', 'consul-announcer --config=... -- ...'.split())
+    main()
+    assert test_kwargs['ttl_factor'] == 10
+
+    monkeypatch.setenv('CONSUL_ANNOUNCER_TTL_FACTOR', '4')
+    monkeypatch.setattr(sys, 'argv', 'consul-announcer --config=... -- ...'.split())
+    main()
+    assert test_kwargs['ttl_factor'] == 4
+
+    monkeypatch.setattr(sys, 'argv', 'consul-announcer --config=... --ttl-factor=3 -- ...'.split())
+    main()
+    assert test_kwargs['ttl_factor'] == 3
+
+
+@pytest.mark.parametrize('argument, env, default, value', [
+    ['workers', 'CONSUL_ANNOUNCER_WORKERS', 10, 4],
+    ['timeout', 'CONSUL_ANNOUNCER_TIMEOUT', 10, 2.5],
+    ['retries', 'CONSUL_ANNOUNCER_RETRIES', 2, 5]
+], ids=['workers', 'timeout', 'retries'])
+def test_client_agent_requests_arguments(argument, env, default, value, monkeypatch):
+    """
+    Test client's ``--workers``, ``--timeout`` and ``--retries`` arguments correctly passed
+    or missing.
+
+    :param argument: custom test function parameter: argument name
+    :param env: custom test function parameter: env variable name
+    :param default: custom test function parameter: argument default value
+    :param value: custom test function parameter: argument test value
+    :param monkeypatch: pytest "patching" fixture
+    """
+    test_kwargs = {}
+    monkeypatch.setattr(Service, '__init__', lambda *args, **kwargs: test_kwargs.update(kwargs))
+
+    monkeypatch.setattr(sys, 'argv', 'consul-announcer --config=... -- ...'.split())
+    main()
+    assert test_kwargs[argument] == default
+
+    monkeypatch.setenv(env, str(value))
+    main()
+    assert test_kwargs[argument] == value
+
+    monkeypatch.setattr(
+        sys, 'argv', 'consul-announcer --config=... --{}=1 -- ...'.format(argument).split()
+    )
+    main()
+    assert test_kwargs[argument] == 1
+
+
+def test_client_connection_arguments(monkeypatch):
+    """
+    Test client's ``--pool-size`` and ``--no-keep-alive`` arguments correctly passed or missing.
+
+    :param monkeypatch: pytest "patching" fixture
+    """
+    test_kwargs = {}
+    monkeypatch.setattr(Service, '__init__', lambda *args, **kwargs: test_kwargs.update(kwargs))
+
+    monkeypatch.setattr(sys, 'argv', 'consul-announcer --config=... -- ...'.split())
+    main()
+    assert test_kwargs['pool_size'] is None
+    assert test_kwargs['keep_alive'] is True
+
+    monkeypatch.setenv('CONSUL_ANNOUNCER_POOL_SIZE', '3')
+    monkeypatch.setenv('CONSUL_ANNOUNCER_KEEP_ALIVE', '0')
+    main()
+    assert test_kwargs['pool_size'] == 3
+    assert test_kwargs['keep_alive'] is False
+
+    monkeypatch.delenv('CONSUL_ANNOUNCER_KEEP_ALIVE')
+    monkeypatch.setattr(
+        sys, 'argv', 'consul-announcer --config=... --pool-size=1 --no-keep-alive -- ...'.split()
+    )
+    main()
+    assert test_kwargs['pool_size'] == 1
+    assert test_kwargs['keep_alive'] is False
+
+
+def test_client_pacing_argument(monkeypatch, capfd):
+    """
+    Test client's ``--pacing`` argument correctly passed or missing.
+
+    :param monkeypatch: pytest "patching" fixture
+    :param capfd: pytest fixture to capture command output
+    """
+    test_kwargs = {}
+    monkeypatch.setattr(Service, '__init__', lambda *args, **kwargs: test_kwargs.update(kwargs))
+
+    monkeypatch.setattr(sys, 'argv', 'consul-announcer --config=... -- ...'.split())
+    main()
+    assert test_kwargs['pacing'] == 'fixed'
+
+    monkeypatch.setenv('CONSUL_ANNOUNCER_PACING', 'adaptive')
+    main()
+    assert test_kwargs['pacing'] == 'adaptive'
+
+    monkeypatch.setattr(sys, 'argv', 'consul-announcer --config=... --pacing=fast -- ...'.split())
+    with pytest.raises(SystemExit):
+        main()
+    assert "invalid choice: 'fast'" in capfd.readouterr()[1]
+
+
+def test_client_spread_argument(monkeypatch):
+    """
+    Test client's ``--spread`` argument correctly passed or missing.
+
+    :param monkeypatch: pytest "patching" fixture
+    """
+    test_kwargs = {}
+    monkeypatch.setattr(Service, '__init__', lambda *args, **kwargs: test_kwargs.update(kwargs))
+
+    monkeypatch.setattr(sys, 'argv', 'consul-announcer --config=... -- ...'.split())
+    main()
+    assert test_kwargs['spread'] is False
+
+    monkeypatch.setenv('CONSUL_ANNOUNCER_SPREAD', '1')
+    main()
+    assert test_kwargs['spread'] is True
+
+    monkeypatch.setenv('CONSUL_ANNOUNCER_SPREAD', '0')
+    monkeypatch.setattr(sys, 'argv', 'consul-announcer --config=... --spread -- ...'.split())
+    main()
+    assert test_kwargs['spread'] is True
+
+
+def test_client_watch_argument(monkeypatch):
+    """
+    Test client's ``--watch`` argument correctly passed or missing.
+
+    :param monkeypatch: pytest "patching" fixture
+    """
+    test_kwargs = {}
+    monkeypatch.setattr(Service, '__init__', lambda *args, **kwargs: test_kwargs.update(kwargs))
+    monkeypatch.setattr(
+        Supervisor, '__init__', lambda *args, **kwargs: test_kwargs.update(kwargs)
+    )
+
+    monkeypatch.setattr(sys, 'argv', 'consul-announcer --config=... -- ...'.split())
+    main()
+    assert test_kwargs['watch'] is False
+
+    monkeypatch.setenv('CONSUL_ANNOUNCER_WATCH', 'yes')
+    main()
+    assert test_kwargs['watch'] is True
+
+    monkeypatch.delenv('CONSUL_ANNOUNCER_WATCH')
+    monkeypatch.setattr(sys, 'argv', 'consul-announcer --manifest=... --watch'.split())
+    main()
+    assert test_kwargs['watch'] is True
+
+
+def test_client_restart_argument(monkeypatch, capfd):
+    """
+    Test client's ``--restart`` argument correctly passed or missing.
+
+    :param monkeypatch: pytest "patching" fixture
+    :param capfd: pytest fixture to capture command output
+    """
+    test_kwargs = {}
+    monkeypatch.setattr(Service, '__init__', lambda *args, **kwargs: test_kwargs.update(kwargs))
+
+    monkeypatch.setattr(sys, 'argv', 'consul-announcer --config=... -- ...'.split())
+    main()
+    assert test_kwargs['restart'] == 'no'
+
+    monkeypatch.setenv('CONSUL_ANNOUNCER_RESTART', 'always')
+    main()
+    assert test_kwargs['restart'] == 'always'
+
+    monkeypatch.setattr(
+        sys, 'argv', 'consul-announcer --config=... --restart=on-failure -- ...'.split()
+    )
+    main()
+    assert test_kwargs['restart'] == 'on-failure'
+
+    monkeypatch.setattr(sys, 'argv', 'consul-announcer --config=... --restart=yes -- ...'.split())
+    with pytest.raises(SystemExit):
+        main()
+    assert "invalid choice: 'yes'" in capfd.readouterr()[1]
+
+
+def test_client_drain_argument(monkeypatch):
+    """
+    Test client's ``--drain`` argument correctly passed or missing.
+
+    :param monkeypatch: pytest "patching" fixture
+    """
+    test_kwargs = {}
+    monkeypatch.setattr(Service, '__init__', lambda *args, **kwargs: test_kwargs.update(kwargs))
+
+    monkeypatch.setattr(sys, 'argv', 'consul-announcer --config=... -- ...'.split())
+    main()
+    assert test_kwargs['drain'] == 0
+
+    monkeypatch.setenv('CONSUL_ANNOUNCER_DRAIN', '5')
+    main()
+    assert test_kwargs['drain'] == 5
+
+    monkeypatch.setattr(sys, 'argv', 'consul-announcer --config=... --drain=0.5 -- ...'.split())
+    main()
+    assert test_kwargs['drain'] == 0.5
+
+
+def test_client_ready_argument(monkeypatch, capfd):
+    """
+    Test client's ``--ready`` argument correctly passed or missing
+    (it can't be used in supervisor mode).
+
+    :param monkeypatch: pytest "patching" fixture
+    :param capfd: pytest fixture to capture command output
+    """
+    test_kwargs = {}
+    monkeypatch.setattr(Service, '__init__', lambda *args, **kwargs: test_kwargs.update(kwargs))
+
+    monkeypatch.setattr(sys, 'argv', 'consul-announcer --config=... -- ...'.split())
+    main()
+    assert test_kwargs['ready'] is None
+
+    monkeypatch.setenv('CONSUL_ANNOUNCER_READY', 'file:/tmp/ready')
+    main()
+    assert test_kwargs['ready'] == 'file:/tmp/ready'
+
+    monkeypatch.setattr(
+        sys, 'argv', 'consul-announcer --config=... --ready=tcp:localhost:80 -- ...'.split()
+    )
+    main()
+    assert test_kwargs['ready'] == 'tcp:localhost:80'
+
+    monkeypatch.setattr(sys, 'argv', 'consul-announcer --manifest=... --ready=health'.split())
+    with pytest.raises(SystemExit):
+        main()
+    assert "--ready can't be used with --manifest" in capfd.readouterr()[1]
+
+
+def test_client_load_argument(monkeypatch):
+    """
+    Test client's ``--load`` argument correctly passed or missing.
+
+    :param monkeypatch: pytest "patching" fixture
+    """
+    test_kwargs = {}
+    monkeypatch.setattr(Service, '__init__', lambda *args, **kwargs: test_kwargs.update(kwargs))
+    monkeypatch.setattr(
+        Supervisor, '__init__', lambda *args, **kwargs: test_kwargs.update(kwargs)
+    )
+
+    monkeypatch.setattr(sys, 'argv', 'consul-announcer --config=... -- ...'.split())
+    main()
+    assert test_kwargs['load'] is None
+
+    monkeypatch.setenv('CONSUL_ANNOUNCER_LOAD', 'cpu=90')
+    main()
+    assert test_kwargs['load'] == 'cpu=90'
+
+    monkeypatch.setattr(sys, 'argv', 'consul-announcer --manifest=... --load=rss=2G'.split())
+    main()
+    assert test_kwargs['load'] == 'rss=2G'
+
+
+def test_client_check_argument(monkeypatch, capfd, tmpdir):
+    """
+    Test client's ``--check`` argument: config is validated without initializing the service,
+    command isn't required nor run.
+
+    :param monkeypatch: pytest "patching" fixture
+    :param capfd: pytest fixture to capture command output
+    :param tmpdir: pytest fixture: temporary directory
+    """
+    def fail(*args, **kwargs):
+        pytest.fail("Service must not be initialized")
+
+    monkeypatch.setattr(Service, '__init__', fail)
+    monkeypatch.setattr(Supervisor, '__init__', fail)
+    config = tmpdir.join('config.json')
+    config.write(json.dumps({'services': [
+        {'name': 'a', 'check': {'ttl': '10s'}},
+        {'name': 'b', 'check': {'http': 'http://localhost/', 'interval': '10s'}}
+    ]}))
+
+    monkeypatch.setattr(sys, 'argv', ['consul-announcer', '--config=@' + str(config), '--check'])
+    main()
+    assert "Services config is valid: 2 services, 1 TTL checks" in capfd.readouterr()[0]
+
+    # HTTP & TCP checks are TTL checks with --probes
+    monkeypatch.setattr(sys, 'argv', (
+        'consul-announcer --config=@{} --probes --dry-run -- ...'.format(config)
+    ).split())
+    main()
+    assert "Services config is valid: 2 services, 2 TTL checks" in capfd.readouterr()[0]
+
+    manifest = json.dumps({'processes': [{'cmd': ['...'], 'config': '@{}'.format(config)}]})
+    monkeypatch.setattr(sys, 'argv', ['consul-announcer', '--manifest', manifest, '--check'])
+    main()
+    assert "Services config is valid: 2 services, 1 TTL checks" in capfd.readouterr()[0]
+
+    # Parsable by the announcer, but not valid for Consul
+    monkeypatch.setattr(
+        sys, 'argv', 'consul-announcer --config=@tests/config/correct.json --check'.split()
+    )
+    with pytest.raises(SystemExit) as e:
+        main()
+    assert e.value.code == 1
+
+
+def test_client_check_imports():
+    """
+    Test client's ``--check`` doesn't import the HTTP stack (the service isn't initialized).
+    """
+    argv = ['consul-announcer', '--check', '--config={"service": {"name": "s"}}']
+    modules = json.loads(run_python(
+        'import json, os, sys; sys.argv = {!r}; from announcer.client import main; '
+        'sys.stdout = open(os.devnull, "w"); main(); sys.stdout = sys.__stdout__; '
+        'print(json.dumps(sorted(sys.modules)))'.format(argv)
+    ))
+    assert [name for name in modules
+            if name.split('.')[0] in ('requests', 'urllib3', 'consul', 'concurrent')] == []
+    assert 'announcer.validation' in modules
+
+
+@pytest.mark.skipif(sys.version_info < (3, 5), reason="asyncio engine requires Python 3.5+")
+def test_client_engine_argument(monkeypatch):
+    """
+    Test client's ``--engine`` argument selects the service class.
+
+    :param monkeypatch: pytest "patching" fixture
+    """
+    from announcer.aio import AsyncService
+
+    engines = []
+    monkeypatch.setattr(Service, 'run', lambda self: engines.append('threads'))
+    monkeypatch.setattr(AsyncService, 'run', lambda self: engines.append('asyncio'))
+
+    monkeypatch.setattr(sys, 'argv', 'consul-announcer --config=... -- ...'.split())
+    main()
+    assert engines == ['threads']
+
+    monkeypatch.setenv('CONSUL_ANNOUNCER_ENGINE', 'asyncio')
+    main()
+    assert engines == ['threads', 'asyncio']
+
+    monkeypatch.setattr(
+        sys, 'argv', 'consul-announcer --config=... --engine=threads -- ...'.split()
+    )
+    main()
+    assert engines == ['threads', 'asyncio', 'threads']
+
+
+def test_client_manifest_argument(monkeypatch, capfd):
+    """
+    Test client's ``--manifest`` argument (supervisor mode): no ``--config`` and no command.
+
+    :param monkeypatch: pytest "patching" fixture
+    :param capfd: pytest fixture to capture command output
+    """
+    test_kwargs = {}
+    monkeypatch.setattr(
+        Supervisor, '__init__', lambda *args, **kwargs: test_kwargs.update(kwargs)
+    )
+
+    monkeypatch.setattr(sys, 'argv', 'consul-announcer --manifest=@manifest.json -v'.split())
+    main()
+    assert test_kwargs['manifest'] == '@manifest.json'
+    assert test_kwargs['agent_address'] == 'localhost'
+
+    monkeypatch.setenv('CONSUL_ANNOUNCER_MANIFEST', '@other.json')
+    monkeypatch.setattr(sys, 'argv', 'consul-announcer --agent=1.2.3.4'.split())
+    main()
+    assert test_kwargs['manifest'] == '@other.json'
+    assert test_kwargs['agent_address'] == '1.2.3.4'
+
+    # Command can't be specified in supervisor mode
+    monkeypatch.setattr(sys, 'argv', 'consul-announcer -- ...'.split())
+    with pytest.raises(SystemExit) as e:
+        main()
+    assert e.value.code == 2
+    out, err = capfd.readouterr()
+    assert "consul-announcer: error: command can't be used with --manifest" in err
+
+
 def test_client_token_argument(monkeypatch):
     """
     Test client's ``--token`` argument correctly passed or missing.
@@ -0,0 +1,99 @@
+"""
+Test ``announcer.health`` (health reports of the invoked process).
+"""
+import socket
+import threading
+
+import pytest
+
+from announcer.health import HealthSocket
+
+
+@pytest.fixture
+def health(tmpdir, clock):
+    """
+    Health socket with two TTL checks.
+
+    :param tmpdir: pytest fixture: temporary directory
+    :param clock: custom fixture: manually controlled clock
+    """
+    health = HealthSocket(str(tmpdir.join('health.sock')), clock)
+    health.add_check('a', 10)
+    health.add_check('b', 10)
+    yield health
+    health.stop()
+
+
+def send(path, *messages):
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    for message in messages:
+        client.sendto(message, path)
+    client.close()
+
+
+def test_health_reports(health):
+    """
+    Test ``announcer.health.HealthSocket`` parses reports and keeps the last one of every check.
+
+    :param health: custom fixture: health socket
+    """
+    assert health.status('a') == ('pass', None)
+    assert health.report(b'fail a database is down\n') == 'a'
+    assert health.status('a') == ('fail', 'database is down')
+    assert health.report(b'warn b') == 'b'
+    assert health.status('b') == ('warn', None)
+
+    # The process is warmed up (see ``announcer.readiness.ReadinessProbe``)
+    assert not health.ready
+    assert health.report(b'ready\n') is None
+    assert health.ready
+
+    for data in [b'', b'a', b'ok a', b'pass unknown']:
+        assert health.report(data) is None
+    assert health.status('a') == ('fail', 'database is down')
+
+    health.remove_check('a')
+    assert health.report(b'pass a') is None
+
+
+def test_health_silence(health):
+    """
+    Test ``announcer.health.HealthSocket`` fails a check that isn't reported for longer than TTL.
+
+    :param health: custom fixture: health socket
+    """
+    health.report(b'pass a')
+    health.clock.now = 10
+    assert health.status('a') == ('pass', None)
+    health.clock.now = 11
+    assert health.status('a') == ('fail', "No health report from the application for 11 sec")
+    # Never reported checks keep passing
+    assert health.status('b') == ('pass', None)
+
+
+def test_health_socket(health):
+    """
+    Test ``announcer.health.HealthSocket`` passes batches of reported checks to the listener.
+
+    :param health: custom fixture: health socket
+    """
+    health.bind()
+    send(health.path, b'pass a', b'fail b', b'warn a', b'garbage')
+    assert health.read() == ['a', 'b']
+    assert health.status('a') == ('warn', None)
+    assert health.read() == []
+    health.stop()
+
+    batches = []
+    received = threading.Event()
+
+    def listener(check_ids):
+        batches.append(check_ids)
+        received.set()
+
+    health.start(listener)
+    send(health.path, b'fail a')
+    assert received.wait(1)
+    assert batches == [['a']]
+    health.stop()
+    assert not health.thread.is_alive()
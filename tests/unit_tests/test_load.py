@@ -0,0 +1,109 @@
+"""
+Test ``announcer.load`` (load thresholds of the invoked process).
+"""
+import os
+import socket
+import sys
+
+import pytest
+
+from announcer.exceptions import AnnouncerImproperlyConfigured
+from announcer.load import LoadMonitor, parse_size
+from announcer.service import Service
+
+
+def test_load_thresholds():
+    """
+    Test ``announcer.load.LoadMonitor`` parses the thresholds.
+    """
+    assert parse_size('1024') == 1024
+    assert parse_size('512M') == 512 * 1024 ** 2
+    assert parse_size('2GiB') == 2 * 1024 ** 3
+    assert LoadMonitor('cpu=90, rss=1k,queue=100').thresholds == {
+        'cpu': 90, 'rss': 1024, 'queue': 100
+    }
+    for spec in ['', 'cpu', 'cpu=high', 'rss=1T', 'threads=10']:
+        with pytest.raises(AnnouncerImproperlyConfigured):
+            LoadMonitor(spec)
+
+
+def test_load_status(monkeypatch, clock):
+    """
+    Test ``announcer.load.LoadMonitor`` samples the process at most once per ``interval``,
+    reports overload as warning and recovers below ``recovery`` of the thresholds.
+
+    :param monkeypatch: pytest "patching" fixture
+    :param clock: custom fixture: manually controlled clock
+    """
+    load = LoadMonitor('cpu=50,rss=100M', clock)
+    samples = []
+    cpu_times = iter([0, 0.6, 1.1, 1.57, 1.9])
+    monkeypatch.setattr(load, 'read_cpu_time', lambda pid: samples.append(pid) or next(cpu_times))
+    monkeypatch.setattr(load, 'read_rss', lambda pid: 10 * 1024 ** 2)
+
+    # CPU usage is unknown until the second sample
+    assert load.status(1) == ('pass', None)
+    assert load.status(1) == ('pass', None)
+    assert samples == [1]
+    load.clock.now = 1
+    assert load.status(1) == ('warn', "Process is overloaded: CPU 60% >= 50%")
+    # Overloaded until CPU usage is below 90% of the threshold
+    load.clock.now = 2
+    assert load.status(1) == ('warn', "Process is overloaded: CPU 50% >= 45%")
+    load.clock.now = 3
+    assert load.status(1) == ('warn', "Process is overloaded: CPU 47% >= 45%")
+    load.clock.now = 4
+    assert load.status(1) == ('pass', None)
+    assert samples == [1] * 5
+
+    # A new process: CPU usage is unknown again, unreadable usage is not an overload
+    load.usage = {'cpu': 100}
+    monkeypatch.setattr(load, 'read_cpu_time', lambda pid: open('/nonexistent'))
+    assert load.status(2) == ('pass', None)
+
+
+@pytest.mark.skipif(not sys.platform.startswith('linux'), reason="/proc is required")
+def test_load_proc():
+    """
+    Test ``announcer.load.LoadMonitor`` reads CPU time, RSS & listen queue from ``/proc``.
+    """
+    load = LoadMonitor('cpu=100')
+    assert load.read_cpu_time(os.getpid()) > 0
+    assert load.read_rss(os.getpid()) > 1024 ** 2
+
+    server = socket.socket()
+    server.bind(('127.0.0.1', 0))
+    server.listen(5)
+    port = server.getsockname()[1]
+    clients = [socket.create_connection(('127.0.0.1', port)) for _ in range(2)]
+    # Connections aren't accepted yet
+    assert load.read_listen_queue([port]) == 2
+    assert load.read_listen_queue([port + 1]) == 0
+    for client in clients:
+        client.close()
+    server.close()
+
+
+def test_service_load(fake_service, monkeypatch):
+    """
+    Test ``announcer.service.Service`` reports passing TTL checks as warning while
+    the invoked process is overloaded.
+
+    :param fake_service: custom fixture to disable calls to Consul API and subprocess spawning
+    :param monkeypatch: pytest "patching" fixture
+    """
+    config = '{"service": {"name": "s", "Port": 8080, "check": {"ttl": "10s"}}}'
+    service = Service('localhost', config, ['...'], load='queue=10')
+    assert service.get_ports() == [8080]
+    assert service.get_check_status('service:s') == ('pass', None)
+
+    queues = []
+    monkeypatch.setattr(service.load, 'read_cpu_time', lambda pid: 0)
+    monkeypatch.setattr(
+        service.load, 'read_listen_queue', lambda ports: queues.append(ports) or 20
+    )
+    service.process = type('Process', (object,), {'pid': 1, 'poll': lambda self: 0})()
+    assert service.get_check_status('service:s') == (
+        'warn', "Process is overloaded: listen queue 20 >= 10"
+    )
+    assert queues == [[8080]]
@@ -0,0 +1,94 @@
+"""
+Test ``announcer.metrics`` (Prometheus metrics).
+"""
+import socket
+
+from six.moves import urllib
+
+from announcer.metrics import Histogram, Metrics, MetricsExporter
+
+
+def test_histogram():
+    """
+    Test ``announcer.metrics.Histogram`` counts observations cumulatively.
+    """
+    histogram = Histogram(buckets=(0.1, 1))
+    for value in (0.05, 0.5, 5):
+        histogram.observe(value)
+    assert histogram.render('h', 'a="b"') == [
+        'h_bucket{a="b",le="0.1"} 1',
+        'h_bucket{a="b",le="1"} 2',
+        'h_bucket{a="b",le="+Inf"} 3',
+        'h_sum{a="b"} 5.55',
+        'h_count{a="b"} 3'
+    ]
+
+
+def test_metrics():
+    """
+    Test ``announcer.metrics.Metrics`` records requests, TTL checks & processes.
+    """
+    metrics = Metrics()
+    metrics.add_check('service:s', 10)
+    metrics.add_check('service:"x"', 10)
+    metrics.observe('register', 0.02, True)
+    metrics.observe('heartbeat', 0.003, True, 'service:s')
+    metrics.observe('heartbeat', 0.5, False, 'service:s')
+    metrics.process_started(123)
+
+    lines = metrics.render().splitlines()
+    assert 'consul_announcer_agent_errors_total{operation="heartbeat"} 1' in lines
+    assert 'consul_announcer_agent_errors_total{operation="register"} 0' in lines
+    assert (
+        'consul_announcer_heartbeat_duration_seconds_bucket{check_id="service:s",le="0.005"} 1'
+    ) in lines
+    assert 'consul_announcer_heartbeat_duration_seconds_count{check_id="service:s"} 2' in lines
+    # Label values are escaped
+    assert 'consul_announcer_heartbeat_duration_seconds_count{check_id="service:\\"x\\""} 0' \
+        in lines
+    headroom = [line for line in lines if line.startswith('consul_announcer_ttl_headroom')]
+    # Only checks that were passed at least once
+    assert len(headroom) == 1
+    assert 9 < float(headroom[0].split()[-1]) <= 10
+    assert any(line.startswith('consul_announcer_process_uptime_seconds{pid="123"}')
+               for line in lines)
+
+    metrics.remove_check('service:s')
+    metrics.process_exited(123)
+    rendered = metrics.render()
+    assert 'check_id="service:s"' not in rendered
+    assert 'pid="123"' not in rendered
+
+
+def test_metrics_exporter(tmpdir):
+    """
+    Test ``announcer.metrics.MetricsExporter`` HTTP endpoint & metrics file.
+
+    :param tmpdir: pytest fixture: temporary directory
+    """
+    metrics = Metrics()
+    metrics.observe('register', 0.01, True)
+    path = tmpdir.join('announcer.prom')
+
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+
+    exporter = MetricsExporter(metrics, '127.0.0.1:{}'.format(port), str(path), interval=60)
+    exporter.start()
+    try:
+        response = urllib.request.urlopen('http://127.0.0.1:{}/metrics'.format(port))
+        assert response.read().decode('utf-8') == metrics.render()
+        assert response.headers['Content-Type'].startswith('text/plain; version=0.0.4')
+
+        exporter.export()
+        assert path.read() == metrics.render()
+        # File is not updated more often than ``interval``
+        metrics.observe('register', 0.01, False)
+        exporter.export()
+        assert path.read() != metrics.render()
+    finally:
+        exporter.stop()
+    # Final metrics are written on stop
+    assert path.read() == metrics.render()
@@ -0,0 +1,84 @@
+"""
+Test ``announcer.pacing`` (adaptive heartbeats pacing).
+"""
+import pytest
+
+from announcer.pacing import HeartbeatPacer
+from announcer.scheduler import HeartbeatScheduler
+
+
+def test_pacer_fast_agent(clock):
+    """
+    Test ``announcer.pacing.HeartbeatPacer`` refreshes checks rarely when the agent is fast.
+
+    :param clock: custom fixture: manually controlled clock
+    """
+    pacer = HeartbeatPacer(clock)
+    pacer.add('check', 30)
+    clock.now = 1
+    pacer.observe('check', 0.001, True)
+    # 3 more attempts fit into TTL, but not more than TTL / 2 between heartbeats
+    assert pacer.next_delay('check') == pytest.approx((30 - 0.004) / 3)
+
+    pacer.add('short', 1)
+    pacer.observe('short', 0.001, True)
+    assert pacer.next_delay('short') == pytest.approx((1 - 0.004) / 3)
+
+
+def test_pacer_headroom(clock):
+    """
+    Test ``announcer.pacing.HeartbeatPacer`` tightens heartbeats when the headroom shrinks.
+
+    :param clock: custom fixture: manually controlled clock
+    """
+    pacer = HeartbeatPacer(clock)
+    pacer.add('check', 10)
+    pacer.observe('check', 0.01, True)
+    delays = [pacer.next_delay('check')]
+    for i in range(3):
+        clock.now += delays[-1]
+        pacer.observe('check', 0.01, False)
+        delays.append(pacer.next_delay('check'))
+    assert delays == sorted(delays, reverse=True)
+    assert clock.now + delays[-1] < 10
+
+
+def test_pacer_overloaded_agent(clock):
+    """
+    Test ``announcer.pacing.HeartbeatPacer`` backs off when the agent is slow & failing.
+
+    :param clock: custom fixture: manually controlled clock
+    """
+    pacer = HeartbeatPacer(clock)
+    pacer.add('check', 10)
+    clock.now = 9
+    for i in range(5):
+        pacer.observe('check', 2, False)
+    # Headroom is almost exhausted, but the agent isn't hammered
+    assert pacer.next_delay('check') >= 4 * 2
+
+
+def test_pacer_reschedule(clock):
+    """
+    Test ``announcer.pacing.HeartbeatPacer.reschedule`` updates scheduler deadlines.
+
+    :param clock: custom fixture: manually controlled clock
+    """
+    scheduler = HeartbeatScheduler(clock)
+    pacer = HeartbeatPacer(clock)
+    for check_id in ['a', 'b']:
+        scheduler.add(check_id, 1)
+        pacer.add(check_id, 9)
+    pacer.add('removed', 9)
+
+    clock.now = 1
+    assert scheduler.pop_due() == ['a', 'b']
+    pacer.observe('a', 0, True)
+    pacer.observe('b', 0, True)
+    pacer.reschedule(scheduler, ['a', 'b', 'removed'])
+    assert scheduler.next_deadline() == 4
+    assert 'removed' not in scheduler
+
+    pacer.remove('a')
+    pacer.observe('a', 0, True)
+    assert 'a' not in pacer.checks
@@ -0,0 +1,154 @@
+"""
+Test ``announcer.probes`` (HTTP & TCP checks executed by the announcer).
+"""
+import socket
+import threading
+
+import pytest
+from requests.structures import CaseInsensitiveDict
+from six.moves import BaseHTTPServer
+
+from announcer.exceptions import AnnouncerImproperlyConfigured
+from announcer.probes import Probe, create_session
+from announcer.service import Service
+
+
+class StatusHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """
+    Respond with the status from the request path: ``/200``, ``/429``, etc.
+    ``/302`` redirects to ``/200``. Request bodies are recorded.
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.server.headers.append(self.headers.get('X-Probe'))
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            self.server.bodies.append(self.rfile.read(length).decode())
+        self.send_response(int(self.path.strip('/')))
+        if self.path == '/302':
+            self.send_header('Location', '/200')
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    do_POST = do_GET
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def http_server():
+    """
+    Local HTTP server (running in a separate thread).
+    """
+    server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), StatusHandler)
+    server.headers = []
+    server.bodies = []
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+    thread.join()
+
+
+def check(**kwargs):
+    return CaseInsensitiveDict(kwargs)
+
+
+def test_probe_config():
+    """
+    Test ``announcer.probes.Probe`` parses HTTP & TCP checks and converts them to TTL checks.
+    """
+    assert Probe.is_probe(check(HTTP='http://localhost/', Interval='10s'))
+    assert Probe.is_probe(check(tcp='localhost:22', interval='10s'))
+    assert not Probe.is_probe(check(ttl='10s'))
+    assert not Probe.is_probe(check(script='true', interval='10s'))
+
+    conf = check(
+        Name='web', HTTP='https://localhost/health', Interval='10s', Timeout='1s', Method='HEAD',
+        Header={'X-Probe': ['a', 'b']}, Body='{}', TLSSkipVerify=True, DisableRedirects=True,
+        TLSServerName='web', Notes='...'
+    )
+    probe = Probe(conf)
+    assert (probe.kind, probe.interval, probe.timeout) == ('http', 10, 1)
+    assert probe.method == 'HEAD'
+    assert probe.headers == {'X-Probe': 'a, b'}
+    assert probe.body == '{}'
+    assert probe.verify is False
+    assert probe.redirects is False
+    assert dict(probe.ttl_check(conf)) == {'Name': 'web', 'Notes': '...', 'ttl': '31.0s'}
+
+    # Timeout doesn't exceed interval
+    probe = Probe(check(tcp='localhost:22', interval='5s'))
+    assert (probe.kind, probe.timeout, probe.verify) == ('tcp', 5, True)
+
+    with pytest.raises(AnnouncerImproperlyConfigured):
+        Probe(check(tcp='localhost:22'))
+
+
+def test_http_probe(http_server):
+    """
+    Test ``announcer.probes.Probe`` HTTP status mapping: 2xx - pass, 429 - warn, else - fail.
+
+    :param http_server: custom fixture: local HTTP server
+    """
+    url = 'http://127.0.0.1:{}/{{}}'.format(http_server.server_address[1])
+    session = create_session(2)
+    for status, result in [(200, 'pass'), (204, 'pass'), (429, 'warn'), (503, 'fail')]:
+        probe = Probe(check(http=url.format(status), interval='1s', header={'X-Probe': ['1']}))
+        assert probe.run(session)[0] == result
+    assert http_server.headers == ['1'] * 4
+    assert probe.run(session)[1] == 'HTTP GET {}: 503 Service Unavailable'.format(
+        url.format(503)
+    )
+
+    # Redirects are followed (like in Consul) unless disabled
+    assert Probe(check(http=url.format(302), interval='1s')).run(session)[0] == 'pass'
+    probe = Probe(check(http=url.format(302), interval='1s', disable_redirects=True))
+    assert probe.run(session) == (
+        'fail', 'HTTP GET {}: 302 Found'.format(url.format(302))
+    )
+
+    # Request body is sent
+    probe = Probe(check(http=url.format(200), interval='1s', method='POST', body='{"a": 1}'))
+    assert probe.run(session)[0] == 'pass'
+    assert http_server.bodies == ['{"a": 1}']
+
+
+def test_tcp_probe():
+    """
+    Test ``announcer.probes.Probe`` TCP connection check.
+    """
+    server = socket.socket()
+    server.bind(('127.0.0.1', 0))
+    server.listen(1)
+    target = '127.0.0.1:{}'.format(server.getsockname()[1])
+    probe = Probe(check(tcp=target, interval='1s'))
+    assert probe.run(None) == ('pass', 'TCP connect {}: Success'.format(target))
+    server.close()
+    assert probe.run(None)[0] == 'fail'
+
+
+def test_service_probes(fake_service):
+    """
+    Test ``announcer.service.Service`` registers HTTP & TCP checks as TTL checks
+    and refreshes them every check interval when probes are enabled.
+
+    :param fake_service: custom fixture to disable calls to Consul API and subprocess spawning
+    """
+    config = '''{"service": {"name": "s", "checks": [
+        {"http": "http://localhost/", "interval": "2s"},
+        {"tcp": "localhost:22", "interval": "3s", "timeout": "1s"},
+        {"script": "true", "interval": "4s"}
+    ]}}'''
+    service = Service('localhost', config, ['...'])
+    assert service.ttl_checks == {}
+
+    service = Service('localhost', config, ['...'], None, None, probes=True)
+    assert sorted(service.probes) == ['service:s:1', 'service:s:2']
+    assert [dict(conf) for conf in service.services['s']['checks']] == [
+        {'ttl': '8.0s'}, {'ttl': '10.0s'}, {'script': 'true', 'interval': '4s'}
+    ]
+    assert service.scheduler.intervals == {'service:s:1': 2, 'service:s:2': 3}
@@ -0,0 +1,80 @@
+"""
+Test ``announcer.readiness`` (readiness probe of the invoked process).
+"""
+import socket
+
+import pytest
+
+from announcer.exceptions import AnnouncerImproperlyConfigured
+from announcer.health import HealthSocket
+from announcer.readiness import ReadinessProbe
+
+
+def test_readiness_spec(tmpdir):
+    """
+    Test ``announcer.readiness.ReadinessProbe`` parses the probe spec.
+
+    :param tmpdir: pytest fixture: temporary directory
+    """
+    health = HealthSocket(str(tmpdir.join('health.sock')))
+    for spec, kind, target in [
+        ('tcp:localhost:8080', 'tcp', 'localhost:8080'),
+        ('http://localhost/ready', 'http', 'http://localhost/ready'),
+        ('https://localhost/ready', 'http', 'https://localhost/ready'),
+        ('file:/tmp/ready', 'file', '/tmp/ready'),
+        ('health', 'health', '')
+    ]:
+        readiness = ReadinessProbe(spec, health)
+        assert (readiness.kind, readiness.target) == (kind, target)
+
+    for spec in ['tcp:', 'file:', 'health:x', 'ftp://localhost/', '/tmp/ready']:
+        with pytest.raises(AnnouncerImproperlyConfigured):
+            ReadinessProbe(spec, health)
+    with pytest.raises(AnnouncerImproperlyConfigured):
+        ReadinessProbe('health')
+
+
+def test_readiness_check(tmpdir, clock):
+    """
+    Test ``announcer.readiness.ReadinessProbe`` is due every ``interval`` until it succeeds
+    and starts over after reset.
+
+    :param tmpdir: pytest fixture: temporary directory
+    :param clock: custom fixture: manually controlled clock
+    """
+    marker = tmpdir.join('ready')
+    readiness = ReadinessProbe('file:{}'.format(marker), clock=clock)
+    assert readiness.is_due()
+    assert not readiness.check()
+    assert not readiness.is_due()
+    readiness.clock.now = 1
+    assert readiness.is_due()
+    marker.write('')
+    assert readiness.check()
+    readiness.clock.now = 5
+    assert not readiness.is_due()
+
+    readiness.reset()
+    assert readiness.is_due()
+
+    health = HealthSocket(str(tmpdir.join('health.sock')))
+    readiness = ReadinessProbe('health', health)
+    assert not readiness.check()
+    health.report(b'ready')
+    assert readiness.check()
+    # The restarted process must report again
+    readiness.reset()
+    assert not readiness.check()
+
+
+def test_readiness_tcp():
+    """
+    Test ``announcer.readiness.ReadinessProbe`` TCP probe succeeds when the port is connectable.
+    """
+    server = socket.socket()
+    server.bind(('127.0.0.1', 0))
+    readiness = ReadinessProbe('tcp:127.0.0.1:{}'.format(server.getsockname()[1]))
+    assert not readiness.check()
+    server.listen(1)
+    assert readiness.check()
+    server.close()
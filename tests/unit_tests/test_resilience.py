@@ -0,0 +1,130 @@
+"""
+Test ``announcer.resilience`` (retries & circuit breaker).
+"""
+import pytest
+from consul.base import ConsulException
+from requests.exceptions import ConnectionError
+
+from announcer.exceptions import AnnouncerAgentUnavailable
+from announcer.resilience import CircuitBreaker, Resilience
+
+
+class FlakyRequest(object):
+    """
+    Request that fails with ``error`` the first ``failures`` times.
+    """
+    def __init__(self, failures, error=ConnectionError):
+        self.failures = failures
+        self.error = error
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise self.error()
+        return True
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """
+    Record retry delays instead of sleeping.
+
+    :param monkeypatch: pytest "patching" fixture
+    """
+    delays = []
+    monkeypatch.setattr('announcer.resilience.time.sleep', delays.append)
+    return delays
+
+
+def test_circuit_breaker(clock):
+    """
+    Test ``announcer.resilience.CircuitBreaker`` state transitions.
+
+    :param clock: custom fixture: manually controlled clock
+    """
+    breaker = CircuitBreaker(clock)
+    for i in range(CircuitBreaker.failure_threshold - 1):
+        breaker.record(False)
+    breaker.record(True)
+    # Only consecutive failures open the circuit
+    for i in range(CircuitBreaker.failure_threshold - 1):
+        breaker.record(False)
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.check()
+
+    breaker.record(False)
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(AnnouncerAgentUnavailable):
+        breaker.check()
+
+    clock.now = CircuitBreaker.reset_timeout
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    breaker.check()
+    # The first failure after the timeout opens the circuit again
+    breaker.record(False)
+    assert breaker.state == CircuitBreaker.OPEN
+
+    clock.now += CircuitBreaker.reset_timeout
+    breaker.record(True)
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_retries(sleeps):
+    """
+    Test ``announcer.resilience.Resilience`` retries unreachable agent requests
+    with jittered exponential backoff.
+
+    :param sleeps: custom fixture: retry delays
+    """
+    resilience = Resilience(retries=2)
+    request = FlakyRequest(2)
+    assert resilience.call(request) is True
+    assert request.calls == 3
+    assert len(sleeps) == 2
+    assert 0 <= sleeps[0] <= Resilience.backoff
+    assert 0 <= sleeps[1] <= Resilience.backoff * 2
+
+    request = FlakyRequest(3)
+    with pytest.raises(ConnectionError):
+        resilience.call(request)
+    assert request.calls == 3
+
+    # The agent has responded - no retries
+    request = FlakyRequest(1, ConsulException)
+    with pytest.raises(ConsulException):
+        resilience.call(request)
+    assert request.calls == 1
+    assert resilience.breaker.failures == 0
+
+
+def test_backoff_cap():
+    """
+    Test ``announcer.resilience.Resilience`` retry delay doesn't exceed ``max_backoff``.
+    """
+    resilience = Resilience()
+    assert all(0 <= resilience.delay(20) <= Resilience.max_backoff for i in range(100))
+
+
+def test_open_circuit(sleeps, clock):
+    """
+    Test ``announcer.resilience.Resilience`` stops retrying once the circuit is open
+    and rejects requests until the reset timeout.
+
+    :param sleeps: custom fixture: retry delays
+    :param clock: custom fixture: manually controlled clock
+    """
+    resilience = Resilience(retries=10, breaker=CircuitBreaker(clock))
+    request = FlakyRequest(100)
+    with pytest.raises(ConnectionError):
+        resilience.call(request)
+    assert request.calls == CircuitBreaker.failure_threshold
+
+    with pytest.raises(AnnouncerAgentUnavailable):
+        resilience.call(request)
+    assert request.calls == CircuitBreaker.failure_threshold
+
+    # Agent is back
+    clock.now = CircuitBreaker.reset_timeout
+    assert resilience.call(FlakyRequest(0)) is True
+    assert resilience.breaker.state == CircuitBreaker.CLOSED
@@ -0,0 +1,30 @@
+"""
+Test ``announcer.restart`` (process restart policy).
+"""
+import pytest
+
+from announcer.restart import RestartPolicy
+
+
+@pytest.mark.parametrize('mode, returncode, expected', [
+    ('no', 1, False),
+    ('on-failure', 0, False),
+    ('on-failure', -15, True),
+    ('always', 0, True)
+])
+def test_restart_policy_mode(mode, returncode, expected):
+    """
+    Test ``announcer.restart.RestartPolicy`` decides whether to restart the process.
+    """
+    assert RestartPolicy(mode).should_restart(returncode) is expected
+
+
+def test_restart_policy_backoff():
+    """
+    Test ``announcer.restart.RestartPolicy`` delays restarts exponentially,
+    the backoff is reset after a long run.
+    """
+    policy = RestartPolicy('always')
+    assert [policy.next_delay(0.5) for _ in range(8)] == [1, 2, 4, 8, 16, 32, 60, 60]
+    assert policy.next_delay(60) == 1
+    assert policy.next_delay(1) == 2
@@ -0,0 +1,119 @@
+"""
+Test ``announcer.scheduler``.
+"""
+from announcer.scheduler import HeartbeatScheduler
+
+
+def test_scheduler_cadence(clock):
+    """
+    Test ``announcer.scheduler.HeartbeatScheduler`` refreshes every check on its own cadence.
+
+    :param clock: custom fixture: manually controlled clock
+    """
+    scheduler = HeartbeatScheduler(clock)
+    assert scheduler.next_deadline() is None
+    assert scheduler.pop_due() == []
+
+    scheduler.add('fast', 0.5)
+    scheduler.add('slow', 60)
+    assert len(scheduler) == 2
+    assert 'fast' in scheduler
+    # Checks are refreshed right away, then on their cadence
+    assert scheduler.next_deadline() == 0
+    assert scheduler.pop_due() == ['fast', 'slow']
+    assert scheduler.next_deadline() == 0.5
+
+    passes = {'fast': 0, 'slow': 0}
+    while clock.now < 120:
+        clock.now = scheduler.next_deadline()
+        for check_id in scheduler.pop_due():
+            passes[check_id] += 1
+
+    assert passes == {'fast': 240, 'slow': 2}
+
+
+def test_scheduler_delay(clock):
+    """
+    Test ``announcer.scheduler.HeartbeatScheduler`` first refresh delay & overdue checks.
+
+    :param clock: custom fixture: manually controlled clock
+    """
+    scheduler = HeartbeatScheduler(clock)
+    scheduler.add('check-1', 10, delay=0)
+    scheduler.add('check-2', 10, delay=3)
+    assert scheduler.pop_due() == ['check-1']
+    assert scheduler.next_deadline() == 3
+
+    # Both checks are overdue - the most overdue goes first, next refresh is counted from now
+    clock.now = 25
+    assert scheduler.pop_due() == ['check-2', 'check-1']
+    assert scheduler.next_deadline() == 35
+
+
+def test_scheduler_remove(clock):
+    """
+    Test ``announcer.scheduler.HeartbeatScheduler`` removed & re-added checks.
+
+    :param clock: custom fixture: manually controlled clock
+    """
+    scheduler = HeartbeatScheduler(clock)
+    scheduler.add('check-1', 1, delay=1)
+    scheduler.add('check-2', 5, delay=5)
+    scheduler.remove('check-1')
+    assert 'check-1' not in scheduler
+    assert scheduler.next_deadline() == 5
+
+    # Re-added check is refreshed only according to its new schedule
+    scheduler.add('check-2', 2, delay=2)
+    clock.now = 2
+    assert scheduler.pop_due() == ['check-2']
+    assert scheduler.next_deadline() == 4
+    clock.now = 5
+    assert scheduler.pop_due() == ['check-2']
+    assert scheduler.next_deadline() == 7
+
+    scheduler.remove('check-2')
+    assert scheduler.next_deadline() is None
+    assert len(scheduler) == 0
+
+
+def test_scheduler_spread(clock):
+    """
+    Test ``announcer.scheduler.HeartbeatScheduler`` spreads heartbeats: deterministic phases
+    within the interval, bounded jitter.
+
+    :param clock: custom fixture: manually controlled clock
+    """
+    scheduler = HeartbeatScheduler(clock, spread=True, seed='host:100')
+    for i in range(100):
+        scheduler.add('check-{}'.format(i), 10)
+    # The first refresh is right away (checks are critical after the registration)
+    assert set(scheduler.deadlines.values()) == {0}
+    assert len(scheduler.pop_due()) == 100
+    # The second one comes after the phase: checks are spread over the whole interval
+    deadlines = sorted(scheduler.deadlines.values())
+    assert 0 <= deadlines[0] and deadlines[-1] < 10
+    assert set(int(deadline) for deadline in deadlines) == set(range(10))
+
+    # Phases are the same for the same instance, different for other instances
+    assert HeartbeatScheduler(spread=True, seed='host:100').phase('check-1', 10) == \
+        scheduler.deadlines['check-1']
+    assert HeartbeatScheduler(spread=True, seed='host:101').phase('check-1', 10) != \
+        scheduler.deadlines['check-1']
+    assert HeartbeatScheduler().seed != HeartbeatScheduler(seed='other').seed
+
+    # Then the checks keep their phases, jitter only brings heartbeats forward
+    phases = dict(scheduler.deadlines)
+    deadlines = {}
+    for check_id, phase in sorted(phases.items(), key=lambda item: item[1]):
+        clock.now = phase
+        assert check_id in scheduler.pop_due()
+        deadlines[check_id] = scheduler.deadlines[check_id]
+    for check_id, deadline in deadlines.items():
+        assert phases[check_id] + 9 <= deadline <= phases[check_id] + 10
+    assert len(set(deadlines.values())) == 100
+
+    # Explicit delay isn't changed
+    clock.now = 10
+    scheduler.add('now', 10, delay=0)
+    assert scheduler.deadlines['now'] == 10
@@ -1,6 +1,10 @@
 """
 Test ``announcer.service.Service`` (without CLI).
 """
+import json
+import threading
+import time
+
 import pytest
 
 from announcer.exceptions import AnnouncerImproperlyConfigured
@@ -76,3 +80,175 @@ def test_interval_parsing(fake_service, caplog):
     log_record = caplog.records[-1]
     assert log_record.levelname == 'WARNING'
     assert log_record.message == 'Polling interval (20.0 sec) is greater than min TTL (15.0 sec)'
+
+
+def test_checks_scheduling(fake_service):
+    """
+    Test ``announcer.service.Service`` initialization - per-check heartbeat intervals.
+    """
+    config = '{"service": {"name": "s", "checks": [{"ttl": "5s"}, {"ttl": "10m"}]}}'
+
+    # Every check is refreshed on its own cadence
+    service = Service('localhost', config, ['...'], None, None)
+    assert service.scheduler.intervals == {'service:s:1': 0.5, 'service:s:2': 60}
+
+    service = Service('localhost', config, ['...'], None, None, 4)
+    assert service.scheduler.intervals == {'service:s:1': 1.25, 'service:s:2': 150}
+
+    # Interval is provided - it's used for all the checks
+    service = Service('localhost', config, ['...'], None, 2)
+    assert service.scheduler.intervals == {'service:s:1': 2, 'service:s:2': 2}
+    # Every check is passed right away, not an interval after the registration
+    now = service.scheduler.clock()
+    assert all(deadline <= now for deadline in service.scheduler.deadlines.values())
+    service = Service('localhost', config, ['...'], None, None)
+    assert sorted(service.scheduler.pop_due()) == ['service:s:1', 'service:s:2']
+
+    # Spread heartbeats: the first one of every check is right away too,
+    # the second one comes at its phase within the interval
+    service = Service('localhost', config, ['...'], None, 2, spread=True)
+    assert service.scheduler.spread
+    assert service.scheduler.intervals == {'service:s:1': 2, 'service:s:2': 2}
+    now = service.scheduler.clock()
+    assert all(deadline <= now for deadline in service.scheduler.deadlines.values())
+    assert sorted(service.scheduler.pop_due()) == ['service:s:1', 'service:s:2']
+    assert all(deadline < service.scheduler.clock() + 2
+               for deadline in service.scheduler.deadlines.values())
+
+
+def test_poll_timeout(tmpdir):
+    """
+    Test ``announcer.service.Service.get_poll_timeout``: no idle wake-ups between heartbeats,
+    bounded while a readiness probe or a registration retry is pending.
+
+    :param tmpdir: pytest fixture: temporary directory
+    """
+    service = Service('localhost', '{"service": {"name": "s"}}', ['...'], None, 10)
+    assert service.scheduler.next_deadline() is None
+    assert service.get_poll_timeout() is None
+
+    service = Service('localhost', '{"service": {"name": "s", "check": {"ttl": "60s"}}}',
+                      ['...'], None, None)
+    assert service.get_poll_timeout() == 0
+    service.scheduler.pop_due()
+    assert 5 < service.get_poll_timeout() <= 6
+
+    service.track_registration('s', False)
+    assert 4 < service.get_poll_timeout() <= 5
+
+    service = Service('localhost', '{"service": {"name": "s", "check": {"ttl": "60s"}}}',
+                      ['...'], None, None, ready='file:{}'.format(tmpdir.join('ready')))
+    service.scheduler.pop_due()
+    assert service.get_poll_timeout() == 0
+    service.readiness.check()
+    assert 0 < service.get_poll_timeout() <= service.readiness.interval
+
+
+@pytest.mark.parametrize('state, reason', [
+    ('active', None),
+    ('readiness', "Waiting for the process to be ready"),
+    ('draining', "The process is stopping"),
+    ('restarting', "Process exited with code 1, restarting in 2 sec")
+])
+def test_restore_services(monkeypatch, tmpdir, state, reason):
+    """
+    Test ``announcer.service.Service.restore_services``: services lost by Consul agent are
+    registered again, their maintenance mode is restored (while the process isn't ready,
+    is drained or restarted) - TTL checks are passed for active services only.
+
+    :param monkeypatch: pytest "patching" fixture
+    :param tmpdir: pytest fixture: temporary directory
+    :param str state: custom test function parameter: service state
+    :param reason: custom test function parameter: expected maintenance reason
+    """
+    requests = []
+    monkeypatch.setattr(Service, 'get_agent_services', lambda self: {})
+    monkeypatch.setattr(
+        Service, 'call_agent',
+        lambda self, operation, request, check_id=None: requests.append(
+            (operation, request.args[1:] if operation == 'maintenance' else check_id)
+        ) or True
+    )
+    service = Service(
+        'localhost', '{"service": {"name": "s", "check": {"ttl": "10s"}}}', ['...'], None, None,
+        ready='file:{}'.format(tmpdir.join('ready')) if state == 'readiness' else None
+    )
+    if state == 'readiness':
+        service.suspend_until_ready()
+    elif state == 'draining':
+        service.drain_services()
+    elif state == 'restarting':
+        service.process = type('FakeProcess', (object,), {'returncode': 1, 'poll': lambda s: 1})()
+        service.suspend_services(2)
+    del requests[:]
+
+    service.restore_services()
+    if reason is None:
+        assert requests == [('register', None), ('heartbeat', 'service:s')]
+    else:
+        assert requests == [('register', None), ('maintenance', ('true', reason))]
+
+    # Services are active again - nothing to restore
+    service.activate_services()
+    assert service.maintenance == {}
+
+
+def test_replay_registrations_serialized(monkeypatch):
+    """
+    Test ``announcer.service.Service.replay_registrations`` from the poll loop & the watch
+    at once: the second replay sees the service registered by the first one.
+
+    :param monkeypatch: pytest "patching" fixture
+    """
+    agent_services = {}
+    requests = []
+
+    def call_agent(self, operation, request, check_id=None):
+        time.sleep(0.1)
+        requests.append(operation)
+        agent_services['s'] = {}
+        return True
+
+    monkeypatch.setattr(Service, 'get_agent_services', lambda self: dict(agent_services))
+    monkeypatch.setattr(Service, 'call_agent', call_agent)
+    service = Service('localhost', '{"service": {"name": "s"}}', ['...'], None, 10)
+    threads = [threading.Thread(target=service.replay_registrations) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    assert requests == ['register']
+
+
+def test_config_reload(fake_service, tmpdir):
+    """
+    Test ``announcer.service.Service`` config reload: changed & removed services are detected,
+    TTL checks are rescheduled, broken config is ignored.
+
+    :param fake_service: custom fixture to disable calls to Consul API and subprocess spawning
+    :param tmpdir: pytest fixture: temporary directory
+    """
+    config = tmpdir.join('config.json')
+    config.write(json.dumps({'services': [
+        {'name': 'a', 'check': {'ttl': '10s'}},
+        {'name': 'b', 'tags': ['x']},
+        {'name': 'c'}
+    ]}))
+    service = Service('localhost', '@{}'.format(config), ['...'], None, None)
+    assert service.scheduler.intervals == {'service:a': 1}
+
+    config.write(json.dumps({'services': [
+        {'name': 'a', 'check': {'ttl': '20s'}},
+        {'name': 'b', 'tags': ['x']},
+        {'name': 'd'}
+    ]}))
+    assert service.reload_config() == (['a', 'd'], ['c'])
+    assert sorted(service.services) == ['a', 'b', 'd']
+    assert service.scheduler.intervals == {'service:a': 2}
+    # Checks are due right away
+    assert service.scheduler.pop_due() == ['service:a']
+
+    config.write('{"services": [{"tags": []}]}')
+    assert service.reload_config() is None
+    assert sorted(service.services) == ['a', 'b', 'd']
+    assert service.scheduler.intervals == {'service:a': 2}
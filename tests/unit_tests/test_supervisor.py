@@ -0,0 +1,122 @@
+"""
+Test ``announcer.supervisor.Supervisor`` (without CLI).
+"""
+import pytest
+
+from announcer.exceptions import AnnouncerImproperlyConfigured
+from announcer.service import Service
+from announcer.supervisor import Supervisor
+from announcer.utils import monotonic
+
+
+@pytest.mark.parametrize('manifest', [
+    '{"something": "unrelated"}',
+    '{"processes": []}',
+    '{"processes": ["sleep 1"]}',
+    '{"processes": [{"config": "@tests/config/correct.json"}]}',
+    '{"processes": [{"cmd": ["sleep", "1"]}]}',
+    '{"processes": [{"cmd": ["sleep", "1"], "config": "@tests/config/correct.json"},'
+    ' {"cmd": ["sleep", "1"], "config": {"service": {"name": "Service 1"}}}]}'
+], ids=[
+    'no "processes"',
+    'empty "processes"',
+    'process is not an object',
+    'no "cmd"',
+    'no "config"',
+    'service ID duplicate'
+])
+def test_manifest_parsing_errors(manifest):
+    """
+    Test ``announcer.supervisor.Supervisor`` initialization - manifest parsing errors.
+
+    :param str manifest: custom test function parameter: manifest JSON
+    """
+    with pytest.raises(AnnouncerImproperlyConfigured):
+        Supervisor('localhost', manifest)
+
+
+def test_manifest_parsing_success():
+    """
+    Test ``announcer.supervisor.Supervisor`` initialization - manifest parsing success.
+    """
+    supervisor = Supervisor('localhost', '@tests/config/manifest.json', interval=None)
+    assert len(supervisor.processes) == 2
+    assert sorted(supervisor.services) == ['Service 1', 'Service 3', 'service-1.1', 'service-2']
+    assert sorted(supervisor.ttl_checks) == ['service:Service 3', 'service:service-2:2']
+
+    # Consul agent client, workers & heartbeats scheduler are shared
+    for service in supervisor.processes:
+        assert service.consul is supervisor.consul
+        assert service.executor is supervisor.executor
+        assert service.scheduler is supervisor.scheduler
+    assert supervisor.scheduler.intervals == {
+        'service:Service 3': 0.1, 'service:service-2:2': 1.5
+    }
+
+
+def test_restore_services(monkeypatch):
+    """
+    Test ``announcer.supervisor.Supervisor.restore_services``: services lost by Consul agent
+    are registered again (for running processes only), their TTL checks are passed.
+    """
+    supervisor = Supervisor('localhost', '@tests/config/manifest.json', watch=True)
+    assert supervisor.watch.consul is not supervisor.consul
+    assert supervisor.watch.consul.http.timeout == supervisor.watch.timeout
+
+    registered = []
+    passed = []
+    monkeypatch.setattr(Service, 'get_agent_services', lambda self: {'Service 1': {}})
+    monkeypatch.setattr(
+        Service, 'register_service',
+        lambda self, service_id: registered.append(service_id) or True
+    )
+    monkeypatch.setattr(
+        Service, 'pass_ttl_check', lambda self, check_id: passed.append(check_id) or True
+    )
+    first, second = supervisor.processes
+    # The second process has finished: its services are deregistered
+    for service_id in second.services:
+        del supervisor.services[service_id]
+    for check_id in second.ttl_checks:
+        del supervisor.ttl_checks[check_id]
+
+    supervisor.restore_services()
+    assert sorted(registered) == sorted(set(first.services) - {'Service 1'})
+    assert sorted(passed) == sorted(first.ttl_checks)
+
+
+@pytest.mark.parametrize('state', ['restarting', 'draining'])
+def test_restore_services_maintenance(monkeypatch, state):
+    """
+    Test ``announcer.supervisor.Supervisor.restore_services``: maintenance mode of services
+    lost by Consul agent is restored (the process is restarted or drained),
+    their TTL checks aren't passed.
+
+    :param monkeypatch: pytest "patching" fixture
+    :param str state: custom test function parameter: supervisor state
+    """
+    supervisor = Supervisor('localhost', '@tests/config/manifest.json', drain=10)
+    requests = []
+    monkeypatch.setattr(Service, 'get_agent_services', lambda self: {})
+    monkeypatch.setattr(
+        Service, 'call_agent',
+        lambda self, operation, request, check_id=None: requests.append(
+            (operation, request.args[0] if operation == 'maintenance' else check_id)
+        ) or True
+    )
+    first, second = supervisor.processes
+    if state == 'restarting':
+        first.process = type('FakeProcess', (object,), {'returncode': 1, 'poll': lambda s: 1})()
+        first.suspend_services(2)
+        maintained = first.services
+    else:
+        supervisor.drain_deadline = monotonic() + supervisor.drain
+        supervisor.drain_processes()
+        maintained = supervisor.services
+    del requests[:]
+
+    supervisor.restore_services()
+    assert sorted(service_id for operation, service_id in requests
+                  if operation == 'maintenance') == sorted(maintained)
+    passed = [check_id for operation, check_id in requests if operation == 'heartbeat']
+    assert sorted(passed) == ([] if state == 'draining' else sorted(second.ttl_checks))
@@ -2,11 +2,15 @@
 """
 Test ``announcer.utils``.
 """
+import os
+import signal
+import threading
+import time
 from datetime import timedelta
 
 import pytest
 
-from announcer.utils import parse_duration
+from announcer.utils import Waker, parse_duration
 
 
 def test_parse_duration():
@@ -41,3 +45,37 @@ def test_parse_duration():
     assert parse_duration(u'85m 00s 631µs') == timedelta(minutes=85, microseconds=631)
     # Mix: negative value
     assert parse_duration('-25h 85m') == timedelta(days=-1, hours=-2, minutes=-25)
+
+
+def test_waker():
+    """
+    Test ``announcer.utils.Waker``: wake-ups from other threads & signal handlers,
+    pending wake-ups are not lost.
+    """
+    waker = Waker()
+    assert waker.wait(0.01) is False
+
+    # Woken up before waiting - returns right away, the wake-ups are consumed
+    waker.wake()
+    waker.wake()
+    assert waker.wait(1) is True
+    assert waker.wait(0) is False
+
+    timer = threading.Timer(0.1, waker.wake)
+    timer.start()
+    start = time.time()
+    assert waker.wait() is True
+    assert time.time() - start < 1
+    timer.join()
+
+    handler = signal.signal(signal.SIGUSR1, lambda *args: waker.wake())
+    try:
+        timer = threading.Timer(0.1, os.kill, (os.getpid(), signal.SIGUSR1))
+        timer.start()
+        start = time.time()
+        assert waker.wait(5) is True
+        assert time.time() - start < 1
+        timer.join()
+    finally:
+        signal.signal(signal.SIGUSR1, handler)
+    waker.close()
@@ -0,0 +1,123 @@
+"""
+Test ``announcer.validation`` (services config validation against Consul schema).
+"""
+import json
+
+import pytest
+from requests.structures import CaseInsensitiveDict
+
+from announcer.exceptions import AnnouncerImproperlyConfigured
+from announcer.validation import check_config, check_manifest, validate_service
+
+
+def parse(conf):
+    return json.loads(json.dumps(conf), object_hook=CaseInsensitiveDict)
+
+
+def test_valid_service():
+    """
+    Test ``announcer.validation.validate_service`` accepts Consul keys in any notation.
+    """
+    assert validate_service(parse({
+        'Name': 'web',
+        'ID': 'web-1',
+        'Tags': ['a'],
+        'Port': 80,
+        'Meta': {'version': '1'},
+        'EnableTagOverride': True,
+        'weights': {'passing': 10, 'warning': 1},
+        'check': {'ttl': '10s', 'DeregisterCriticalServiceAfter': '1m'},
+        'checks': [
+            {'http': 'http://localhost/', 'interval': '5s', 'header': {'X': ['1']}},
+            {'tcp': 'localhost:80', 'Interval': '5s', 'timeout': '1s'},
+            {'args': ['/bin/true'], 'interval': '1m', 'status': 'passing'}
+        ]
+    })) == []
+
+
+def test_invalid_service():
+    """
+    Test ``announcer.validation.validate_service`` reports all the errors.
+    """
+    assert sorted(validate_service(parse({
+        'port': '80',
+        'tags': 'a',
+        'something': 1,
+        'check': {'http': 'http://localhost/'},
+        'checks': [
+            {'ttl': '10 seconds'},
+            {'ttl': '10s', 'tcp': 'localhost:80'},
+            {'notes': '...'},
+            {'ttl': '10s', 'interval': '1s', 'status': 'ok'}
+        ]
+    }))) == sorted([
+        'Service "None": "port" must be an integer (0-65535), got \'80\'',
+        'Service "None": "tags" must be an array of strings, got \'a\'',
+        'Service "None": unknown field "something"',
+        'Service "None": "name" is required',
+        'Service "None" check: "interval" is required for "http" check',
+        'Service "None" check #1: "ttl" must be a duration, e.g. "10s", got \'10 seconds\'',
+        'Service "None" check #2: only one check type is allowed, got: tcp, ttl',
+        'Service "None" check #3: check type is not specified, use one of: alias_service, args, '
+        'grpc, h2ping, http, os_service, script, tcp, ttl, udp',
+        'Service "None" check #4: "status" must be one of: passing, warning, critical, got \'ok\'',
+        'Service "None" check #4: "interval" is not allowed for "ttl" check'
+    ])
+    assert validate_service([]) == ["Service must be an object, got []"]
+
+
+def test_check_config(tmpdir):
+    """
+    Test ``announcer.validation.check_config`` & ``check_manifest``: services config is
+    validated without initializing the service (keys are case-insensitive).
+
+    :param tmpdir: pytest fixture: temporary directory
+    """
+    config = {
+        'Service': {'Name': 'web', 'Check': {'TTL': '10s'}},
+        'services': [
+            {'name': 'api', 'ID': 'api-1', 'checks': [
+                {'http': 'http://localhost/', 'interval': '5s'}, {'ttl': '10s'}
+            ]}
+        ]
+    }
+    assert check_config(json.dumps(config)) == (
+        ['web', 'api-1'], ['service:web', 'service:api-1:2']
+    )
+    assert check_config(json.dumps(config), probes=True) == (
+        ['web', 'api-1'], ['service:web', 'service:api-1:1', 'service:api-1:2']
+    )
+    path = tmpdir.join('config.json')
+    path.write(json.dumps(config))
+    assert check_config('@{}'.format(path))[0] == ['web', 'api-1']
+
+    for invalid, error in [
+        ({}, 'Please specify either "service" config or non-empty "services" list'),
+        ({'services': {}}, '"services" must be an array'),
+        ({'services': [{'name': 'a', 'port': '80'}]}, '"port" must be an integer'),
+        ({'services': [{'name': 'a'}, {'name': 'a'}]}, 'Service ID "a" is duplicated')
+    ]:
+        with pytest.raises(AnnouncerImproperlyConfigured) as e:
+            check_config(json.dumps(invalid))
+        assert error in str(e.value)
+
+    manifest = {'processes': [
+        {'cmd': ['a'], 'config': '@{}'.format(path)},
+        {'cmd': ['b'], 'config': {'service': {'name': 'db', 'check': {'ttl': '1s'}}}}
+    ]}
+    assert check_manifest(json.dumps(manifest)) == (
+        ['web', 'api-1', 'db'], ['service:web', 'service:api-1:2', 'service:db']
+    )
+    manifest['processes'].append({'cmd': ['c'], 'config': {'service': {'name': 'db'}}})
+    with pytest.raises(AnnouncerImproperlyConfigured) as e:
+        check_manifest(json.dumps(manifest))
+    assert str(e.value) == 'Service ID "db" is duplicated'
+
+    for processes, error in [
+        (['x'], "Process must be an object, got 'x'"),
+        ([{'config': {}}], '"cmd" must be a non-empty array'),
+        ([{'cmd': ['a']}], '"config" is missing')
+    ]:
+        with pytest.raises(AnnouncerImproperlyConfigured) as e:
+            check_manifest(json.dumps({'processes': processes}))
+        assert error in str(e.value)
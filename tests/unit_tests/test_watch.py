@@ -0,0 +1,118 @@
+"""
+Test ``announcer.watch`` (Consul agent state watch).
+"""
+import threading
+
+from requests.exceptions import ConnectionError
+
+from announcer.watch import AgentWatch
+
+
+class FakeConsul(object):
+    """
+    Consul client that answers catalog queries with the next canned result
+    (an index or an exception) and records the query indexes. When there are no more
+    results, the query blocks until ``released``.
+    """
+    def __init__(self, results):
+        self.results = list(results)
+        self.queries = []
+        self.done = threading.Event()
+        self.released = threading.Event()
+        self.agent = self
+        self.catalog = self
+
+    def self(self):
+        return {'Config': {'NodeName': 'node-1'}}
+
+    def node(self, node, index=None, wait=None):
+        self.queries.append((node, index, wait))
+        if not self.results:
+            self.done.set()
+            self.released.wait()
+            return index, {}
+        result = self.results.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return result, {}
+
+
+def test_watch_index():
+    """
+    Test ``announcer.watch.AgentWatch`` index tracking: blocks on the last index,
+    resets it when it goes backwards.
+    """
+    watch = AgentWatch(FakeConsul([]))
+    watch.update('10')
+    assert watch.index == 10
+    watch.update('12')
+    assert watch.index == 12
+    watch.update('3')
+    assert watch.index is None
+    watch.update('0')
+    assert watch.index == 1
+
+
+def test_watch_serve():
+    """
+    Test ``announcer.watch.AgentWatch`` calls the listener after every query
+    and right after the agent is reachable again.
+    """
+    consul = FakeConsul(['5', '7', ConnectionError('refused'), ConnectionError('refused'), '2'])
+    watch = AgentWatch(consul)
+    watch.retry_delay = 0.01
+    calls = []
+    watch.start(lambda: calls.append(watch.index))
+    assert consul.done.wait(5)
+    watch.stop()
+    consul.released.set()
+    watch.thread.join(1)
+
+    assert consul.queries == [
+        ('node-1', None, '60s'),
+        ('node-1', 5, '60s'),
+        ('node-1', 7, '60s'),
+        # Agent was unreachable - the index is reset
+        ('node-1', None, '60s'),
+        ('node-1', None, '60s'),
+        ('node-1', 2, '60s')
+    ]
+    # Result of the query in progress is ignored after stop
+    assert calls == [5, 7, 2]
+
+
+def test_watch_stop_waits_for_listener():
+    """
+    Test ``announcer.watch.AgentWatch.stop`` waits for the listener being called
+    and the listener isn't called after that.
+    """
+    consul = FakeConsul(['5', '7'])
+    watch = AgentWatch(consul)
+    lock = threading.RLock()
+    entered = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def listener():
+        calls.append(watch.index)
+        entered.set()
+        release.wait(5)
+
+    watch.start(listener, lock)
+    assert entered.wait(5)
+    stopper = threading.Thread(target=watch.stop)
+    stopper.start()
+    stopper.join(0.1)
+    # The listener holds the lock - the watch isn't stopped yet
+    assert stopper.is_alive()
+    assert not watch.stopped.is_set()
+    release.set()
+    stopper.join(5)
+    assert watch.stopped.is_set()
+    stopped_calls = list(calls)
+    consul.released.set()
+    watch.thread.join(5)
+    assert not watch.thread.is_alive()
+    # The listener isn't called after stop
+    assert calls == stopped_calls
+    assert calls[0] == 5